@@ -0,0 +1,261 @@
+"""
+Admission control of the HTTP and gRPC servers: calls that the process can't
+serve in time are turned away at once (429 / RESOURCE_EXHAUSTED with a hint when
+to retry) instead of piling up until the clients time out.
+
+    concurrency limits  at most `limit` calls of a method run at a time, up to
+                        `queue_size` further calls wait for a slot in order
+    queue timeout       a call waits at most `queue_timeout` seconds for its
+                        slot, less if its deadline is closer
+    rate limits         a token bucket per client (rate per second, burst),
+                        keyed by a header / metadata value or the peer address
+
+All state is per process, so with several workers the limits apply to each of
+them.
+"""
+import asyncio
+import collections
+import math
+import threading
+import time
+from typing import Dict, Optional
+
+#a call that can't get a slot before its deadline is turned away this much earlier, so the client learns why
+DEADLINE_MARGIN = 0.05
+
+
+class Overloaded(Exception):
+    """
+    A call was not admitted.
+
+    Arguments:
+        reason: "rate_limited", "queue_full" or "queue_timeout"
+        retry_after: seconds after which the client should try again
+    """
+
+    def __init__(self, message: str, reason: str, retry_after: float):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+    def retry_after_header(self) -> str:
+        """The hint as a Retry-After value (whole seconds, at least 1)."""
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+def parse_limits(value: str) -> Dict[str, int]:
+    """
+    Parses a limit setting like "UploadJson=8, GetJson=64" into {method: limit}.
+
+    Raises:
+        ValueError: an entry is not method=number or the number is not positive
+    """
+    limits = {}
+    for entry in value.split(","):
+        if not entry.strip():
+            continue
+        method, _, limit = entry.partition("=")
+        if not method.strip() or not limit.strip().isdigit() or int(limit) < 1:
+            raise ValueError(f"Malformed concurrency limit '{entry.strip()}', expected method=number")
+        limits[method.strip()] = int(limit)
+    return limits
+
+
+class _Waiter:
+    """A call queued for a slot; granted is only changed with the lock of its ConcurrencyLimit held."""
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.granted = False
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+        self.event = threading.Event() if loop is None else None
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_wake, self.future)
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class ConcurrencyLimit:
+    """
+    At most limit calls at a time, with a FIFO queue of up to queue_size calls.
+    A released slot goes straight to the longest waiting call, so calls that
+    arrive later can't overtake it. Usable from threads and from asyncio.
+    """
+
+    def __init__(self, name: str, limit: int, queue_size: int, retry_after: float):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.retry_after = retry_after
+        self.active = 0
+        self._waiters = collections.deque()
+        self._lock = threading.Lock()
+
+    def _enter(self, loop: Optional[asyncio.AbstractEventLoop]) -> Optional[_Waiter]:
+        """Takes a free slot (None) or queues the call (its _Waiter)."""
+        with self._lock:
+            if self.active < self.limit and not self._waiters:
+                self.active += 1
+                return None
+            if len(self._waiters) >= self.queue_size:
+                raise Overloaded(
+                    f"{self.name}: {self.active} calls running and {len(self._waiters)} waiting",
+                    "queue_full", self.retry_after
+                )
+            waiter = _Waiter(loop)
+            self._waiters.append(waiter)
+            return waiter
+
+    def _withdraw(self, waiter: _Waiter) -> bool:
+        """Takes a waiting call out of the queue; False if it has been given a slot in the meantime."""
+        with self._lock:
+            if waiter.granted:
+                return False
+            self._waiters.remove(waiter)
+            return True
+
+    def _timed_out(self, waiter: _Waiter, timeout: float):
+        if self._withdraw(waiter):
+            raise Overloaded(f"{self.name}: no free slot within {timeout:.3f}s", "queue_timeout", self.retry_after)
+
+    def acquire(self, timeout: float):
+        """
+        Waits up to timeout seconds for a slot (blocking).
+
+        Raises:
+            Overloaded: the queue is full or no slot became free in time
+        """
+        waiter = self._enter(None)
+        if waiter is not None and not waiter.event.wait(max(0.0, timeout)):
+            self._timed_out(waiter, timeout)
+
+    async def acquire_async(self, timeout: float):
+        """acquire() for coroutines; a cancelled call gives up its place (or its slot)."""
+        waiter = self._enter(asyncio.get_running_loop())
+        if waiter is None:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), max(0.0, timeout))
+        except asyncio.TimeoutError:
+            self._timed_out(waiter, timeout)
+        except BaseException:
+            if not self._withdraw(waiter):
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            if not self._waiters:
+                self.active -= 1
+                return
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+        waiter.wake()
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class ClientRateLimiter:
+    """
+    A token bucket per client: rate calls per second on average, up to burst at once.
+    Only the max_clients most recently seen clients are tracked; a client that is
+    dropped starts again with a full bucket, which is what an idle client has anyway.
+    """
+
+    def __init__(self, rate: float, burst: int, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_clients = max_clients
+        self._buckets: "collections.OrderedDict[str, _Bucket]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, client: str):
+        """
+        Takes a token of client.
+
+        Raises:
+            Overloaded: the bucket is empty, retry_after is the time until the next token
+        """
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = _Bucket(self.burst, now)
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+                bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+                bucket.updated = now
+            if bucket.tokens >= 1:
+                bucket.tokens -= 1
+                return
+            wait = (1 - bucket.tokens) / self.rate
+        raise Overloaded(f"Rate limit of {self.rate:g}/s exceeded", "rate_limited", wait)
+
+
+class Admission:
+    """
+    Admission control of one server.
+
+    Arguments:
+        limits: concurrency limit by method name (methods without one are not limited)
+        queue_size: calls of a limited method that may wait for a slot
+        queue_timeout: longest wait for a slot in seconds
+        rate: calls per second and client, 0 for no rate limit
+        burst: calls a client may make at once
+        retry_after: hint in seconds for calls turned away because their method is busy
+    """
+
+    def __init__(self, limits: Dict[str, int], queue_size: int, queue_timeout: float, rate: float = 0,
+                 burst: int = 1, retry_after: float = 1.0):
+        self.limits = {method: ConcurrencyLimit(method, limit, queue_size, retry_after) for method, limit in limits.items()}
+        self.queue_timeout = queue_timeout
+        self.rate_limiter = ClientRateLimiter(rate, burst) if rate > 0 else None
+
+    def applies(self, method: Optional[str]) -> bool:
+        """Whether calls of method are checked at all."""
+        return self.rate_limiter is not None or method in self.limits
+
+    def _check_rate(self, client: Optional[str]):
+        if self.rate_limiter is not None and client is not None:
+            self.rate_limiter.take(client)
+
+    def _timeout(self, time_remaining: Optional[float]) -> float:
+        #a call whose deadline expires first would only take a slot to fail
+        return self.queue_timeout if time_remaining is None else min(self.queue_timeout, time_remaining - DEADLINE_MARGIN)
+
+    def admit(self, method: str, client: Optional[str], time_remaining: Optional[float] = None) -> Optional[ConcurrencyLimit]:
+        """
+        Admits a call (blocking); the returned limit has to be released when the call is over.
+
+        Raises:
+            Overloaded: the call is turned away
+        """
+        self._check_rate(client)
+        limit = self.limits.get(method)
+        if limit is not None:
+            limit.acquire(self._timeout(time_remaining))
+        return limit
+
+    async def admit_async(self, method: str, client: Optional[str],
+                          time_remaining: Optional[float] = None) -> Optional[ConcurrencyLimit]:
+        """admit() for coroutines."""
+        self._check_rate(client)
+        limit = self.limits.get(method)
+        if limit is not None:
+            await limit.acquire_async(self._timeout(time_remaining))
+        return limit
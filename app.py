@@ -1,34 +1,671 @@
+import asyncio
+import collections
+import functools
+import hashlib
+import logging
 import os
+import sys
+import tempfile
 import threading
+import time
 from concurrent import futures
-from io import BytesIO
-from typing import Tuple
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
 
-from flask import Flask, request, json, jsonify, Response
-from minio import Minio, S3Error
+from flask import Flask, g, request, json, jsonify, Response
+from werkzeug.exceptions import RequestEntityTooLarge
 import grpc
 import json_streaming_pb2
 import json_streaming_pb2_grpc
+import compression
+import json_pointer
+import metrics
+from admission import Admission, Overloaded, parse_limits
+from archive import ArchiveError, ArchiveWriter, read_archive
+from json_validation import InvalidDocument, JsonValidator, validate_json
+from metadata_index import MetadataIndex, ObjectDescription
+from object_cache import CachedObject, ObjectCache
+from single_flight import SingleFlight
+from storage import DIGEST_KEY, RESERVED_PREFIXES, ContentAddressedBackend, MultipartWriter, ObjectNotFound, \
+    StorageError, create_backend, is_reserved_name
+from structured_logging import configure_logging
+from upload_sessions import IncompleteUpload, SessionError, SessionNotFound, UploadSessions, is_session_object
+from write_behind import WriteBehindBackend
 app = Flask(__name__)
 
-MINIO_ENDPOINT = "minio-service:9000"
-MINIO_ACCESS_KEY = "minioadmin"
-MINIO_SECRET_KEY = "minioadmin"
-MINIO_BUCKET = "pcf-registry"
+#lowest level that is logged and the log format: "json" (one object per line) or "text"
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
 
-minio_client = Minio(
-    endpoint=MINIO_ENDPOINT,
-    access_key=MINIO_ACCESS_KEY,
-    secret_key=MINIO_SECRET_KEY,
-    secure=False
+configure_logging(LOG_LEVEL, LOG_FORMAT)
+logger = logging.getLogger("pcf_registry")
+
+#where objects are stored: "minio", "filesystem" (files below STORAGE_ROOT) or "memory"
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "minio")
+STORAGE_ROOT = os.environ.get("STORAGE_ROOT", "/var/lib/pcf-registry")
+#store identical documents only once, under their SHA-256 digest (names become pointers to them)
+CONTENT_ADDRESSED_STORAGE = os.environ.get("CONTENT_ADDRESSED_STORAGE", "false").lower() == "true"
+
+MINIO_ENDPOINT = os.environ.get("MINIO_ENDPOINT", "minio-service:9000")
+MINIO_ACCESS_KEY = os.environ.get("MINIO_ACCESS_KEY", "minioadmin")
+MINIO_SECRET_KEY = os.environ.get("MINIO_SECRET_KEY", "minioadmin")
+MINIO_BUCKET = os.environ.get("MINIO_BUCKET", "pcf-registry")
+
+#size of the multipart parts that gRPC uploads are streamed to the storage with (MinIO minimum is 5 MiB)
+UPLOAD_PART_SIZE = int(os.environ.get("UPLOAD_PART_SIZE", 8 * 1024 * 1024))
+#number of parts uploaded in parallel per stream; peak memory per upload is about (n + 1) * UPLOAD_PART_SIZE
+UPLOAD_PARALLEL_PARTS = int(os.environ.get("UPLOAD_PARALLEL_PARTS", 1))
+#resumable upload sessions: lifetime, default and largest part size (parts are held in memory while received)
+UPLOAD_SESSION_TTL_SECONDS = float(os.environ.get("UPLOAD_SESSION_TTL_SECONDS", 24 * 3600))
+UPLOAD_SESSION_PART_SIZE = int(os.environ.get("UPLOAD_SESSION_PART_SIZE", 16 * 1024 * 1024))
+UPLOAD_SESSION_MAX_PART_SIZE = int(os.environ.get("UPLOAD_SESSION_MAX_PART_SIZE", 64 * 1024 * 1024))
+#how often abandoned upload sessions are looked for and removed
+UPLOAD_SESSION_EXPIRY_INTERVAL = float(os.environ.get("UPLOAD_SESSION_EXPIRY_INTERVAL", 600))
+
+#ports of the HTTP and the gRPC server; every worker process binds GRPC_PORT with SO_REUSEPORT
+HTTP_PORT = int(os.environ.get("HTTP_PORT", 5002))
+GRPC_PORT = int(os.environ.get("GRPC_PORT", 50052))
+#seconds running requests and RPCs get to finish after SIGTERM
+SHUTDOWN_GRACE_SECONDS = float(os.environ.get("SHUTDOWN_GRACE_SECONDS", 30))
+
+#largest gRPC message the server sends or accepts
+GRPC_MAX_MESSAGE_LENGTH = int(os.environ.get("GRPC_MAX_MESSAGE_LENGTH", 4 * 1024 * 1024))
+#upper bound for RPCs handled at the same time by the gRPC server, further calls are rejected with RESOURCE_EXHAUSTED
+GRPC_MAX_CONCURRENT_RPCS = int(os.environ.get("GRPC_MAX_CONCURRENT_RPCS", 4096))
+#HTTP/2 streams a single client connection may have open at once
+GRPC_MAX_CONCURRENT_STREAMS = int(os.environ.get("GRPC_MAX_CONCURRENT_STREAMS", 1024))
+#server side keepalive pings and the shortest ping interval accepted from clients
+GRPC_KEEPALIVE_TIME_MS = int(os.environ.get("GRPC_KEEPALIVE_TIME_MS", 60 * 1000))
+GRPC_KEEPALIVE_TIMEOUT_MS = int(os.environ.get("GRPC_KEEPALIVE_TIMEOUT_MS", 20 * 1000))
+GRPC_KEEPALIVE_MIN_PING_INTERVAL_MS = int(os.environ.get("GRPC_KEEPALIVE_MIN_PING_INTERVAL_MS", 10 * 1000))
+#threads for blocking storage calls of the gRPC server (a stream only occupies one while a call is running)
+STORAGE_IO_WORKERS = int(os.environ.get("STORAGE_IO_WORKERS", 64))
+#size of the chunks GetJson streams, kept below the max message size (leaves room for the protobuf framing)
+GRPC_CHUNK_SIZE = max(1, min(int(os.environ.get("GRPC_CHUNK_SIZE", 256 * 1024)), GRPC_MAX_MESSAGE_LENGTH - 64))
+
+#admission control (admission.py): concurrency limits per gRPC method and per HTTP endpoint as "name=limit,...",
+#e.g. GRPC_CONCURRENCY_LIMITS="UploadJson=16,BatchUpload=4" and HTTP_CONCURRENCY_LIMITS="post_file=8";
+#methods without a limit only share the bounds above
+GRPC_CONCURRENCY_LIMITS = parse_limits(os.environ.get("GRPC_CONCURRENCY_LIMITS", ""))
+HTTP_CONCURRENCY_LIMITS = parse_limits(os.environ.get("HTTP_CONCURRENCY_LIMITS", ""))
+#calls of a limited method that may wait for a slot, and the longest wait in seconds (gRPC: at most until the deadline);
+#further calls get RESOURCE_EXHAUSTED / 429 with a retry hint of ADMISSION_RETRY_AFTER seconds
+ADMISSION_QUEUE_SIZE = int(os.environ.get("ADMISSION_QUEUE_SIZE", 64))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", 1))
+ADMISSION_RETRY_AFTER = float(os.environ.get("ADMISSION_RETRY_AFTER", 1))
+#token bucket per client and process: calls per second (0: no rate limit) and calls at once; clients are told apart by
+#the RATE_LIMIT_CLIENT_KEY header or gRPC metadata, and by their address if they don't send it
+RATE_LIMIT_PER_SECOND = float(os.environ.get("RATE_LIMIT_PER_SECOND", 0))
+RATE_LIMIT_BURST = int(os.environ.get("RATE_LIMIT_BURST", 20))
+RATE_LIMIT_CLIENT_KEY = os.environ.get("RATE_LIMIT_CLIENT_KEY", "x-client-id").lower()
+
+#connections to MinIO kept per process, by default one for every thread that can call the storage at once
+MINIO_POOL_SIZE = int(os.environ.get(
+    "MINIO_POOL_SIZE", STORAGE_IO_WORKERS + int(os.environ.get("HTTP_THREADS", 8))
+))
+#seconds to connect and to wait for the next bytes of a response
+MINIO_CONNECT_TIMEOUT = float(os.environ.get("MINIO_CONNECT_TIMEOUT", 5))
+MINIO_READ_TIMEOUT = float(os.environ.get("MINIO_READ_TIMEOUT", 60))
+#with MINIO_POOL_BLOCK=true requests wait (up to MINIO_POOL_TIMEOUT seconds) for a pooled connection
+#instead of opening extra ones, every open download stream holds a connection though
+MINIO_POOL_BLOCK = os.environ.get("MINIO_POOL_BLOCK", "false").lower() == "true"
+MINIO_POOL_TIMEOUT = float(os.environ.get("MINIO_POOL_TIMEOUT", 30))
+#attempts after the first one for idempotent requests, with jittered exponential backoff starting at MINIO_RETRY_BACKOFF
+MINIO_RETRIES = int(os.environ.get("MINIO_RETRIES", 3))
+MINIO_RETRY_BACKOFF = float(os.environ.get("MINIO_RETRY_BACKOFF", 0.1))
+MINIO_RETRY_BACKOFF_MAX = float(os.environ.get("MINIO_RETRY_BACKOFF_MAX", 5))
+
+#attempts to prepare the storage at startup (in the background), with exponential backoff between them;
+#requests get 503/UNAVAILABLE until it succeeded, and /live fails once all attempts failed
+STORAGE_INIT_ATTEMPTS = max(1, int(os.environ.get("STORAGE_INIT_ATTEMPTS", 10)))
+STORAGE_INIT_BACKOFF = float(os.environ.get("STORAGE_INIT_BACKOFF", 0.5))
+STORAGE_INIT_BACKOFF_MAX = float(os.environ.get("STORAGE_INIT_BACKOFF_MAX", 30))
+
+#write-behind mode: uploads and deletes are acknowledged once they are fsynced to a log in this local directory
+#and flushed to the storage in the background (reads see them right away); empty writes to the storage directly
+WRITE_BEHIND_DIR = os.environ.get("WRITE_BEHIND_DIR", "")
+#size at which a worker starts a new log segment; segments are deleted once all their writes are flushed
+WRITE_BEHIND_SEGMENT_BYTES = int(os.environ.get("WRITE_BEHIND_SEGMENT_BYTES", 64 * 1024 * 1024))
+#writes flushed per round, and how many of them at the same time
+WRITE_BEHIND_BATCH = int(os.environ.get("WRITE_BEHIND_BATCH", 256))
+WRITE_BEHIND_FLUSH_WORKERS = int(os.environ.get("WRITE_BEHIND_FLUSH_WORKERS", 8))
+#seconds between flush rounds while there is nothing to flush
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.environ.get("WRITE_BEHIND_FLUSH_INTERVAL", 0.5))
+#a round with failed writes is repeated after an exponential backoff
+WRITE_BEHIND_RETRY_BACKOFF = float(os.environ.get("WRITE_BEHIND_RETRY_BACKOFF", 0.5))
+WRITE_BEHIND_RETRY_BACKOFF_MAX = float(os.environ.get("WRITE_BEHIND_RETRY_BACKOFF_MAX", 30))
+
+#compression of stored objects: "" (off), "gzip" or "zstd" (needs the zstandard package)
+STORAGE_COMPRESSION = os.environ.get("STORAGE_COMPRESSION", "")
+STORAGE_COMPRESSION_LEVEL = int(os.environ.get("STORAGE_COMPRESSION_LEVEL", -1))
+#documents posted over HTTP that are smaller than this are stored uncompressed
+STORAGE_COMPRESSION_MIN_SIZE = int(os.environ.get("STORAGE_COMPRESSION_MIN_SIZE", 1024))
+#compression of gRPC download streams on the wire: "" (off), "gzip" or "deflate"
+GRPC_COMPRESSION = os.environ.get("GRPC_COMPRESSION", "")
+
+#seconds between full re-listings of the bucket into the metadata index (picks up writes of other replicas)
+NAME_INDEX_REFRESH_SECONDS = int(os.environ.get("NAME_INDEX_REFRESH_SECONDS", 300))
+#content addressed storage: seconds between collections of blobs no name points to anymore (0: only with
+#flask --app app collect-blobs), and the age a blob must have to be collected (so uploads running now keep theirs)
+BLOB_GC_INTERVAL_SECONDS = int(os.environ.get("BLOB_GC_INTERVAL_SECONDS", 86400))
+BLOB_GC_GRACE_SECONDS = int(os.environ.get("BLOB_GC_GRACE_SECONDS", 86400))
+#SQLite file of the metadata index behind the listing API, shared by the worker processes
+#(":memory:" keeps it per process, which is the default for the memory backend)
+METADATA_INDEX_PATH = os.environ.get(
+    "METADATA_INDEX_PATH",
+    ":memory:" if STORAGE_BACKEND == "memory" else os.path.join(tempfile.gettempdir(), "pcf-registry", "index.sqlite")
+)
+#page size of GET /pcf-registry if the client does not pass limit, and the largest one it may ask for
+LIST_DEFAULT_LIMIT = int(os.environ.get("LIST_DEFAULT_LIMIT", 100))
+LIST_MAX_LIMIT = int(os.environ.get("LIST_MAX_LIMIT", 1000))
+
+#concurrent reads of an object up to this size share one fetch from the storage; readers that come while it runs
+#get all of it from memory (0: every read fetches the object itself)
+SINGLE_FLIGHT_MAX_BYTES = int(os.environ.get("SINGLE_FLIGHT_MAX_BYTES", 16 * 1024 * 1024))
+
+#in-memory cache of recently read objects (CACHE_MAX_BYTES=0 disables it)
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", 256 * 1024 * 1024))
+CACHE_MAX_ENTRY_BYTES = int(os.environ.get("CACHE_MAX_ENTRY_BYTES", 8 * 1024 * 1024))
+CACHE_TTL_SECONDS = float(os.environ.get("CACHE_TTL_SECONDS", 300))
+
+#size of the blocks the HTTP GET streams objects with
+HTTP_CHUNK_SIZE = int(os.environ.get("HTTP_CHUNK_SIZE", 256 * 1024))
+
+#number of storage operations a single BatchGet/BatchUpload call runs concurrently
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", 16))
+
+#largest document (uncompressed bytes) accepted by the HTTP POST and UploadJson
+MAX_DOCUMENT_BYTES = int(os.environ.get("MAX_DOCUMENT_BYTES", 256 * 1024 * 1024))
+
+#GET /pcf-registry/_export: objects fetched ahead of the one being sent, and the largest stored object that is
+#fetched ahead into memory (larger ones are streamed from the storage when their turn comes)
+EXPORT_PREFETCH = max(1, int(os.environ.get("EXPORT_PREFETCH", 16)))
+EXPORT_PREFETCH_MAX_BYTES = int(os.environ.get("EXPORT_PREFETCH_MAX_BYTES", 4 * 1024 * 1024))
+#POST /pcf-registry/_import: documents stored at the same time, the largest archive accepted (0: no limit)
+#and the number of failed documents listed in the response
+IMPORT_CONCURRENCY = max(1, int(os.environ.get("IMPORT_CONCURRENCY", 16)))
+IMPORT_MAX_BYTES = int(os.environ.get("IMPORT_MAX_BYTES", 0))
+IMPORT_MAX_REPORTED_ERRORS = int(os.environ.get("IMPORT_MAX_REPORTED_ERRORS", 100))
+
+if STORAGE_COMPRESSION and not compression.available(STORAGE_COMPRESSION):
+    raise ValueError(f"STORAGE_COMPRESSION '{STORAGE_COMPRESSION}' is not available (zstd needs the zstandard package)")
+
+GRPC_COMPRESSION_ALGORITHMS = {"": None, "gzip": grpc.Compression.Gzip, "deflate": grpc.Compression.Deflate}
+
+storage = create_backend(
+    STORAGE_BACKEND,
+    content_addressed=CONTENT_ADDRESSED_STORAGE,
+    #upload session state and staging objects are temporary, they don't get a content addressed blob
+    passthrough=is_session_object,
+    observer=metrics.observe_storage,
+    pool_observer=metrics.StoragePoolMetrics(MINIO_POOL_SIZE) if STORAGE_BACKEND == "minio" else None,
+    minio_endpoint=MINIO_ENDPOINT,
+    minio_access_key=MINIO_ACCESS_KEY,
+    minio_secret_key=MINIO_SECRET_KEY,
+    minio_bucket=MINIO_BUCKET,
+    minio_pool_size=MINIO_POOL_SIZE,
+    minio_connect_timeout=MINIO_CONNECT_TIMEOUT,
+    minio_read_timeout=MINIO_READ_TIMEOUT,
+    minio_pool_block=MINIO_POOL_BLOCK,
+    minio_pool_timeout=MINIO_POOL_TIMEOUT,
+    minio_retries=MINIO_RETRIES,
+    minio_retry_backoff=MINIO_RETRY_BACKOFF,
+    minio_retry_backoff_max=MINIO_RETRY_BACKOFF_MAX,
+    storage_root=STORAGE_ROOT
 )
+#the blobs are collected below the write-behind log, which holds no blobs
+content_addressed_storage = storage if CONTENT_ADDRESSED_STORAGE else None
+if WRITE_BEHIND_DIR:
+    #upload session state is read by every replica, so it is not held back in the log
+    storage = WriteBehindBackend(storage, WRITE_BEHIND_DIR, WRITE_BEHIND_SEGMENT_BYTES, passthrough=is_session_object)
+
+
+class StorageInitializer:
+    """
+    Prepares the storage (creates the bucket or directories) on a background
+    thread, so importing the app never waits for MinIO. Failed attempts are
+    retried with exponential backoff; after the last one the initializer gives up
+    and the liveness check fails, so the pod gets restarted.
+    """
+
+    def __init__(self, backend, attempts: int, backoff: float, backoff_max: float):
+        self.backend = backend
+        self.attempts = attempts
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.error = None
+        self._done = threading.Event()
+        self._ready = False
+        self._thread = None
+
+    @property
+    def ready(self) -> bool:
+        return self._ready
+
+    @property
+    def failed(self) -> bool:
+        """True once all attempts failed."""
+        return self._done.is_set() and not self._ready
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="storage-init", daemon=True)
+        self._thread.start()
+
+    def wait(self, timeout: float = None) -> bool:
+        """Waits until the initialization succeeded or gave up; returns whether the storage is ready."""
+        self._done.wait(timeout)
+        return self._ready
+
+    def _run(self):
+        delay = self.backoff
+        for attempt in range(1, self.attempts + 1):
+            started_at = time.perf_counter()
+            try:
+                self.backend.ensure_ready()
+            except Exception as e:
+                self.error = e
+                logger.warning("Storage is not ready", extra={
+                    "backend": STORAGE_BACKEND, "attempt": attempt, "attempts": self.attempts, "error": str(e)
+                })
+                if attempt < self.attempts:
+                    time.sleep(delay)
+                    delay = min(delay * 2, self.backoff_max)
+                continue
+            self.error = None
+            self._ready = True
+            self._done.set()
+            logger.info("Storage is ready", extra={
+                "backend": STORAGE_BACKEND, "attempt": attempt, "seconds": round(time.perf_counter() - started_at, 3)
+            })
+            return
+        logger.error("Giving up on the storage", extra={"backend": STORAGE_BACKEND, "error": str(self.error)})
+        self._done.set()
+
+
+#create the bucket (or directories) if they don't exist yet, without blocking the import
+storage_init = StorageInitializer(storage, STORAGE_INIT_ATTEMPTS, STORAGE_INIT_BACKOFF, STORAGE_INIT_BACKOFF_MAX)
+storage_init.start()
+
+#name, size, digest, content type and timestamps of all objects, serves the listing API
+metadata_index = MetadataIndex(METADATA_INDEX_PATH)
+
+
+def document_digest(info) -> Optional[str]:
+    """SHA-256 of the document of a stored object, from its metadata or the metadata index; None if neither knows it."""
+    digest = info.metadata.get(DIGEST_KEY)
+    if digest:
+        return digest
+    indexed = metadata_index.get(info.name)
+    return indexed.digest if indexed is not None and indexed.etag == info.etag else None
+
+
+def describe_object(object_name: str):
+    """Metadata of a stored object for the metadata index, None if it does not exist (anymore)."""
+    try:
+        info = storage.stat(object_name)
+    except ObjectNotFound:
+        return None
+    return ObjectDescription(
+        identity_size_of(info.metadata) or info.size, document_digest(info), info.content_type, info.etag
+    )
+
+
+def reconcile_metadata_index() -> int:
+    """Rebuilds the metadata index from a full bucket listing and returns the number of objects listed."""
+    started_at = time.perf_counter()
+    listing = (info for info in storage.list() if not is_reserved_name(info.name))
+    #under content addressed storage the listing has the pointers, whose etag follows from the digest
+    listed_etag = ContentAddressedBackend.pointer_etag if CONTENT_ADDRESSED_STORAGE else None
+    listed = metadata_index.reconcile(listing, describe_object, listed_etag)
+    logger.info("Metadata index reconciled", extra={"objects": listed, "seconds": round(time.perf_counter() - started_at, 3)})
+    return listed
+
+
+def indexed_pointer_digest(info) -> Optional[str]:
+    """Digest a listed pointer refers to, if the metadata index records a document that has this pointer."""
+    indexed = metadata_index.get(info.name)
+    if indexed is None or not indexed.digest:
+        return None
+    return indexed.digest if ContentAddressedBackend.pointer_etag(indexed.digest) == info.etag else None
+
+
+def collect_blobs() -> int:
+    """Deletes the content addressed blobs no name points to anymore and returns their number."""
+    started_at = time.perf_counter()
+    deleted = content_addressed_storage.collect_garbage(BLOB_GC_GRACE_SECONDS, indexed_pointer_digest)
+    logger.info("Blobs collected", extra={"deleted": deleted, "seconds": round(time.perf_counter() - started_at, 3)})
+    return deleted
+
+
+def refresh_indexes():
+    """
+    Reconciles the metadata index with the bucket every NAME_INDEX_REFRESH_SECONDS.
+    Only one worker process reconciles the shared index per interval, the others skip it.
+    """
+    if not storage_init.wait():
+        return
+    while True:
+        try:
+            if metadata_index.claim_reconcile(NAME_INDEX_REFRESH_SECONDS / 2):
+                reconcile_metadata_index()
+                #right after a reconcile the index knows what most pointers refer to
+                if content_addressed_storage is not None and BLOB_GC_INTERVAL_SECONDS > 0 \
+                        and metadata_index.claim("blob_gc_started", BLOB_GC_INTERVAL_SECONDS):
+                    collect_blobs()
+        except Exception as e:
+            logger.error("Could not refresh the indexes", extra={"error": str(e)})
+        time.sleep(NAME_INDEX_REFRESH_SECONDS)
+
+
+threading.Thread(target=refresh_indexes, name="index-refresh", daemon=True).start()
+
+#resumable uploads, their state is kept in the storage so every worker can serve them
+upload_sessions = UploadSessions(
+    storage, UPLOAD_SESSION_TTL_SECONDS, MAX_DOCUMENT_BYTES, UPLOAD_SESSION_MAX_PART_SIZE,
+    encoding=STORAGE_COMPRESSION, level=STORAGE_COMPRESSION_LEVEL
+)
+
+
+def expire_upload_sessions():
+    """Removes abandoned upload sessions (and their parts) every UPLOAD_SESSION_EXPIRY_INTERVAL seconds."""
+    if not storage_init.wait():
+        return
+    while True:
+        try:
+            expired = upload_sessions.expire()
+            if expired:
+                logger.info("Expired upload sessions removed", extra={"sessions": expired})
+        except Exception as e:
+            logger.error("Could not expire upload sessions", extra={"error": str(e)})
+        time.sleep(UPLOAD_SESSION_EXPIRY_INTERVAL)
+
+
+threading.Thread(target=expire_upload_sessions, name="upload-session-expiry", daemon=True).start()
+
+
+def flush_write_behind_log():
+    """
+    Flushes the write-behind log to the storage. One worker process holds the flush
+    lock and does the flushing, the others check every WRITE_BEHIND_FLUSH_INTERVAL
+    whether they have to take over.
+    """
+    if not storage_init.wait():
+        return
+    backoff = WRITE_BEHIND_RETRY_BACKOFF
+    while True:
+        delay = WRITE_BEHIND_FLUSH_INTERVAL
+        try:
+            if storage.claim_flusher():
+                result = storage.flush(WRITE_BEHIND_BATCH, WRITE_BEHIND_FLUSH_WORKERS)
+                metrics.observe_write_behind(*result)
+                if result.failed:
+                    delay = backoff
+                    backoff = min(backoff * 2, WRITE_BEHIND_RETRY_BACKOFF_MAX)
+                    logger.warning("Writes could not be flushed", extra={"failed": result.failed, "pending": result.pending})
+                else:
+                    backoff = WRITE_BEHIND_RETRY_BACKOFF
+                    if result.flushed and result.pending:
+                        #a backlog: the next batch right away
+                        delay = 0
+        except Exception as e:
+            logger.error("Could not flush the write-behind log", extra={"error": str(e)})
+        time.sleep(delay)
+
+
+if WRITE_BEHIND_DIR:
+    threading.Thread(target=flush_write_behind_log, name="write-behind-flush", daemon=True).start()
+
+
+@app.cli.command("reconcile-index")
+def reconcile_index_command():
+    """Rebuilds the metadata index from the bucket now (flask --app app reconcile-index)."""
+    if not storage_init.wait():
+        raise RuntimeError(f"Storage is not available: {storage_init.error}")
+    reconcile_metadata_index()
+
+
+@app.cli.command("collect-blobs")
+def collect_blobs_command():
+    """Deletes the content addressed blobs no name points to anymore (flask --app app collect-blobs)."""
+    if content_addressed_storage is None:
+        raise RuntimeError("CONTENT_ADDRESSED_STORAGE is not enabled")
+    if not storage_init.wait():
+        raise RuntimeError(f"Storage is not available: {storage_init.error}")
+    collect_blobs()
+
+def unchanged_since(object_name: str, fetched_at: float) -> bool:
+    """
+    True if the metadata index (shared by all workers) has no write or delete of the object after fetched_at.
+    Objects the index doesn't know (yet) count as changed, a cache hit for them is fetched again.
+    """
+    try:
+        indexed = metadata_index.get(object_name)
+    except Exception as e:
+        logger.warning("Could not check the metadata index", extra={"object": object_name, "error": str(e)})
+        return False
+    return indexed is not None and indexed.updated_at < fetched_at
+
+
+#hot objects shared by get_file and GetJson; every hit is checked against the metadata index, so writes and deletes
+#of the other workers aren't hidden by the cache of this one
+object_cache = ObjectCache(CACHE_MAX_BYTES, CACHE_MAX_ENTRY_BYTES, CACHE_TTL_SECONDS, is_current=unchanged_since)
+
+
+def cache_fetched(object_name: str, info, data: bytes, ticket: float):
+    object_cache.put(object_name, CachedObject(data, info.etag, info.metadata.get(compression.ENCODING_KEY, "")), ticket)
+
+
+def indexed_size(object_name: str) -> Optional[int]:
+    """Size of the document from the metadata index, None if it isn't indexed (the fetch then stats the object)."""
+    try:
+        indexed = metadata_index.get(object_name)
+    except Exception:
+        return None
+    return indexed.size if indexed is not None else None
+
+
+#reads of the same object running at the same time share one fetch; the fetches have a pool of their own, so a
+#reader that waits for one on a storage_io thread never holds up the fetch itself
+object_reads = SingleFlight(
+    storage, futures.ThreadPoolExecutor(max_workers=STORAGE_IO_WORKERS, thread_name_prefix="object-fetch"),
+    SINGLE_FLIGHT_MAX_BYTES, HTTP_CHUNK_SIZE, ticket=object_cache.ticket, on_complete=cache_fetched,
+    size_hint=indexed_size
+)
+
+
+def record_write(object_name: str, size: int, digest: str, etag: str, content_type: str = "application/json"):
+    """Updates the cache and the metadata index after an object was (re)written."""
+    object_cache.invalidate(object_name)
+    object_reads.forget(object_name)
+    try:
+        metadata_index.record_write(object_name, size, digest, content_type, etag)
+    except Exception as e:
+        #the object is stored, the next reconcile adds it to the index
+        logger.warning("Could not update the metadata index", extra={"object": object_name, "error": str(e)})
+
+
+def record_delete(object_name: str):
+    """Updates the cache and the metadata index after an object was deleted."""
+    object_cache.invalidate(object_name)
+    object_reads.forget(object_name)
+    try:
+        metadata_index.record_delete(object_name)
+    except Exception as e:
+        logger.warning("Could not update the metadata index", extra={"object": object_name, "error": str(e)})
+
+
+def read_object(object_name: str) -> CachedObject:
+    """
+    Returns the whole object, from the cache if possible, otherwise from the storage
+    (caching the result); concurrent reads of the object share one fetch.
+    """
+    cached = object_cache.get(object_name)
+    if cached is not None:
+        return cached
+
+    ticket = object_cache.ticket()
+    flight = object_reads.fetch(object_name)
+    info = flight.wait()
+    if flight.shared:
+        #the fetch caches the object itself
+        return CachedObject(flight.data(), info.etag, info.metadata.get(compression.ENCODING_KEY, ""))
+
+    stream = storage.open(object_name)
+    with stream:
+        data = b"".join(stream.iter_chunks(HTTP_CHUNK_SIZE))
+    cached = CachedObject(data, stream.info.etag, stream.info.metadata.get(compression.ENCODING_KEY, ""))
+    object_cache.put(object_name, cached, ticket)
+    return cached
 
-#check if a bucket with the MINIO_BUCKET name already exists, if not create a new one
-if not minio_client.bucket_exists(MINIO_BUCKET):
-    minio_client.make_bucket(MINIO_BUCKET)
 
+def read_document(object_name: str) -> bytes:
+    """Returns the uncompressed JSON bytes of an object (see read_object)."""
+    cached = read_object(object_name)
+    return compression.decompress(cached.data, cached.encoding)
+
+
+def select_values(object_name: str, pointers: List[str]) -> bytes:
+    """
+    Evaluates JSON Pointers on an object while it is read and returns the result as JSON:
+    the selected value for one pointer, an object keyed by pointer for several.
+    Reading from the storage stops as soon as the last selected value is complete.
+    """
+    def decoded(stored, encoding):
+        #a small compressed chunk can expand a lot, the parser gets it in pieces so it can stop early
+        return compression.rechunk(compression.decode_chunks(stored, encoding), HTTP_CHUNK_SIZE)
+
+    cached = object_cache.get(object_name)
+    if cached is not None:
+        view = memoryview(cached.data)
+        stored = (view[offset:offset + HTTP_CHUNK_SIZE] for offset in range(0, len(view), HTTP_CHUNK_SIZE))
+        values = json_pointer.extract(decoded(stored, cached.encoding), pointers)
+    else:
+        with storage.open(object_name) as stream:
+            encoding = stream.info.metadata.get(compression.ENCODING_KEY, "")
+            values = json_pointer.extract(decoded(stream.iter_chunks(HTTP_CHUNK_SIZE), encoding), pointers)
+    return json.dumps(values[pointers[0]] if len(pointers) == 1 else values).encode()
+
+
+def document_size(info) -> int:
+    """
+    Size of the (uncompressed) document of a stored object. For a compressed object
+    without a recorded size the metadata index is asked, and if it does not know
+    this version of the object the document is decoded once to count it.
+    """
+    encoding = info.metadata.get(compression.ENCODING_KEY, "")
+    if not encoding:
+        return info.size
+    size = identity_size_of(info.metadata)
+    if size is not None:
+        return size
+    indexed = metadata_index.get(info.name)
+    if indexed is not None and indexed.etag == info.etag:
+        return indexed.size
+    with storage.open(info.name) as stream:
+        return sum(len(chunk) for chunk in compression.decode_chunks(stream.iter_chunks(HTTP_CHUNK_SIZE), encoding))
+
+
+def object_name_error(object_name: Optional[str]) -> Optional[str]:
+    """
+    Checks a name a client sent, for every HTTP route and RPC that reads or writes objects.
+    Returns why the name can't be used (missing, or reserved for the internal objects), None if it can.
+    """
+    if not object_name:
+        return "Missing object name"
+    if is_reserved_name(object_name):
+        return f"Object names starting with {', '.join(RESERVED_PREFIXES)} are reserved"
+    return None
+
+
+def store_object(object_name: str, json_bytes: bytes) -> str:
+    """
+    Stores a complete JSON document that is already in memory under the given name and returns its SHA-256 digest.
+    Raises InvalidDocument if the bytes are not well-formed JSON.
+    """
+    validate_json(json_bytes)
+    digest = hashlib.sha256(json_bytes).hexdigest()
+    size = len(json_bytes)
+    metadata = {DIGEST_KEY: digest}
+    if STORAGE_COMPRESSION and len(json_bytes) >= STORAGE_COMPRESSION_MIN_SIZE:
+        metadata[compression.ENCODING_KEY] = STORAGE_COMPRESSION
+        metadata[compression.IDENTITY_SIZE_KEY] = str(len(json_bytes))
+        json_bytes = compression.compress(json_bytes, STORAGE_COMPRESSION, STORAGE_COMPRESSION_LEVEL)
+    info = storage.put(object_name, json_bytes, content_type="application/json", metadata=metadata)
+    record_write(object_name, size, digest, info.etag)
+    return digest
+
+
+def stream_document(object_name: str, read, compress: bool, digest: Optional[str] = None):
+    """
+    Streams a JSON document that is read with read(size) to the storage (in UPLOAD_PART_SIZE
+    parts when it is large) and validates it on the way. The upload is aborted if anything fails.
+
+    Arguments:
+        compress: store the document with STORAGE_COMPRESSION
+        digest: hex SHA-256 the document must have, checked before the object becomes visible
+
+    Returns:
+        The committed writer (with the size and digest of the document) and the info of the stored
+        object, or None instead of the info if the document is empty (nothing is stored then)
+
+    Raises:
+        InvalidDocument: the document is not well-formed JSON or does not match digest
+        StorageError: the storage failed
+    """
+    writer = storage.writer(
+        object_name, UPLOAD_PART_SIZE,
+        encoding=STORAGE_COMPRESSION if compress else "", level=STORAGE_COMPRESSION_LEVEL
+    )
+    validator = JsonValidator()
+    try:
+        while True:
+            chunk = read(HTTP_CHUNK_SIZE)
+            if not chunk:
+                break
+            validator.feed(chunk)
+            for part_number, data in writer.feed(chunk):
+                if writer.upload_id is None:
+                    writer.start()
+                writer.upload_part(part_number, data)
+
+        if validator.size == 0:
+            writer.abort()
+            return writer, None
+        validator.close()
+        if digest and writer.digest != digest:
+            raise InvalidDocument(f"The document does not have the SHA-256 digest {digest}")
+        return writer, writer.commit()
+    except BaseException:
+        writer.abort()
+        raise
+
+
+# ------------------ gRPC Server implementation (upload, get, batch) #
+
+#blocking storage calls of the asyncio gRPC server run on this pool, the streams themselves don't hold a thread
+storage_io = futures.ThreadPoolExecutor(max_workers=STORAGE_IO_WORKERS, thread_name_prefix="storage-io")
+storage_io_monitor = metrics.PoolMonitor(storage_io, "storage_io")
+
+
+async def run_io(func, *args):
+    """Runs a blocking storage call on the storage_io pool and waits for it without blocking the event loop."""
+    return await asyncio.wrap_future(storage_io_monitor.submit(functools.partial(func, *args)))
+
+
+def set_call_compression(context):
+    """Compresses the responses of this call on the wire if GRPC_COMPRESSION is set (and the client supports it)."""
+    algorithm = GRPC_COMPRESSION_ALGORITHMS.get(GRPC_COMPRESSION)
+    if algorithm is not None:
+        context.set_compression(algorithm)
+
+
+#UploadJson chunks up to this size are validated on the event loop, larger ones on the storage_io pool
+VALIDATE_INLINE_BYTES = 64 * 1024
+
+
+class DocumentTooLarge(Exception):
+    """An upload grew beyond MAX_DOCUMENT_BYTES."""
 
-# ------------------ gRPC Server implementation (upload, get) -------#
 
 def get_filename_from_metadata(context):
     """Extracts filename from gRPC invocation metadata."""
@@ -37,189 +674,1114 @@ def get_filename_from_metadata(context):
             return value
     return None
 
+
 class JsonStreamingServicer(json_streaming_pb2_grpc.JsonStreamingServiceServicer):
-    """Implements the gRPC streaming service."""
+    """Implements the gRPC streaming service on top of grpc.aio."""
 
-    def UploadJson(self, request_iterator, context):
+    async def UploadJson(self, request_iterator, context):
         """
-        Handles client-streaming upload. The file is written to a temporary
-        location and then uploaded to MinIO.
+        Handles client-streaming upload. The incoming chunks are collected into
+        parts that are uploaded to the storage while the stream is still being received
+        (at most UPLOAD_PARALLEL_PARTS at a time). The next message is only read
+        once there is room for it, so a slow storage slows the client down instead
+        of growing the buffer. The object is committed when the client half-closes.
         """
         filename = get_filename_from_metadata(context)
-        if not filename:
+        name_error = object_name_error(filename)
+        if name_error is not None:
             context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
-            context.set_details("Filename must be provided in metadata.")
-            return json_streaming_pb2.UploadResponse(success=False, message="Missing filename.")
+            context.set_details(name_error)
+            return json_streaming_pb2.UploadResponse(success=False, message=name_error)
 
-        print("hallllloooo")
-        temp_path = f"/tmp/{filename}"
-        print(f"Receiving file: {filename}")
+        logger.info("Receiving upload", extra={"object": filename})
 
+        writer = storage.writer(
+            filename, UPLOAD_PART_SIZE,
+            encoding=STORAGE_COMPRESSION, level=STORAGE_COMPRESSION_LEVEL
+        )
+        validator = JsonValidator()
+        uploading = set()
         try:
-            # Write stream to a temporary file
-            with open(temp_path, "wb") as f:
-                for chunk in request_iterator:
-                    f.write(chunk.data)
-
-            # Upload the completed file from the temporary path to MinIO
-            minio_client.fput_object(MINIO_BUCKET, filename, temp_path)
-            print(f"File '{filename}' successfully uploaded to MinIO bucket '{MINIO_BUCKET}'.")
-            response = json_streaming_pb2.UploadResponse(success=True, message=f"File {filename} uploaded successfully.")
-        
-        except S3Error as e:
-            print(f"MinIO Error during upload: {e}")
+            async for chunk in request_iterator:
+                if validator.size + len(chunk.data) > MAX_DOCUMENT_BYTES:
+                    raise DocumentTooLarge(f"Documents are limited to {MAX_DOCUMENT_BYTES} bytes.")
+                #malformed documents are rejected with the first invalid chunk, before it is stored
+                if len(chunk.data) <= VALIDATE_INLINE_BYTES:
+                    validator.feed(chunk.data)
+                else:
+                    await run_io(validator.feed, chunk.data)
+                for part_number, data in writer.feed(chunk.data):
+                    if writer.upload_id is None:
+                        await run_io(writer.start)
+                    if len(uploading) >= UPLOAD_PARALLEL_PARTS:
+                        done, uploading = await asyncio.wait(uploading, return_when=asyncio.FIRST_COMPLETED)
+                        for task in done:
+                            task.result()
+                    uploading.add(asyncio.ensure_future(run_io(writer.upload_part, part_number, data)))
+
+            for task in uploading:
+                await task
+            validator.close()
+            info = await run_io(writer.commit)
+            #off the event loop, the metadata index write may wait for the SQLite lock
+            await run_io(record_write, filename, writer.size, writer.digest, info.etag)
+            logger.info("Upload stored", extra={"object": filename, "bytes": writer.size, "storage": storage.name})
+            response = json_streaming_pb2.UploadResponse(
+                success=True, message=f"File {filename} uploaded successfully.", digest=writer.digest
+            )
+
+        except InvalidDocument as e:
+            logger.info("Rejected invalid upload", extra={"object": filename, "error": str(e)})
+            await self._abort_upload(writer, uploading)
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(e))
+            response = json_streaming_pb2.UploadResponse(success=False, message=str(e))
+        except DocumentTooLarge as e:
+            logger.info("Rejected oversized upload", extra={"object": filename, "bytes": validator.size})
+            await self._abort_upload(writer, uploading)
+            context.set_code(grpc.StatusCode.RESOURCE_EXHAUSTED)
+            context.set_details(str(e))
+            response = json_streaming_pb2.UploadResponse(success=False, message=str(e))
+        except StorageError as e:
+            logger.error("Storage error during upload", extra={"object": filename, "error": str(e)})
+            await self._abort_upload(writer, uploading)
             context.set_code(grpc.StatusCode.INTERNAL)
-            context.set_details(f"MinIO S3 Error: {e}")
+            context.set_details(f"Storage Error: {e}")
             response = json_streaming_pb2.UploadResponse(success=False, message=str(e))
+        except asyncio.CancelledError:
+            logger.warning("Upload cancelled by the client", extra={"object": filename})
+            await self._abort_upload(writer, uploading)
+            raise
         except Exception as e:
-            print(f"An unexpected error occurred during upload: {e}")
+            logger.exception("Unexpected error during upload", extra={"object": filename})
+            await self._abort_upload(writer, uploading)
             context.set_code(grpc.StatusCode.INTERNAL)
             context.set_details(f"Internal Server Error: {e}")
             response = json_streaming_pb2.UploadResponse(success=False, message=str(e))
-        finally:
-            # Clean up the temporary file
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
 
         return response
 
-    def GetJson(self, request, context):
+    @staticmethod
+    async def _abort_upload(writer: MultipartWriter, uploading: set):
+        for task in uploading:
+            task.cancel()
+        await asyncio.gather(*uploading, return_exceptions=True)
+        await run_io(writer.abort)
+
+    async def GetJson(self, request, context):
         """
-        Handles server-streaming download. The file is fetched from MinIO and
-        streamed back to the client in chunks. The bucket is fixed.
+        Handles server-streaming download. The object is streamed from the storage
+        straight to the client in GRPC_CHUNK_SIZE chunks, decompressed on the fly
+        if it is stored compressed. A chunk is only read from the storage after
+        the previous one was handed to gRPC flow control.
         """
         filename = request.message
-        
-        print(f"Request to download '{filename}' from bucket '{MINIO_BUCKET}'.")
-        
-        temp_path = f"/tmp/{filename}"
+        name_error = object_name_error(filename)
+        if name_error is not None:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(name_error)
+            return
+
+        logger.debug("Download requested", extra={"object": filename, "storage": storage.name})
+        set_call_compression(context)
 
+        if request.pointers:
+            if request.offset or request.length:
+                context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+                context.set_details("pointers can't be combined with offset and length")
+                return
+            async for chunk in self._get_selected_values(filename, list(request.pointers), context):
+                yield chunk
+            return
+
+        if request.offset or request.length or request.etag:
+            async for chunk in self._get_range(request, context):
+                yield chunk
+            return
+
+        cached = object_cache.get(filename)
+        if cached is not None:
+            data = compression.decompress(cached.data, cached.encoding)
+            for offset in range(0, len(data), GRPC_CHUNK_SIZE):
+                yield json_streaming_pb2.JsonChunk(data=data[offset:offset + GRPC_CHUNK_SIZE])
+            logger.debug("Download finished", extra={"object": filename, "cached": True})
+            return
+
+        ticket = object_cache.ticket()
+        stream = None
         try:
-            # Download object from MinIO to a temporary file
-            minio_client.fget_object(MINIO_BUCKET, filename, temp_path)
-            
-            # Stream the file in chunks from the temporary location
-            with open(temp_path, "rb") as f:
-                while True:
-                    chunk = f.read(4096)  # 4KB chunk size
-                    if not chunk:
-                        break
-                    yield json_streaming_pb2.JsonChunk(data=chunk)
-            print(f"Finished streaming '{filename}'.")
-
-        except S3Error as e:
-            print(f"MinIO Error during download: {e}")
-            context.set_code(grpc.StatusCode.NOT_FOUND)
+            #concurrent downloads of the object share one fetch, which also caches it
+            flight = object_reads.fetch(filename)
+            info = await flight.wait_async()
+            if flight.shared:
+                async for chunk in self._follow_flight(flight, info.metadata.get(compression.ENCODING_KEY, "")):
+                    yield chunk
+                logger.debug("Download finished", extra={"object": filename, "cached": False})
+                return
+
+            stream = await run_io(storage.open, filename)
+            encoding = stream.info.metadata.get(compression.ENCODING_KEY, "")
+            #small objects are collected while streaming so the next reader gets them from the cache
+            collected = [] if object_cache.accepts(stream.length) else None
+
+            def stored_chunks():
+                for stored in stream.iter_chunks(GRPC_CHUNK_SIZE):
+                    if collected is not None:
+                        collected.append(stored)
+                    yield stored
+
+            #a generator that blocks on the storage, advanced on the storage_io pool one chunk at a time
+            chunks = compression.rechunk(compression.decode_chunks(stored_chunks(), encoding), GRPC_CHUNK_SIZE)
+            while True:
+                chunk = await run_io(next, chunks, None)
+                if chunk is None:
+                    break
+                yield json_streaming_pb2.JsonChunk(data=chunk)
+            if collected is not None:
+                object_cache.put(filename, CachedObject(b"".join(collected), stream.info.etag, encoding), ticket)
+            logger.debug("Download finished", extra={"object": filename, "cached": False})
+
+        except StorageError as e:
+            logger.log(
+                logging.INFO if isinstance(e, ObjectNotFound) else logging.ERROR,
+                "Storage error during download", extra={"object": filename, "error": str(e)}
+            )
+            context.set_code(grpc.StatusCode.NOT_FOUND if isinstance(e, ObjectNotFound) else grpc.StatusCode.INTERNAL)
             context.set_details(f"Could not retrieve file. Error: {e}")
             # Yield nothing to indicate an error.
             return
         except Exception as e:
-            print(f"An unexpected error occurred during download: {e}")
+            logger.exception("Unexpected error during download", extra={"object": filename})
             context.set_code(grpc.StatusCode.INTERNAL)
             context.set_details(f"An unexpected error occurred. Error: {e}")
             # Yield nothing to indicate an error.
             return
         finally:
-            # Clean up the temporary file
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+            # Always release the stream (for MinIO: hand the connection back to the pool)
+            if stream is not None:
+                stream.close()
+
+    @staticmethod
+    async def _follow_flight(flight, encoding: str):
+        """The chunks of a shared fetch as JsonChunks, decompressed on the storage_io pool if needed."""
+        decompressor = compression.decompressor(encoding) if encoding else None
+        async for stored in flight.chunks_async():
+            data = stored if decompressor is None else await run_io(decompressor.decompress, stored)
+            for offset in range(0, len(data), GRPC_CHUNK_SIZE):
+                yield json_streaming_pb2.JsonChunk(data=data[offset:offset + GRPC_CHUNK_SIZE])
+        if decompressor is not None:
+            data = decompressor.flush()
+            for offset in range(0, len(data), GRPC_CHUNK_SIZE):
+                yield json_streaming_pb2.JsonChunk(data=data[offset:offset + GRPC_CHUNK_SIZE])
+
+    @staticmethod
+    async def _get_range(request, context):
+        """
+        Streams the bytes [offset, offset + length) of a document. Uncompressed objects
+        are read with a ranged GET, compressed ones are decoded from the start and the
+        bytes before offset are dropped. With an etag the call fails unless the object
+        still has it, so the ranges of a parallel or resumed download fit together.
+        Ranged reads are not added to the object cache.
+        """
+        filename = request.message
+        offset = request.offset
+        length = request.length or None
+        stream = None
+        try:
+            size = None
+            cached = object_cache.get(filename)
+            if cached is not None and request.etag in ("", cached.etag):
+                data = compression.decompress(cached.data, cached.encoding)
+                size = len(data)
+                end = size if length is None else min(size, offset + length)
+                chunks = iter([data[start:min(end, start + GRPC_CHUNK_SIZE)] for start in range(offset, end, GRPC_CHUNK_SIZE)])
+            else:
+                info = await run_io(storage.stat, filename)
+                if request.etag and info.etag != request.etag:
+                    context.set_code(grpc.StatusCode.FAILED_PRECONDITION)
+                    context.set_details(f"The object has changed, its ETag is now {info.etag}")
+                    return
+                encoding = info.metadata.get(compression.ENCODING_KEY, "")
+                if not encoding:
+                    size = info.size
+                    #a ranged GET that starts at the end of the object is rejected by S3
+                    if offset >= size:
+                        chunks = iter(())
+                    else:
+                        stream = await run_io(storage.open, filename, offset, length)
+                        chunks = stream.iter_chunks(GRPC_CHUNK_SIZE)
+                else:
+                    size = identity_size_of(info.metadata)
+                    stream = await run_io(storage.open, filename)
+                    decoded = compression.decode_chunks(stream.iter_chunks(GRPC_CHUNK_SIZE), encoding)
+                    chunks = compression.rechunk(
+                        compression.slice_chunks(decoded, offset, length or sys.maxsize), GRPC_CHUNK_SIZE
+                    )
+                if stream is not None and request.etag and stream.info.etag != request.etag:
+                    #replaced between the stat and the read
+                    context.set_code(grpc.StatusCode.FAILED_PRECONDITION)
+                    context.set_details(f"The object has changed, its ETag is now {stream.info.etag}")
+                    return
+
+            if size is not None and offset > size:
+                context.set_code(grpc.StatusCode.OUT_OF_RANGE)
+                context.set_details(f"Offset {offset} is beyond the end of the document ({size} bytes)")
+                return
+            sent = 0
+            while True:
+                chunk = await run_io(next, chunks, None)
+                if chunk is None:
+                    break
+                sent += len(chunk)
+                yield json_streaming_pb2.JsonChunk(data=chunk)
+            logger.debug("Range download finished", extra={"object": filename, "offset": offset, "bytes": sent})
+
+        except StorageError as e:
+            logger.log(
+                logging.INFO if isinstance(e, ObjectNotFound) else logging.ERROR,
+                "Storage error during download", extra={"object": filename, "error": str(e)}
+            )
+            context.set_code(grpc.StatusCode.NOT_FOUND if isinstance(e, ObjectNotFound) else grpc.StatusCode.INTERNAL)
+            context.set_details(f"Could not retrieve file. Error: {e}")
+        except Exception as e:
+            logger.exception("Unexpected error during download", extra={"object": filename})
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(f"An unexpected error occurred. Error: {e}")
+        finally:
+            if stream is not None:
+                stream.close()
+
+    async def Stat(self, request, context):
+        """
+        Returns the size of the (uncompressed) document, the ETag and the digest of an
+        object. Clients split a download into ranges of this size and pass the ETag
+        with every range.
+        """
+        name_error = object_name_error(request.name)
+        if name_error is not None:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(name_error)
+            return json_streaming_pb2.ObjectStat()
+        try:
+            info = await run_io(storage.stat, request.name)
+            size = await run_io(document_size, info)
+            digest = await run_io(document_digest, info)
+        except StorageError as e:
+            context.set_code(grpc.StatusCode.NOT_FOUND if isinstance(e, ObjectNotFound) else grpc.StatusCode.INTERNAL)
+            context.set_details(f"Could not retrieve file. Error: {e}")
+            return json_streaming_pb2.ObjectStat()
+        return json_streaming_pb2.ObjectStat(
+            name=request.name, size=size, etag=info.etag, digest=digest or "", content_type=info.content_type
+        )
+
+    @staticmethod
+    async def _get_selected_values(filename: str, pointers: List[str], context):
+        """Streams only the values the JSON Pointers of a GetRequest select (see select_values)."""
+        try:
+            data = await run_io(select_values, filename, pointers)
+        except json_pointer.PointerError as e:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(e))
+            return
+        except json_pointer.PointerNotFound as e:
+            context.set_code(grpc.StatusCode.NOT_FOUND)
+            context.set_details(f"No value at {', '.join(e.args[0])}")
+            return
+        except InvalidDocument as e:
+            context.set_code(grpc.StatusCode.FAILED_PRECONDITION)
+            context.set_details(str(e))
+            return
+        except StorageError as e:
+            context.set_code(grpc.StatusCode.NOT_FOUND if isinstance(e, ObjectNotFound) else grpc.StatusCode.INTERNAL)
+            context.set_details(f"Could not retrieve file. Error: {e}")
+            return
+
+        for offset in range(0, len(data), GRPC_CHUNK_SIZE):
+            yield json_streaming_pb2.JsonChunk(data=data[offset:offset + GRPC_CHUNK_SIZE])
+
+    async def BatchGet(self, request, context):
+        """
+        Handles a batch download. Up to BATCH_CONCURRENCY objects are fetched
+        concurrently and streamed back as soon as each one is available, so the
+        chunks of different objects can arrive in any order. The last chunk of
+        every object carries its status.
+        """
+        names = list(dict.fromkeys(request.names))
+        logger.debug("Batch download requested", extra={"objects": len(names)})
+        set_call_compression(context)
+
+        slots = asyncio.Semaphore(max(1, BATCH_CONCURRENCY))
+
+        async def fetch(name):
+            name_error = object_name_error(name)
+            if name_error is not None:
+                return name, None, name_error
+            async with slots:
+                try:
+                    return name, await run_io(read_document, name), None
+                except StorageError as e:
+                    return name, None, f"Storage Error: {e}"
+                except Exception as e:
+                    return name, None, f"Internal Server Error: {e}"
+
+        tasks = [asyncio.ensure_future(fetch(name)) for name in names]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                name, data, error = await next_done
+                if error is not None:
+                    yield json_streaming_pb2.BatchChunk(name=name, last=True, success=False, message=error)
+                    continue
+
+                for offset in range(0, len(data), GRPC_CHUNK_SIZE):
+                    last = offset + GRPC_CHUNK_SIZE >= len(data)
+                    yield json_streaming_pb2.BatchChunk(
+                        name=name, data=data[offset:offset + GRPC_CHUNK_SIZE],
+                        last=last, success=last
+                    )
+                if not data:
+                    yield json_streaming_pb2.BatchChunk(name=name, last=True, success=True)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        logger.debug("Batch download finished", extra={"objects": len(names)})
+
+    async def BatchUpload(self, request_iterator, context):
+        """
+        Handles a batch upload. Every object is sent as one or more BatchChunk
+        frames with its name, the last frame marked with last. Complete objects
+        are stored concurrently (at most BATCH_CONCURRENCY at a time) and one
+        BatchItemStatus per object is streamed back as soon as it is stored.
+        """
+        async def store(name, data):
+            try:
+                await run_io(store_object, name, data)
+                return json_streaming_pb2.BatchItemStatus(name=name, success=True, message=f"File {name} uploaded successfully.")
+            except InvalidDocument as e:
+                return json_streaming_pb2.BatchItemStatus(name=name, success=False, message=str(e))
+            except StorageError as e:
+                return json_streaming_pb2.BatchItemStatus(name=name, success=False, message=f"Storage Error: {e}")
+            except Exception as e:
+                return json_streaming_pb2.BatchItemStatus(name=name, success=False, message=f"Internal Server Error: {e}")
+
+        receiving = {}
+        running = set()
+        try:
+            async for chunk in request_iterator:
+                name_error = object_name_error(chunk.name)
+                if name_error is not None:
+                    if chunk.last or not chunk.name:
+                        yield json_streaming_pb2.BatchItemStatus(name=chunk.name, success=False, message=name_error)
+                    continue
+
+                receiving.setdefault(chunk.name, bytearray()).extend(chunk.data)
+                if not chunk.last:
+                    continue
+
+                running.add(asyncio.ensure_future(store(chunk.name, bytes(receiving.pop(chunk.name)))))
+                #stop reading from the client while all workers are busy
+                if len(running) >= BATCH_CONCURRENCY:
+                    done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                else:
+                    done = {task for task in running if task.done()}
+                    running -= done
+                for task in done:
+                    yield task.result()
+
+            for next_done in asyncio.as_completed(running):
+                yield await next_done
+            running = set()
+        finally:
+            for task in running:
+                task.cancel()
+
+        for name in receiving:
+            yield json_streaming_pb2.BatchItemStatus(name=name, success=False, message="Stream ended before the last chunk of the object.")
+
+    @staticmethod
+    def _session_message(session, parts=()):
+        return json_streaming_pb2.UploadSession(
+            session_id=session.session_id, name=session.name, size=session.size, part_size=session.part_size,
+            part_count=session.part_count, expires_at=session.expires_at,
+            parts=[json_streaming_pb2.UploadedPart(number=part.number, etag=part.etag, size=part.size) for part in parts]
+        )
+
+    @staticmethod
+    def _session_error(context, error: Exception):
+        """Sets the status of a failed upload session call."""
+        if isinstance(error, SessionNotFound):
+            code, details = grpc.StatusCode.NOT_FOUND, f"Upload session '{error.args[0]}' does not exist or has expired."
+        elif isinstance(error, IncompleteUpload):
+            code, details = grpc.StatusCode.FAILED_PRECONDITION, str(error)
+        elif isinstance(error, (SessionError, InvalidDocument)):
+            code, details = grpc.StatusCode.INVALID_ARGUMENT, str(error)
+        else:
+            code, details = grpc.StatusCode.INTERNAL, f"Storage Error: {error}"
+        context.set_code(code)
+        context.set_details(details)
+
+    async def CreateUploadSession(self, request, context):
+        """Starts a resumable upload of a document of known size (see upload_sessions.py)."""
+        name_error = object_name_error(request.name)
+        if name_error is not None:
+            self._session_error(context, SessionError(name_error))
+            return json_streaming_pb2.UploadSession()
+        try:
+            session = await run_io(
+                upload_sessions.create, request.name, request.size, request.part_size or UPLOAD_SESSION_PART_SIZE
+            )
+        except (SessionError, StorageError) as e:
+            self._session_error(context, e)
+            return json_streaming_pb2.UploadSession()
+        logger.info("Upload session created", extra={
+            "session": session.session_id, "object": session.name, "bytes": session.size, "parts": session.part_count
+        })
+        return self._session_message(session)
+
+    async def UploadPart(self, request_iterator, context):
+        """
+        Receives one part of an upload session and stores it once it is complete.
+        The part is held in memory until then, so its size is limited by UPLOAD_SESSION_MAX_PART_SIZE.
+        """
+        session = None
+        number = 0
+        data = bytearray()
+        try:
+            async for chunk in request_iterator:
+                if session is None:
+                    session = await run_io(upload_sessions.get, chunk.session_id)
+                    number = chunk.part_number
+                data += chunk.data
+                upload_sessions.check_part(session, number, len(data))
+            if session is None:
+                raise SessionError("Missing session id and part number")
+            etag = await run_io(upload_sessions.upload_part, session, number, bytes(data))
+        except (SessionNotFound, SessionError, StorageError) as e:
+            self._session_error(context, e)
+            return json_streaming_pb2.UploadedPart()
+        return json_streaming_pb2.UploadedPart(number=number, etag=etag, size=len(data))
+
+    async def GetUploadSession(self, request, context):
+        """Describes a session together with the parts the server has received."""
+        try:
+            session = await run_io(upload_sessions.get, request.session_id)
+            parts = await run_io(upload_sessions.uploaded_parts, session)
+        except (SessionNotFound, StorageError) as e:
+            self._session_error(context, e)
+            return json_streaming_pb2.UploadSession()
+        return self._session_message(session, parts)
+
+    async def CompleteUploadSession(self, request, context):
+        """
+        Assembles the parts of a session and stores the document under its name,
+        after reading it back once to validate it and compute its digest.
+        """
+        try:
+            session = await run_io(upload_sessions.get, request.session_id)
+            info, digest = await run_io(upload_sessions.complete, session)
+            await run_io(record_write, session.name, session.size, digest, info.etag, session.content_type)
+        except (SessionNotFound, SessionError, InvalidDocument, StorageError) as e:
+            self._session_error(context, e)
+            return json_streaming_pb2.UploadResponse(success=False, message=context.details())
+        logger.info("Upload session completed", extra={"session": session.session_id, "object": session.name})
+        return json_streaming_pb2.UploadResponse(
+            success=True, message=f"File {session.name} uploaded successfully.", digest=digest
+        )
+
+    async def AbortUploadSession(self, request, context):
+        """Drops a session and the parts uploaded so far."""
+        try:
+            session = await run_io(upload_sessions.get, request.session_id)
+            await run_io(upload_sessions.abort, session)
+        except (SessionNotFound, StorageError) as e:
+            self._session_error(context, e)
+            return json_streaming_pb2.UploadResponse(success=False, message=context.details())
+        return json_streaming_pb2.UploadResponse(success=True, message=f"Upload of {session.name} aborted.")
 
 # ------------------ End of gRPC Server ------------------------------#
 
 
 # ------------------ HTTP Server (Crud app) --------------------------#
 
+metrics.install_http_metrics(app)
+
+#werkzeug stops reading request bodies beyond this (413), also for chunked requests without Content-Length
+app.config["MAX_CONTENT_LENGTH"] = MAX_DOCUMENT_BYTES
+
+#set once this process stops taking new work (see drain)
+draining = threading.Event()
+
+#limits and rate limits of object requests (see admit_request)
+http_admission = Admission(
+    HTTP_CONCURRENCY_LIMITS, ADMISSION_QUEUE_SIZE, ADMISSION_QUEUE_TIMEOUT,
+    RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST, ADMISSION_RETRY_AFTER
+)
+
+
+@app.before_request
+def require_storage():
+    """Answers object requests with 503 until the storage has been prepared (see StorageInitializer)."""
+    if request.path.startswith("/pcf-registry") and not storage_init.ready:
+        response = jsonify({"error": "Storage is not ready yet"})
+        response.headers["Retry-After"] = "1"
+        return response, 503
+
+
+@app.before_request
+def admit_request():
+    """
+    Admits object requests through http_admission; requests that are turned away get 429 with Retry-After.
+    An admitted request keeps its slot until its response is sent (see release_admission_slot).
+    """
+    if not request.path.startswith("/pcf-registry") or not http_admission.applies(request.endpoint):
+        return None
+    try:
+        g.admission_slot = http_admission.admit(
+            request.endpoint, request.headers.get(RATE_LIMIT_CLIENT_KEY) or request.remote_addr
+        )
+    except Overloaded as e:
+        metrics.observe_admission_rejected("http", request.endpoint, e.reason)
+        response = jsonify({"error": f"Too many requests: {e}"})
+        response.headers["Retry-After"] = e.retry_after_header()
+        return response, 429
+
+
+@app.after_request
+def release_admission_slot(response: Response) -> Response:
+    slot = g.pop("admission_slot", None)
+    if slot is not None:
+        #streamed bodies are sent after the request context is gone, the slot is released once they are closed
+        response.call_on_close(slot.release)
+    return response
+
+
+@app.teardown_request
+def release_unused_admission_slot(error=None):
+    """Releases the slot of a request that never got to after_request."""
+    slot = g.pop("admission_slot", None)
+    if slot is not None:
+        slot.release()
+
 
 @app.route('/')
 def hello_world():
     return 'Hello World!'
 
 
+def stream_object(stream, collect: bool = False, on_complete=None):
+    """
+    Yields an object stream in HTTP_CHUNK_SIZE blocks and closes it afterwards,
+    also when the client disconnects early.
+    With collect=True the complete body is passed to on_complete at the end.
+    """
+    collected = [] if collect else None
+    try:
+        for chunk in stream.iter_chunks(HTTP_CHUNK_SIZE):
+            if collected is not None:
+                collected.append(chunk)
+            yield chunk
+    finally:
+        stream.close()
+
+    if collected is not None and on_complete is not None:
+        on_complete(b"".join(collected))
+
+
+def object_response(etag: str, size, body_for_range, content_encoding: str = "") -> Response:
+    """
+    Builds the GET response for an object of the given size and ETag, answering
+    If-None-Match with 304 and a single satisfiable Range with 206.
+
+    Arguments:
+        size: length of the body, None if it is not known up front (then Range is ignored)
+        body_for_range: callable (offset, length) -> bytes or iterable of bytes for the selected range
+        content_encoding: encoding of the body as sent ("" for plain JSON)
+
+    Returns:
+        The flask response with the stored bytes as body
+    """
+    headers = {
+        "ETag": f'"{etag}"',
+        "Accept-Ranges": "bytes" if size is not None else "none",
+        "Vary": "Accept-Encoding",
+    }
+    if content_encoding:
+        headers["Content-Encoding"] = content_encoding
+    if etag and request.if_none_match.contains_weak(etag):
+        return Response(status=304, headers=headers)
+
+    if size is None:
+        return Response(body_for_range(0, None), status=200, headers=headers, content_type="application/json")
+
+    byte_range = request.range
+    #a Range with a non-matching If-Range validator means "send the whole object"
+    if byte_range is not None and request.headers.get("If-Range") and request.if_range.etag != etag:
+        byte_range = None
+
+    if byte_range is not None:
+        selected = byte_range.range_for_length(size)
+        if selected is None:
+            if byte_range.units == "bytes" and len(byte_range.ranges) == 1:
+                headers["Content-Range"] = f"bytes */{size}"
+                return Response(status=416, headers=headers)
+        else:
+            start, stop = selected
+            headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+            headers["Content-Length"] = str(stop - start)
+            return Response(body_for_range(start, stop - start), status=206, headers=headers,
+                            content_type="application/json")
+
+    headers["Content-Length"] = str(size)
+    return Response(body_for_range(0, size), status=200, headers=headers, content_type="application/json")
+
+
+def representation_response(etag: str, size: int, encoding: str, identity_size, stored_body) -> Response:
+    """
+    Sends a stored object as it is if the client accepts its encoding, otherwise
+    decompresses it on the fly. The decompressed representation gets its own ETag.
+
+    Arguments:
+        size: number of stored bytes
+        encoding: encoding of the stored bytes ("" if stored uncompressed)
+        identity_size: size of the decompressed document if known, otherwise None
+        stored_body: callable (offset, length) -> bytes or iterable of bytes of the stored object
+    """
+    if not encoding or request.accept_encodings[encoding]:
+        return object_response(etag, size, stored_body, content_encoding=encoding)
+
+    def decoded_body(offset, length):
+        chunks = stored_body(0, size)
+        if isinstance(chunks, (bytes, bytearray, memoryview)):
+            chunks = [chunks]
+        decoded = compression.decode_chunks(chunks, encoding)
+        return decoded if length is None else compression.slice_chunks(decoded, offset, length)
+
+    return object_response(f"{etag}-identity", identity_size, decoded_body)
+
+
+def identity_size_of(metadata: dict):
+    """Uncompressed size recorded for a compressed object, None if it was not recorded."""
+    value = metadata.get(compression.IDENTITY_SIZE_KEY)
+    return int(value) if value is not None else None
+
+
+def utc_timestamp(seconds: float) -> str:
+    return datetime.fromtimestamp(seconds, timezone.utc).isoformat(timespec="milliseconds")
+
+
+@app.route('/pcf-registry', methods=['GET'])
+def list_files():
+    """
+    Lists the stored objects in name order, one page at a time, from the metadata index.
+    Query parameters:
+        prefix: only objects whose name starts with it
+        limit: page size (default LIST_DEFAULT_LIMIT, at most LIST_MAX_LIMIT)
+        after: the "next" value of the previous page
+
+    Returns:
+        200: {"objects": [...], "next": cursor of the next page or null}
+        400: limit is not a positive number
+    """
+    try:
+        limit = int(request.args.get("limit", LIST_DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({"error": "limit must be a number"}), 400
+    if limit < 1:
+        return jsonify({"error": "limit must be positive"}), 400
+
+    objects, next_cursor = metadata_index.page(
+        request.args.get("prefix", ""), request.args.get("after", ""), min(limit, LIST_MAX_LIMIT)
+    )
+    return jsonify({
+        "objects": [
+            {
+                "name": entry.name,
+                "size": entry.size,
+                "digest": entry.digest,
+                "content_type": entry.content_type,
+                "created_at": utc_timestamp(entry.created_at),
+                "updated_at": utc_timestamp(entry.updated_at),
+            }
+            for entry in objects
+        ],
+        "next": next_cursor,
+    }), 200
+
+
 @app.route('/pcf-registry/<object_name>', methods=['GET'])
 def get_file(object_name: str):
-    if object_name is None or object_name == "":
-        return jsonify({"error": "Missing object name"}), 400
+    """
+    GET request to this MS (url: .../pcf-registry/<object_name>).
+    The stored JSON bytes are sent unchanged, with the storage ETag for conditional
+    requests (If-None-Match -> 304) and support for single byte ranges (Range -> 206).
+    Compressed objects are sent compressed (Content-Encoding) to clients that accept
+    the encoding and are decompressed on the fly for all others.
+    With ?pointer=/path/to/field (repeatable) only the selected values are sent,
+    see get_selected_values.
+    """
+    name_error = object_name_error(object_name)
+    if name_error is not None:
+        return jsonify({"error": name_error}), 400
+
+    pointers = request.args.getlist("pointer")
+    if pointers:
+        return get_selected_values(object_name, pointers)
+
+    cached = object_cache.get(object_name)
+    if cached is not None:
+        if cached.encoding and not request.accept_encodings[cached.encoding]:
+            data = compression.decompress(cached.data, cached.encoding)
+            return object_response(f"{cached.etag}-identity", len(data), lambda offset, length: data[offset:offset + length])
+        return object_response(
+            cached.etag, len(cached.data),
+            lambda offset, length: cached.data[offset:offset + length],
+            content_encoding=cached.encoding
+        )
 
-    #get the object from the filestorage and read it into json bytes
     try:
-        json_bytes = minio_client.get_object(MINIO_BUCKET, object_name).read()
-    except S3Error as e:
-        return jsonify({f"error with getting {object_name}": str(e)}), 404
+        if request.range is not None or request.if_none_match:
+            #only the metadata is needed up front, the body (or selected range) is fetched on its own
+            info = storage.stat(object_name)
+            return representation_response(
+                info.etag, info.size, info.metadata.get(compression.ENCODING_KEY, ""), identity_size_of(info.metadata),
+                lambda offset, length: stream_object(
+                    storage.open(object_name, offset=offset, length=length)
+                ) if length else b""
+            )
+
+        ticket = object_cache.ticket()
+        #concurrent GETs of the object share one fetch, which also caches it; a large object is opened by every GET
+        #and answered with the ETag of what this stream reads
+        flight = object_reads.fetch(object_name)
+        info = flight.wait()
+        stream = None
+        if not flight.shared:
+            stream = storage.open(object_name)
+            info = stream.info
+    except StorageError as e:
+        return jsonify({f"error with getting {object_name}": str(e)}), 404 if isinstance(e, ObjectNotFound) else 500
     except Exception as e:
         return jsonify({"Unexpected error": str(e)}), 500
 
-    #transfrom the json bytes into a json dict
-    json_data = json.loads(json_bytes.decode('utf-8'))
+    etag, size = info.etag, info.size
+    encoding = info.metadata.get(compression.ENCODING_KEY, "")
+    if stream is None:
+        return representation_response(
+            etag, size, encoding, identity_size_of(info.metadata), lambda offset, length: flight.chunks()
+        )
+    return representation_response(
+        etag, size, encoding, identity_size_of(info.metadata),
+        lambda offset, length: stream_object(
+            stream,
+            collect=object_cache.accepts(size),
+            on_complete=lambda data: object_cache.put(object_name, CachedObject(data, etag, encoding), ticket)
+        )
+    )
 
-    return jsonify(json_data), 200
+
+def get_selected_values(object_name: str, pointers: List[str]) -> Tuple[Response, int]:
+    """
+    Answers a GET with JSON Pointers: the selected value for one pointer, an
+    object keyed by pointer for several (see select_values).
+
+    Returns:
+        200: the selected values
+        400: a pointer is malformed
+        404: the object does not exist or has no value at a pointer
+        422: the stored object is not valid JSON
+    """
+    try:
+        return Response(select_values(object_name, pointers), content_type="application/json"), 200
+    except json_pointer.PointerError as e:
+        return jsonify({"error": str(e)}), 400
+    except json_pointer.PointerNotFound as e:
+        return jsonify({"error": f"No value at {', '.join(e.args[0])}", "pointers": e.args[0]}), 404
+    except InvalidDocument as e:
+        return jsonify({"error": str(e)}), 422
+    except StorageError as e:
+        return jsonify({f"error with getting {object_name}": str(e)}), 404 if isinstance(e, ObjectNotFound) else 500
+    except Exception as e:
+        return jsonify({"Unexpected error": str(e)}), 500
 
 
 @app.route('/pcf-registry/<object_name>', methods=['POST'])
 def post_file(object_name: str) -> Tuple[Response, int]:
     """
     POST request to this MS (url: .../pcf-registry/<object_name>).
+    The raw body is streamed to the storage while it is received (in UPLOAD_PART_SIZE
+    parts for large documents) and validated on the way, so the document is never
+    buffered or parsed as a whole. The stored bytes are exactly the posted ones.
 
     Arguments:
-        request: the post request sent to this url
+        request: the post request sent to this url, with a JSON body (Content-Type application/json)
         object_name: the name of the object to be uploaded
 
     Returns:
-        A confirmation of a successfull upload with the objects name in form of a dict
+        200: a confirmation of a successfull upload with the objects name and the SHA-256 digest of the stored document in form of a dict
+        400: the body is not well-formed JSON
+        401: the body is empty
+        413: the body is larger than MAX_DOCUMENT_BYTES
+        415: the body is not declared as JSON
     """
 
-    if object_name is None or object_name == "":
-        return jsonify({"error": "Missing object name"}), 400
-
-    #parse the json body from the request
-    request_body: dict = request.get_json()
-
-    if request_body is None:
-        return jsonify({"error": "Missing request body"}), 401
-
-    #transform the json data to a file object so that it can be stored in minIO
-    json_bytes = json.dumps(request_body).encode('utf-8')
-    file_object = BytesIO(json_bytes)
+    name_error = object_name_error(object_name)
+    if name_error is not None:
+        return jsonify({"error": name_error}), 400
+    if not request.is_json:
+        return jsonify({"error": "Content-Type must be application/json"}), 415
 
-    #add the file to the minIO filestorage
+    #documents announced to be small are not worth compressing
+    compress = STORAGE_COMPRESSION and (request.content_length is None or request.content_length >= STORAGE_COMPRESSION_MIN_SIZE)
     try:
-        minio_client.put_object(
-            bucket_name=MINIO_BUCKET,
-            object_name=object_name,
-            data=file_object,
-            length=len(json_bytes)
-        )
-    except S3Error as e:
+        writer, info = stream_document(object_name, request.stream.read, compress)
+    except InvalidDocument as e:
+        return jsonify({"error": str(e)}), 400
+    except RequestEntityTooLarge:
+        return jsonify({"error": f"Documents are limited to {MAX_DOCUMENT_BYTES} bytes"}), 413
+    except StorageError as e:
         return jsonify({f"error with uploading {object_name}": str(e)}), 404
     except Exception as e:
         return jsonify({"Unexpected error": str(e)}), 500
+    if info is None:
+        return jsonify({"error": "Missing request body"}), 401
 
-    return jsonify({"message": f"Uploaded {object_name} successfully."}), 200
+    record_write(object_name, writer.size, writer.digest, info.etag)
+    return jsonify({"message": f"Uploaded {object_name} successfully.", "digest": writer.digest}), 200
 
 
 @app.route('/pcf-registry/<object_name>', methods=['DELETE'])
 def delete_file(object_name: str):
-    if object_name is None or object_name == "":
-        return jsonify({"error": "Missing object name"}), 400
+    name_error = object_name_error(object_name)
+    if name_error is not None:
+        return jsonify({"error": name_error}), 400
 
     #delete the object from the filestorage
     try:
-        minio_client.remove_object(MINIO_BUCKET, object_name)
+        storage.delete(object_name)
+        record_delete(object_name)
         return jsonify({"message": f"Deleted '{object_name}'"}), 200
-    except S3Error as e:
-        return jsonify({"error": f"MinIO S3 error: {e.code}", "message": str(e)}), 404
+    except StorageError as e:
+        return jsonify({"error": "Storage error", "message": str(e)}), 404
     except Exception as e:
         return jsonify({"error": "Unexpected error", "message": str(e)}), 500
 
 
+def prefetch_for_export(info):
+    """
+    Reads and decodes a small object ahead of the archive (runs on storage_io).
+    Returns the object info and its document, None as document for an object
+    that is too large to hold in memory, and None if the object is gone.
+    """
+    if info.size > EXPORT_PREFETCH_MAX_BYTES:
+        return info, None
+    try:
+        stream = storage.open(info.name)
+    except ObjectNotFound:
+        return None
+    with stream:
+        if stream.info.size > EXPORT_PREFETCH_MAX_BYTES:
+            return stream.info, None
+        data = b"".join(stream.iter_chunks(HTTP_CHUNK_SIZE))
+    return stream.info, compression.decompress(data, stream.info.metadata.get(compression.ENCODING_KEY, ""))
+
+
+def export_member(writer: ArchiveWriter, info, document: Optional[bytes]):
+    """Yields the archive member of an object, streaming it from the storage unless its document was prefetched."""
+    mtime = info.last_modified.timestamp() if info.last_modified is not None else None
+    if document is not None:
+        yield from writer.member(info.name, len(document), [document], mtime, document_digest(info))
+        return
+    try:
+        stream = storage.open(info.name)
+    except ObjectNotFound:
+        return
+    with stream:
+        info = stream.info
+        encoding = info.metadata.get(compression.ENCODING_KEY, "")
+        yield from writer.member(
+            info.name, document_size(info), compression.decode_chunks(stream.iter_chunks(HTTP_CHUNK_SIZE), encoding),
+            mtime, document_digest(info)
+        )
+
+
+def export_objects(prefix: str, writer: ArchiveWriter):
+    """
+    Yields the archive of all objects whose name starts with prefix, in listing order,
+    while the next EXPORT_PREFETCH objects are fetched concurrently.
+    """
+    listing = (info for info in storage.list(prefix) if not is_reserved_name(info.name))
+    prefetched = collections.deque()
+    exported = 0
+    try:
+        for info in listing:
+            prefetched.append(storage_io.submit(prefetch_for_export, info))
+            while len(prefetched) >= EXPORT_PREFETCH:
+                entry = prefetched.popleft().result()
+                if entry is not None:
+                    yield from export_member(writer, *entry)
+                    exported += 1
+        while prefetched:
+            entry = prefetched.popleft().result()
+            if entry is not None:
+                yield from export_member(writer, *entry)
+                exported += 1
+        yield from writer.close()
+        logger.info("Objects exported", extra={"prefix": prefix, "objects": exported, "bytes": writer.size})
+    except Exception as e:
+        #the response is cut off, so the client sees an incomplete archive instead of a short one
+        logger.error("Export failed", extra={"prefix": prefix, "objects": exported, "error": str(e)})
+        raise
+    finally:
+        for future in prefetched:
+            future.cancel()
+
+
+@app.route('/pcf-registry/_export', methods=['GET'])
+def export_archive():
+    """
+    GET request to this MS (url: .../pcf-registry/_export?prefix=&compression=).
+    Streams a tar archive of the documents whose name starts with prefix (all by
+    default), see archive.py. With compression=gzip or zstd the whole archive is
+    compressed. Several objects are fetched ahead of the one being sent; only
+    objects up to EXPORT_PREFETCH_MAX_BYTES are held in memory for that.
+
+    Returns:
+        200: the archive (application/x-tar, application/gzip or application/zstd)
+        400: the compression is not supported
+    """
+    encoding = request.args.get("compression", "")
+    if encoding and (encoding not in compression.SUPPORTED_ENCODINGS or not compression.available(encoding)):
+        return jsonify({"error": f"Unsupported compression '{encoding}'"}), 400
+
+    writer = ArchiveWriter(encoding, chunk_size=HTTP_CHUNK_SIZE)
+    content_type, suffix = {"": ("application/x-tar", ""), "gzip": ("application/gzip", ".gz"),
+                            "zstd": ("application/zstd", ".zst")}[encoding]
+    return Response(
+        export_objects(request.args.get("prefix", ""), writer), status=200, content_type=content_type,
+        headers={"Content-Disposition": f'attachment; filename="pcf-registry.tar{suffix}"'}
+    )
+
+
+@app.route('/pcf-registry/_import', methods=['POST'])
+def import_archive():
+    """
+    POST request to this MS (url: .../pcf-registry/_import) with a tar archive as body,
+    as written by _export (plain, gzip or zstd compressed). Every file in the archive
+    is validated and stored under its path in the archive, replacing an existing
+    object; IMPORT_CONCURRENCY documents are stored at the same time while the
+    archive is read on. Documents with a recorded digest have to match it.
+
+    Returns:
+        200: {"imported": count, "failed": count, "errors": {name: error}} (the first IMPORT_MAX_REPORTED_ERRORS failures)
+        400: the archive is malformed; the documents before the damage are stored, the counts tell how many
+        413: the archive is larger than IMPORT_MAX_BYTES
+    """
+    request.max_content_length = IMPORT_MAX_BYTES or None
+    counts = {"imported": 0, "failed": 0}
+    errors = {}
+    lock = threading.Lock()
+    slots = threading.BoundedSemaphore(IMPORT_CONCURRENCY)
+
+    def finished(name: str, error: Optional[str] = None):
+        with lock:
+            counts["failed" if error else "imported"] += 1
+            if error and len(errors) < IMPORT_MAX_REPORTED_ERRORS:
+                errors[name] = error
+
+    def store(name: str, data: bytes, digest: Optional[str]):
+        try:
+            if digest and hashlib.sha256(data).hexdigest() != digest:
+                raise InvalidDocument(f"The document does not have the SHA-256 digest {digest}")
+            store_object(name, data)
+            finished(name)
+        except (InvalidDocument, StorageError) as e:
+            finished(name, str(e))
+        except Exception as e:
+            finished(name, f"Unexpected error: {e}")
+        finally:
+            slots.release()
+
+    failure = None
+    try:
+        for member, file in read_archive(request.stream.read, HTTP_CHUNK_SIZE):
+            #archives made with "tar -C directory ." name their files ./name
+            name = member.name[2:] if member.name.startswith("./") else member.name
+            name_error = object_name_error(name)
+            if name_error is not None:
+                finished(member.name, name_error)
+            elif member.size > MAX_DOCUMENT_BYTES:
+                finished(name, f"Documents are limited to {MAX_DOCUMENT_BYTES} bytes")
+            elif member.size <= UPLOAD_PART_SIZE:
+                data = file.read()
+                slots.acquire()
+                storage_io.submit(store, name, data, member.digest)
+            else:
+                #a large document is streamed to the storage while it is read from the archive
+                try:
+                    writer, info = stream_document(name, file.read, bool(STORAGE_COMPRESSION), member.digest)
+                    record_write(name, writer.size, writer.digest, info.etag)
+                    finished(name)
+                except (InvalidDocument, StorageError) as e:
+                    finished(name, str(e))
+    except ArchiveError as e:
+        failure = (str(e), 400)
+    except RequestEntityTooLarge:
+        failure = (f"Archives are limited to {IMPORT_MAX_BYTES} bytes", 413)
+    finally:
+        #wait for the documents that are still being stored
+        for _ in range(IMPORT_CONCURRENCY):
+            slots.acquire()
+
+    logger.info("Archive imported", extra={**counts, "error": failure[0] if failure else None})
+    body = {**counts, "errors": errors}
+    if failure is not None:
+        return jsonify({"error": failure[0], **body}), failure[1]
+    return jsonify(body), 200
+
+
 @app.route('/check')
 def check():
     return "check"
 
 
+@app.route('/live', methods=['GET'])
+def live():
+    """Liveness check: fails only if the gRPC server of this process died on its own or the storage could not be prepared (the pod should be restarted)."""
+    if grpc_server.started and not grpc_server.running and not draining.is_set():
+        return jsonify({"status": "gRPC server stopped"}), 500
+    if storage_init.failed:
+        return jsonify({"status": "storage not available", "error": str(storage_init.error)}), 500
+    return jsonify({"status": "alive"}), 200
+
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness check: fails while the process is draining, the storage is not usable yet or its gRPC server is not running."""
+    if draining.is_set():
+        return jsonify({"status": "draining"}), 503
+    if not storage_init.ready:
+        return jsonify({"status": "storage not ready", "error": str(storage_init.error or "")}), 503
+    if grpc_server.started and not grpc_server.running:
+        return jsonify({"status": "gRPC server stopped"}), 503
+    return jsonify({"status": "ready"}), 200
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Latency, byte and in-flight metrics of the HTTP routes, the gRPC methods and the storage (Prometheus format)."""
+    return metrics.metrics_response()
+
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """Hit, miss and eviction counters of the object cache (used for sizing it) and of the shared fetches."""
+    return jsonify({**object_cache.stats(), "single_flight": object_reads.stats()}), 200
+
+
 @app.route('/pcf-registry/search/<object_name>', methods=['GET'])
 def check_duplicate(object_name: str):
     """
-    Check if an object already exists in the minio bucket.
+    Check if an object already exists in the storage.
     Args:
         object_name: name of the file
 
@@ -230,56 +1792,256 @@ def check_duplicate(object_name: str):
         501: unexpected error
     """
 
-    if object_name is None or object_name == "":
-        return jsonify({"error": "Missing object name"}), 400
+    name_error = object_name_error(object_name)
+    if name_error is not None:
+        return jsonify({"error": name_error}), 400
 
     try:
-        minio_objects = minio_client.list_objects(bucket_name=MINIO_BUCKET)
-        for minio_object in minio_objects:
-            if minio_object.object_name == object_name:
-                return jsonify({"message": f"Duplicate '{object_name}'"}), 401
+        storage.stat(object_name)
+    except ObjectNotFound:
         return jsonify({"message": f"Object '{object_name}' does not exist yet."}), 200
-
     except Exception as e:
         return jsonify({"error": "Unexpected error", "message": str(e)}), 501
 
+    return jsonify({"message": f"Duplicate '{object_name}'"}), 401
+
 #----------------- End of HTTP Server ------------------#
 
-#starts the grpc server on port 50052
-def serve_grpc():
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+def grpc_server_options() -> list:
+    """Channel arguments of the gRPC server (message size, stream limits, keepalive and port sharing)."""
+    return [
+        ("grpc.max_send_message_length", GRPC_MAX_MESSAGE_LENGTH),
+        ("grpc.max_receive_message_length", GRPC_MAX_MESSAGE_LENGTH),
+        ("grpc.max_concurrent_streams", GRPC_MAX_CONCURRENT_STREAMS),
+        ("grpc.keepalive_time_ms", GRPC_KEEPALIVE_TIME_MS),
+        ("grpc.keepalive_timeout_ms", GRPC_KEEPALIVE_TIMEOUT_MS),
+        ("grpc.keepalive_permit_without_calls", 1),
+        ("grpc.http2.min_recv_ping_interval_without_data_ms", GRPC_KEEPALIVE_MIN_PING_INTERVAL_MS),
+        ("grpc.http2.max_ping_strikes", 2),
+        #lets the gRPC servers of all worker processes listen on the same port, the kernel balances the connections
+        ("grpc.so_reuseport", 1),
+    ]
+
+
+class StorageReadyInterceptor(grpc.aio.ServerInterceptor):
+    """Rejects calls with UNAVAILABLE until the storage has been prepared (see StorageInitializer)."""
+
+    async def intercept_service(self, continuation, handler_call_details):
+        handler = await continuation(handler_call_details)
+        if handler is None or storage_init.ready:
+            return handler
+
+        async def unavailable(request_or_iterator, context):
+            await context.abort(grpc.StatusCode.UNAVAILABLE, "Storage is not ready yet.")
+
+        async def unavailable_stream(request_or_iterator, context):
+            await unavailable(request_or_iterator, context)
+            #never reached, makes this an async generator like the streaming handlers it replaces
+            yield
+
+        if handler.response_streaming:
+            behavior = unavailable_stream
+            factory = grpc.stream_stream_rpc_method_handler if handler.request_streaming \
+                else grpc.unary_stream_rpc_method_handler
+        else:
+            behavior = unavailable
+            factory = grpc.stream_unary_rpc_method_handler if handler.request_streaming \
+                else grpc.unary_unary_rpc_method_handler
+        return factory(
+            behavior,
+            request_deserializer=handler.request_deserializer,
+            response_serializer=handler.response_serializer
+        )
+
+
+#limits and rate limits of the RPCs (see AdmissionInterceptor)
+grpc_admission = Admission(
+    GRPC_CONCURRENCY_LIMITS, ADMISSION_QUEUE_SIZE, ADMISSION_QUEUE_TIMEOUT,
+    RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST, ADMISSION_RETRY_AFTER
+)
+
+
+def grpc_client_key(context) -> str:
+    """The RATE_LIMIT_CLIENT_KEY metadata of a call, otherwise the address of the peer without its port."""
+    for key, value in context.invocation_metadata() or ():
+        if key == RATE_LIMIT_CLIENT_KEY:
+            return value
+    return context.peer().rsplit(":", 1)[0]
+
+
+class AdmissionInterceptor(grpc.aio.ServerInterceptor):
+    """
+    Admits calls through grpc_admission. Calls that are turned away end at once with RESOURCE_EXHAUSTED
+    and a grpc-retry-pushback-ms trailer; admitted calls keep their slot until their last message.
+    """
+
+    async def intercept_service(self, continuation, handler_call_details):
+        handler = await continuation(handler_call_details)
+        method = handler_call_details.method.rsplit("/", 1)[-1]
+        if handler is None or not grpc_admission.applies(method):
+            return handler
+
+        if handler.response_streaming:
+            behavior = handler.stream_stream if handler.request_streaming else handler.unary_stream
+
+            async def admitted(request_or_iterator, context):
+                slot = await self._admit(method, context)
+                try:
+                    async for response in behavior(request_or_iterator, context):
+                        yield response
+                finally:
+                    if slot is not None:
+                        slot.release()
+
+            factory = grpc.stream_stream_rpc_method_handler if handler.request_streaming \
+                else grpc.unary_stream_rpc_method_handler
+        else:
+            behavior = handler.stream_unary if handler.request_streaming else handler.unary_unary
+
+            async def admitted(request_or_iterator, context):
+                slot = await self._admit(method, context)
+                try:
+                    return await behavior(request_or_iterator, context)
+                finally:
+                    if slot is not None:
+                        slot.release()
+
+            factory = grpc.stream_unary_rpc_method_handler if handler.request_streaming \
+                else grpc.unary_unary_rpc_method_handler
+        return factory(
+            admitted,
+            request_deserializer=handler.request_deserializer,
+            response_serializer=handler.response_serializer
+        )
+
+    @staticmethod
+    async def _admit(method: str, context):
+        try:
+            return await grpc_admission.admit_async(method, grpc_client_key(context), context.time_remaining())
+        except Overloaded as e:
+            metrics.observe_admission_rejected("grpc", method, e.reason)
+            await context.abort(
+                grpc.StatusCode.RESOURCE_EXHAUSTED, f"Too many requests: {e}",
+                trailing_metadata=(("grpc-retry-pushback-ms", str(int(e.retry_after * 1000))),)
+            )
+
+
+def create_grpc_server() -> grpc.aio.Server:
+    server = grpc.aio.server(
+        interceptors=[metrics.GrpcMetricsInterceptor(), StorageReadyInterceptor(), AdmissionInterceptor()],
+        maximum_concurrent_rpcs=GRPC_MAX_CONCURRENT_RPCS,
+        options=grpc_server_options()
+    )
     json_streaming_pb2_grpc.add_JsonStreamingServiceServicer_to_server(JsonStreamingServicer(), server)
-    server.add_insecure_port('[::]:50052')
-    server.start()
-    print("gRPC server listening on port 50052...")
-    server.wait_for_termination()
+    server.add_insecure_port(f'[::]:{GRPC_PORT}')
+    return server
 
 
-def run_http():
+async def serve_grpc_async():
+    server = create_grpc_server()
+    await server.start()
+    logger.info("gRPC server listening", extra={"port": GRPC_PORT})
+    await server.wait_for_termination()
+
+
+#starts the asyncio grpc server on GRPC_PORT in the calling thread
+def serve_grpc():
+    asyncio.run(serve_grpc_async())
+
+
+class GrpcServerThread:
     """
-    Starts the Flask HTTP server.
-    For production, use a proper WSGI server like Gunicorn or uWSGI.
-    When running Flask in a thread, the reloader must be disabled.
+    Runs the asyncio gRPC server on its own event loop thread, so it can share
+    a process with the WSGI server (see gunicorn.conf.py).
     """
-    print("Flask server starting...")
-    # host='0.0.0.0' makes the server accessible from outside the container.
-    # use_reloader=False is CRITICAL for running in a non-main thread.
-    app.run(host='0.0.0.0', port=5002, debug=False, use_reloader=False)
 
+    def __init__(self):
+        self._thread = None
+        self._loop = None
+        self._server = None
+        self._started = threading.Event()
+        self._stopping = None
+        self._error = None
 
-if __name__ == '__main__':
-    # Running both servers in separate threads for development.
-    # For a production environment, it's better to run these as separate services/processes.
-    grpc_thread = threading.Thread(target=serve_grpc)
-    http_thread = threading.Thread(target=run_http)
+    @property
+    def started(self) -> bool:
+        return self._started.is_set() and self._error is None
+
+    @property
+    def running(self) -> bool:
+        return self.started and self._thread.is_alive()
+
+    def start(self, timeout: float = 30):
+        """Starts the server and waits until it is listening."""
+        self._thread = threading.Thread(target=self._run, name="grpc-server", daemon=True)
+        self._thread.start()
+        if not self._started.wait(timeout):
+            raise RuntimeError(f"gRPC server did not start within {timeout} seconds")
+        if self._error is not None:
+            raise RuntimeError(f"gRPC server could not start: {self._error}") from self._error
+
+    def _run(self):
+        try:
+            asyncio.run(self._serve())
+        except BaseException as e:
+            if not self._started.is_set():
+                self._error = e
+                self._started.set()
+            else:
+                logger.exception("gRPC server stopped unexpectedly")
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._server = create_grpc_server()
+        await self._server.start()
+        logger.info("gRPC server listening", extra={"port": GRPC_PORT, "pid": os.getpid()})
+        self._started.set()
+        await self._server.wait_for_termination()
+
+    def stop(self, grace: float):
+        """Stops accepting new calls and gives the running ones grace seconds; returns without waiting (see join)."""
+        if self._stopping is None and self.running:
+            self._stopping = asyncio.run_coroutine_threadsafe(self._server.stop(grace), self._loop)
 
-    grpc_thread.start()
-    http_thread.start()
+    def join(self, timeout: float = None):
+        if self._thread is not None:
+            self._thread.join(timeout)
 
-    print("HTTP and gRPC servers are running in separate threads.")
 
-    grpc_thread.join()
-    http_thread.join()
+#gRPC server of this process when it runs next to a WSGI server
+grpc_server = GrpcServerThread()
 
-    print("Servers have been terminated.")
 
+def drain():
+    """
+    Starts a graceful shutdown (on SIGTERM): the readiness check fails so no new
+    traffic is routed here, and the gRPC server stops taking new calls while the
+    running ones get SHUTDOWN_GRACE_SECONDS to finish.
+    """
+    if draining.is_set():
+        return
+    draining.set()
+    logger.info("Draining", extra={"pid": os.getpid(), "grace_seconds": SHUTDOWN_GRACE_SECONDS})
+    grpc_server.stop(SHUTDOWN_GRACE_SECONDS)
+
+
+def run_http():
+    """
+    Starts the Flask development server.
+    In production HTTP is served by gunicorn (see gunicorn.conf.py).
+    """
+    logger.info("Flask server starting", extra={"port": HTTP_PORT})
+    # host='0.0.0.0' makes the server accessible from outside the container.
+    app.run(host='0.0.0.0', port=HTTP_PORT, debug=False, use_reloader=False)
+
+
+if __name__ == '__main__':
+    # Development mode: one process with the Flask development server and the gRPC server.
+    # For production use the multi-process entry point: gunicorn app:app
+    grpc_server.start()
+    try:
+        run_http()
+    finally:
+        drain()
+        grpc_server.join(SHUTDOWN_GRACE_SECONDS + 5)
+        logger.info("Servers have been terminated")
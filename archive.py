@@ -0,0 +1,167 @@
+"""
+Tar archives of the registry, written and read as streams
+(GET /pcf-registry/_export and POST /pcf-registry/_import).
+
+Every member is a regular file named after its object that holds the
+(uncompressed) JSON document, so an archive can be unpacked with any tar. The
+SHA-256 digest of a document is kept in the PAX header DIGEST_HEADER and is
+checked on import. An archive may be compressed as a whole with gzip or zstd;
+imports recognize the compression by its magic bytes.
+"""
+import itertools
+import tarfile
+import time
+import zlib
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+import compression
+
+#PAX header of a member with the hex SHA-256 digest of its document
+DIGEST_HEADER = "PCF.sha256"
+
+#magic bytes of the compressed formats an import recognizes
+_MAGIC = {b"\x1f\x8b": "gzip", b"\x28\xb5\x2f\xfd": "zstd"}
+#errors of a compressed archive that is cut off or corrupt
+_DECODE_ERRORS = (zlib.error,) + ((compression.zstandard.ZstdError,) if compression.zstandard is not None else ())
+
+
+class ArchiveError(Exception):
+    """The archive is malformed, or a member does not match its header."""
+
+
+class ArchiveMember(NamedTuple):
+    name: str
+    size: int
+    #hex SHA-256 from the member header, None if the archive does not record it
+    digest: Optional[str]
+
+
+class ArchiveWriter:
+    """
+    Produces a tar archive piece by piece; the caller sends the bytes that
+    member() and close() yield. Output is collected into blocks of about
+    chunk_size bytes, and compressed if an encoding is given.
+
+    Arguments:
+        encoding: "" (plain tar), "gzip" or "zstd"
+        level: compression level, -1 for the default of the encoding
+        chunk_size: size of the blocks handed out
+    """
+
+    def __init__(self, encoding: str = "", level: int = -1, chunk_size: int = 256 * 1024):
+        self._compressor = compression.compressor(encoding, level) if encoding else None
+        self.chunk_size = chunk_size
+        #uncompressed bytes of the archive so far
+        self.size = 0
+        self._buffer = bytearray()
+
+    def _add(self, data) -> Iterator[bytes]:
+        self.size += len(data)
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        self._buffer += data
+        if len(self._buffer) >= self.chunk_size:
+            yield bytes(self._buffer)
+            self._buffer.clear()
+
+    def member(self, name: str, size: int, chunks: Iterable[bytes], mtime: Optional[float] = None,
+               digest: Optional[str] = None) -> Iterator[bytes]:
+        """
+        Writes one document of size bytes, given as chunks.
+
+        Raises:
+            ArchiveError: the chunks do not add up to size (the archive is unusable then)
+        """
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = int(time.time() if mtime is None else mtime)
+        info.mode = 0o644
+        if digest:
+            info.pax_headers = {DIGEST_HEADER: digest}
+        yield from self._add(info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape"))
+
+        written = 0
+        for chunk in chunks:
+            written += len(chunk)
+            if written > size:
+                break
+            yield from self._add(chunk)
+        if written != size:
+            raise ArchiveError(f"'{name}' changed while it was archived ({written} instead of {size} bytes)")
+        yield from self._add(bytes(-size % tarfile.BLOCKSIZE))
+
+    def close(self) -> Iterator[bytes]:
+        """Writes the end of the archive (two zero blocks, padded to a full tar record)."""
+        end = self.size + 2 * tarfile.BLOCKSIZE
+        yield from self._add(bytes(2 * tarfile.BLOCKSIZE + (-end % tarfile.RECORDSIZE)))
+        if self._compressor is not None:
+            self._buffer += self._compressor.flush()
+        if self._buffer:
+            yield bytes(self._buffer)
+            self._buffer.clear()
+
+
+class _ChunkReader:
+    """File-like read() over an iterator of chunks, which is what tarfile needs for a stream."""
+
+    def __init__(self, chunks: Iterator[bytes]):
+        self._chunks = chunks
+        self._chunk = b""
+        self._offset = 0
+
+    def read(self, size: int = -1) -> bytes:
+        pieces = []
+        while size != 0:
+            if self._offset == len(self._chunk):
+                self._chunk = next(self._chunks, b"")
+                self._offset = 0
+                if not self._chunk:
+                    break
+            end = len(self._chunk) if size < 0 else min(len(self._chunk), self._offset + size)
+            pieces.append(self._chunk[self._offset:end])
+            if size > 0:
+                size -= end - self._offset
+            self._offset = end
+        return b"".join(pieces)
+
+
+class _MemberReader:
+    """The data of a member; errors of the archive underneath surface as ArchiveError."""
+
+    def __init__(self, file):
+        self._file = file
+
+    def read(self, size: int = -1) -> bytes:
+        try:
+            return self._file.read(size)
+        except (tarfile.TarError, EOFError) + _DECODE_ERRORS as e:
+            raise ArchiveError(f"Malformed archive: {e}") from e
+
+
+def read_archive(read, chunk_size: int = 256 * 1024) -> Iterator[tuple]:
+    """
+    Walks through a (possibly compressed) tar archive that is read sequentially
+    with read(size), e.g. a request body. Yields (ArchiveMember, file) for every
+    regular file; the file has to be read before the next member is requested.
+    Directories are skipped.
+
+    Raises:
+        ArchiveError: the archive is malformed or uses an unsupported compression or member type
+    """
+    chunks = iter(lambda: read(chunk_size), b"")
+    first = next(chunks, b"")
+    encoding = next((name for magic, name in _MAGIC.items() if first.startswith(magic)), "")
+    if encoding and not compression.available(encoding):
+        raise ArchiveError(f"The archive is {encoding} compressed, which is not available here")
+    chunks = compression.decode_chunks(itertools.chain([first], chunks), encoding)
+    try:
+        with tarfile.open(fileobj=_ChunkReader(chunks), mode="r|") as tar:
+            for member in tar:
+                if member.isdir():
+                    continue
+                if not member.isfile():
+                    raise ArchiveError(f"'{member.name}' is not a regular file")
+                digest = member.pax_headers.get(DIGEST_HEADER)
+                yield ArchiveMember(member.name, member.size, digest), _MemberReader(tar.extractfile(member))
+    except (tarfile.TarError, EOFError) + _DECODE_ERRORS as e:
+        raise ArchiveError(f"Malformed archive: {e}") from e
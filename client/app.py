@@ -1,6 +1,10 @@
 import grpc
+import hashlib
 import json
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 # Import the generated gRPC classes
 import json_streaming_pb2
@@ -9,6 +13,18 @@ import json_streaming_pb2_grpc
 # --- Configuration ---
 SERVER_ADDRESS = "localhost:50052"
 CHUNK_SIZE = 4096  # 4KB
+# Resumable uploads: part size, parts sent at the same time and attempts per part
+PART_SIZE = 16 * 1024 * 1024  # 16MB, the server needs at least 5MB
+PART_CHUNK_SIZE = 1024 * 1024  # parts are sent in messages of this size
+PARALLEL_PARTS = 4
+PART_ATTEMPTS = 5
+# Parallel downloads: size of the ranges, ranges fetched at the same time and attempts per range
+RANGE_SIZE = 16 * 1024 * 1024  # 16MB
+PARALLEL_RANGES = 4
+RANGE_ATTEMPTS = 5
+# Errors after which a part is sent (or a range fetched) again
+RETRYABLE_CODES = {grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED,
+                   grpc.StatusCode.RESOURCE_EXHAUSTED, grpc.StatusCode.INTERNAL}
 
 def generate_chunks(file_path, filename):
     """
@@ -54,6 +70,117 @@ def upload_file(stub, file_path, object_name):
         print(f"An RPC error occurred during upload: {e.code()} - {e.details()}")
 
 
+def read_part(file_path, offset, length):
+    with open(file_path, 'rb') as f:
+        f.seek(offset)
+        return f.read(length)
+
+
+def part_chunks(session_id, part_number, data):
+    """The messages of one UploadPart call; only the first one needs the session and the part number."""
+    for offset in range(0, len(data), PART_CHUNK_SIZE):
+        if offset == 0:
+            yield json_streaming_pb2.UploadPartChunk(
+                session_id=session_id, part_number=part_number, data=data[:PART_CHUNK_SIZE]
+            )
+        else:
+            yield json_streaming_pb2.UploadPartChunk(data=data[offset:offset + PART_CHUNK_SIZE])
+
+
+def upload_part(stub, session, file_path, part_number):
+    """
+    Sends one part, again after retryable errors (with exponential backoff) or if
+    the MD5 the server reports does not match. Returns True once the part is stored.
+    """
+    offset = (part_number - 1) * session.part_size
+    data = read_part(file_path, offset, min(session.part_size, session.size - offset))
+    md5 = hashlib.md5(data).hexdigest()
+    delay = 0.5
+    for attempt in range(1, PART_ATTEMPTS + 1):
+        try:
+            response = stub.UploadPart(part_chunks(session.session_id, part_number, data))
+            if response.etag == md5:
+                return True
+            print(f"Part {part_number} arrived damaged (attempt {attempt}), sending it again.")
+        except grpc.RpcError as e:
+            if e.code() not in RETRYABLE_CODES:
+                print(f"Part {part_number} failed: {e.code()} - {e.details()}")
+                return False
+            print(f"Part {part_number} failed (attempt {attempt}): {e.code()} - {e.details()}")
+        time.sleep(delay)
+        delay = min(delay * 2, 10)
+    return False
+
+
+def resume_session(stub, file_path, object_name, state_path):
+    """Returns the session an earlier run of upload_file_resumable left for this file, None if there is none (anymore)."""
+    if not os.path.exists(state_path):
+        return None
+    with open(state_path) as f:
+        state = json.load(f)
+    stat = os.stat(file_path)
+    if (state.get("name"), state.get("size"), state.get("mtime")) != (object_name, stat.st_size, stat.st_mtime):
+        return None
+    try:
+        return stub.GetUploadSession(json_streaming_pb2.UploadSessionRequest(session_id=state["session_id"]))
+    except grpc.RpcError as e:
+        if e.code() != grpc.StatusCode.NOT_FOUND:
+            raise
+        return None
+
+
+def upload_file_resumable(stub, file_path, object_name, part_size=PART_SIZE, parallel=PARALLEL_PARTS):
+    """
+    Uploads a (large) file with an upload session: the file is sent in numbered
+    parts, several at a time. The session id is kept in '<file>.upload-session',
+    so if the upload is interrupted, running this again only sends the parts the
+    server does not have yet. Returns the digest of the stored document, None on errors.
+    """
+    print(f"\n--- Uploading {object_name} in parts ---")
+    if not os.path.exists(file_path):
+        print(f"File not found at: {file_path}")
+        return None
+    state_path = file_path + ".upload-session"
+
+    try:
+        session = resume_session(stub, file_path, object_name, state_path)
+        if session is None:
+            size = os.path.getsize(file_path)
+            session = stub.CreateUploadSession(
+                json_streaming_pb2.CreateUploadSessionRequest(name=object_name, size=size, part_size=part_size)
+            )
+            stat = os.stat(file_path)
+            with open(state_path, 'w') as f:
+                json.dump({"session_id": session.session_id, "name": object_name,
+                           "size": stat.st_size, "mtime": stat.st_mtime}, f)
+            stored = set()
+        else:
+            # Only parts whose MD5 matches the local data count as uploaded
+            stored = {
+                part.number for part in session.parts
+                if part.etag == hashlib.md5(read_part(file_path, (part.number - 1) * session.part_size, part.size)).hexdigest()
+            }
+            print(f"Resuming session {session.session_id}: {len(stored)} of {session.part_count} parts are uploaded.")
+
+        missing = [number for number in range(1, session.part_count + 1) if number not in stored]
+        with ThreadPoolExecutor(max_workers=parallel) as executor:
+            results = list(executor.map(lambda number: upload_part(stub, session, file_path, number), missing))
+        if not all(results):
+            print(f"{results.count(False)} parts could not be uploaded, run the upload again to resume.")
+            return None
+
+        response = stub.CompleteUploadSession(json_streaming_pb2.UploadSessionRequest(session_id=session.session_id))
+    except grpc.RpcError as e:
+        print(f"An RPC error occurred during the upload: {e.code()} - {e.details()}")
+        if e.code() == grpc.StatusCode.INVALID_ARGUMENT and os.path.exists(state_path):
+            os.remove(state_path)
+        return None
+
+    os.remove(state_path)
+    print(f"gRPC response: {response.message} (digest {response.digest})")
+    return response.digest
+
+
 def download_file(stub, object_id, save_path):
     """
     Downloads a file from the server using server-side streaming RPC.
@@ -82,6 +209,184 @@ def download_file(stub, object_id, save_path):
             os.remove(save_path)
             
 
+def download_range(stub, object_id, etag, part_path, offset, length):
+    """
+    Fetches the bytes [offset, offset + length) of an object into the same place
+    of part_path. After a retryable error (with exponential backoff) only the rest
+    of the range is requested. Returns True once the whole range is written.
+    """
+    received = 0
+    delay = 0.5
+    for attempt in range(1, RANGE_ATTEMPTS + 1):
+        request = json_streaming_pb2.GetRequest(
+            message=object_id, offset=offset + received, length=length - received, etag=etag
+        )
+        try:
+            with open(part_path, 'r+b') as f:
+                f.seek(offset + received)
+                for chunk in stub.GetJson(request):
+                    f.write(chunk.data)
+                    received += len(chunk.data)
+            if received == length:
+                return True
+            print(f"Range at {offset} ended after {received} of {length} bytes (attempt {attempt}).")
+        except grpc.RpcError as e:
+            if e.code() not in RETRYABLE_CODES:
+                print(f"Range at {offset} failed: {e.code()} - {e.details()}")
+                return False
+            print(f"Range at {offset} failed (attempt {attempt}): {e.code()} - {e.details()}")
+        time.sleep(delay)
+        delay = min(delay * 2, 10)
+    return False
+
+
+def download_file_parallel(stub, object_id, save_path, range_size=RANGE_SIZE, parallel=PARALLEL_RANGES):
+    """
+    Downloads a (large) object in ranges of range_size bytes, several at a time.
+    All ranges are requested with the ETag Stat returned, so they come from the
+    same version of the object. The data goes to '<save_path>.part' and the ranges
+    that are complete to '<save_path>.download'; running this again after an
+    interruption only fetches the missing ranges (unless the object changed).
+    Returns True once the file is complete and matches the digest of the object.
+    """
+    print(f"\n--- Downloading {object_id} in ranges ---")
+    part_path = save_path + ".part"
+    state_path = save_path + ".download"
+
+    try:
+        stat = stub.Stat(json_streaming_pb2.StatRequest(name=object_id))
+    except grpc.RpcError as e:
+        print(f"An RPC error occurred during download: {e.code()} - {e.details()}")
+        return False
+
+    done = set()
+    if os.path.exists(state_path) and os.path.exists(part_path):
+        with open(state_path) as f:
+            state = json.load(f)
+        if (state.get("name"), state.get("etag"), state.get("size"), state.get("range_size")) == \
+                (object_id, stat.etag, stat.size, range_size):
+            done = set(state["done"])
+            print(f"Resuming: {len(done)} ranges are downloaded.")
+    if not done:
+        with open(part_path, 'wb') as f:
+            f.truncate(stat.size)
+    lock = threading.Lock()
+
+    def fetch(index):
+        offset = index * range_size
+        if not download_range(stub, object_id, stat.etag, part_path, offset, min(range_size, stat.size - offset)):
+            return False
+        with lock:
+            done.add(index)
+            with open(state_path, 'w') as f:
+                json.dump({"name": object_id, "etag": stat.etag, "size": stat.size,
+                           "range_size": range_size, "done": sorted(done)}, f)
+        return True
+
+    missing = [index for index in range(-(-stat.size // range_size)) if index not in done]
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        results = list(executor.map(fetch, missing))
+    if not all(results):
+        print(f"{results.count(False)} ranges could not be downloaded, run the download again to resume.")
+        return False
+
+    if stat.digest:
+        sha256 = hashlib.sha256()
+        with open(part_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                sha256.update(block)
+        if sha256.hexdigest() != stat.digest:
+            print("The downloaded file does not match the digest of the object.")
+            os.remove(part_path)
+            os.remove(state_path)
+            return False
+    os.replace(part_path, save_path)
+    if os.path.exists(state_path):
+        os.remove(state_path)
+    print(f"File downloaded successfully and saved to '{save_path}'")
+    return True
+
+
+def get_json_values(stub, object_id, pointers):
+    """
+    Fetches only some values of a stored document, selected by JSON Pointers
+    (e.g. "/header/commitment"). The server stops reading the document once it
+    has found them. Returns a dict keyed by pointer, None on errors.
+    """
+    print(f"\n--- Fetching {', '.join(pointers)} of {object_id} ---")
+    request = json_streaming_pb2.GetRequest(message=object_id, pointers=pointers)
+    try:
+        data = b"".join(chunk.data for chunk in stub.GetJson(request))
+    except grpc.RpcError as e:
+        print(f"An RPC error occurred while fetching values: {e.code()} - {e.details()}")
+        return None
+    values = json.loads(data)
+    return {pointers[0]: values} if len(pointers) == 1 else values
+
+
+def local_path(save_dir, name):
+    """
+    The file an object is saved to below save_dir; names with "/" get subdirectories.
+
+    Raises:
+        ValueError: the name leads outside of save_dir (e.g. "../x" or an absolute path)
+    """
+    root = os.path.realpath(save_dir)
+    path = os.path.realpath(os.path.join(root, name))
+    if path == root or os.path.commonpath([root, path]) != root:
+        raise ValueError(f"'{name}' is outside of {save_dir}")
+    return path
+
+
+def batch_download_files(stub, object_ids, save_dir):
+    """
+    Downloads several files with a single BatchGet call. The chunks of the
+    objects may interleave, so every object is written to its own file.
+    An object that can't be saved is reported and skipped, the others go on.
+    """
+    print(f"\n--- Batch downloading {len(object_ids)} objects ---")
+    os.makedirs(save_dir, exist_ok=True)
+    request = json_streaming_pb2.BatchGetRequest(names=object_ids)
+
+    open_files = {}
+    #objects whose file failed, their remaining chunks are dropped
+    skipped = set()
+    try:
+        for chunk in stub.BatchGet(request):
+            if chunk.name in skipped:
+                if chunk.last:
+                    skipped.discard(chunk.name)
+                continue
+            try:
+                if chunk.name not in open_files:
+                    path = local_path(save_dir, chunk.name)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    open_files[chunk.name] = open(path, "wb")
+                open_files[chunk.name].write(chunk.data)
+            except (OSError, ValueError) as e:
+                print(f"'{chunk.name}' can't be saved: {e}")
+                failed = open_files.pop(chunk.name, None)
+                if failed is not None:
+                    failed.close()
+                    os.remove(failed.name)
+                if not chunk.last:
+                    skipped.add(chunk.name)
+                continue
+            if chunk.last:
+                saved = open_files.pop(chunk.name)
+                saved.close()
+                if chunk.success:
+                    print(f"'{chunk.name}' downloaded successfully.")
+                else:
+                    print(f"'{chunk.name}' failed: {chunk.message}")
+                    os.remove(saved.name)
+    except grpc.RpcError as e:
+        print(f"An RPC error occurred during batch download: {e.code()} - {e.details()}")
+    finally:
+        for f in open_files.values():
+            f.close()
+
+
 def create_sample_file(file_path):
     """Creates a sample JSON file for testing."""
     if not os.path.exists(file_path):
@@ -120,9 +425,26 @@ if __name__ == '__main__':
         # --- Test Case 3: Download a non-existent file (to test error handling) ---
         download_file(stub, object_id="non_existent_file.json", save_path="failed_download.json")
 
+        # --- Test Case 4: Fetch single values of the file ---
+        print(get_json_values(stub, object_id=object_to_stream, pointers=["/id", "/data/9999"]))
+
+        # --- Test Case 5: Download an existing and a non-existent file in one batch ---
+        batch_dir = "batch_download"
+        batch_download_files(stub, object_ids=[object_to_stream, "non_existent_file.json"], save_dir=batch_dir)
+
+        # --- Test Case 6: Upload the file in parts with an upload session ---
+        upload_file_resumable(stub, file_path=sample_filename, object_name="my_resumable_file.json")
+
+        # --- Test Case 7: Download the file in parallel ranges ---
+        download_file_parallel(stub, object_id="my_resumable_file.json", save_path=download_path, range_size=64 * 1024)
+
     # Clean up created files
     if os.path.exists(sample_filename):
         os.remove(sample_filename)
     if os.path.exists(download_path):
         os.remove(download_path)
+    if os.path.exists(batch_dir):
+        for name in os.listdir(batch_dir):
+            os.remove(os.path.join(batch_dir, name))
+        os.rmdir(batch_dir)
 
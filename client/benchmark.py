@@ -0,0 +1,522 @@
+"""
+Benchmark and load test of the PCF registry.
+
+Sweeps object size, concurrency and chunk size over the HTTP routes
+(POST/GET /pcf-registry/<name>) and the gRPC RPCs (UploadJson/GetJson) and
+writes one JSON line per case with throughput, latency and time-to-first-byte
+percentiles and the resident memory (RSS) of the server.
+
+The server is either started by the benchmark (../app.py in a child process,
+restarted for every chunk size so the server side chunking matches) or an
+already running one is used. Examples, run from the client directory:
+
+    # in-process fake storage, nothing else needed
+    python benchmark.py --spawn-server memory --sizes 1KB,1MB,64MB --concurrency 1,8 --output results.jsonl
+
+    # against a MinIO compatible stand-in (e.g. `minio server /tmp/data` or `moto_server -p 9000`)
+    python benchmark.py --spawn-server minio --server-env MINIO_ENDPOINT=localhost:9000
+
+    # an already running server, RSS is read from /proc if its pid is given
+    python benchmark.py --server-pid 1234
+
+    # compare with an earlier run, exits with 1 if a case got slower than the tolerance
+    python benchmark.py --spawn-server memory --baseline results.jsonl --tolerance 0.15
+
+Reads of objects up to CACHE_MAX_ENTRY_BYTES are served from the server cache
+after the first request; pass --server-env CACHE_MAX_BYTES=0 to measure the storage.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent import futures
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import grpc
+
+# Import the generated gRPC classes
+import json_streaming_pb2
+import json_streaming_pb2_grpc
+from app import CHUNK_SIZE, SERVER_ADDRESS
+
+# --- Configuration ---
+HTTP_ADDRESS = "localhost:5002"
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+OPERATIONS = ("http-post", "http-get", "grpc-upload", "grpc-get")
+SIZE_UNITS = (("GB", 1024 ** 3), ("MB", 1024 ** 2), ("KB", 1024), ("B", 1))
+#chunk size used to upload the objects read by the download cases
+PRELOAD_CHUNK_SIZE = 1024 * 1024
+#largest message the client accepts, the server never sends more than its GRPC_MAX_MESSAGE_LENGTH
+GRPC_MAX_MESSAGE_LENGTH = 64 * 1024 * 1024
+
+
+class Sample(NamedTuple):
+    """Outcome of a single request, times in seconds."""
+    latency: float
+    ttfb: float
+    nbytes: int
+    error: Optional[str] = None
+
+
+def parse_size(text: str) -> int:
+    """Parses sizes like "512", "4KB" or "1.5MB" (binary units)."""
+    text = text.strip().upper()
+    for unit, factor in SIZE_UNITS:
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * factor)
+    return int(text)
+
+
+def parse_list(text: str, parse: Callable = int) -> list:
+    return [parse(item) for item in text.split(",") if item.strip()]
+
+
+def make_payload(size: int, kind: str, seed: int) -> bytes:
+    """
+    Returns a JSON document of (at least 12 and otherwise exactly) size bytes.
+
+    "repetitive" documents compress extremely well, "random" ones (hex digits
+    from a seeded generator, so runs are reproducible) hardly at all. The
+    spacing matches json.dumps, so the HTTP POST stores the same bytes.
+    """
+    head, tail = b'{"data": "', b'"}'
+    fill = max(0, size - len(head) - len(tail))
+    if kind == "random":
+        body = random.Random(seed).randbytes((fill + 1) // 2).hex().encode()[:fill]
+    else:
+        body = b"x" * fill
+    return head + body + tail
+
+
+def percentiles(values: List[float]) -> Optional[Dict[str, float]]:
+    """p50/p95/p99/max of the values in milliseconds (linear interpolation between ranks)."""
+    if not values:
+        return None
+
+    ordered = sorted(values)
+
+    def at(p: float) -> float:
+        rank = (len(ordered) - 1) * p / 100
+        low = int(rank)
+        high = min(low + 1, len(ordered) - 1)
+        return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+    return {
+        "p50": round(at(50) * 1000, 3),
+        "p95": round(at(95) * 1000, 3),
+        "p99": round(at(99) * 1000, 3),
+        "max": round(ordered[-1] * 1000, 3),
+    }
+
+
+# ------------------ Server process and memory -----------------------#
+
+def read_rss(pid: Optional[int]) -> Optional[int]:
+    """Resident set size of a process in bytes (Linux only, None elsewhere)."""
+    if pid is None:
+        return None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class RssSampler:
+    """Samples the RSS of a process in the background to find its peak during a case."""
+
+    def __init__(self, pid: Optional[int], interval: float = 0.05):
+        self.pid = pid
+        self.interval = interval
+        self.before = read_rss(pid)
+        self.peak = self.before
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            rss = read_rss(self.pid)
+            if rss is not None and (self.peak is None or rss > self.peak):
+                self.peak = rss
+
+    def __enter__(self):
+        if self.pid is not None:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def result(self) -> dict:
+        after = read_rss(self.pid)
+        peak = max((value for value in (self.peak, after) if value is not None), default=None)
+        return {"before": self.before, "after": after, "peak": peak}
+
+
+class ServerProcess:
+    """Runs the registry (../app.py) in a child process with the given storage and settings."""
+
+    def __init__(self, storage: str, env: Dict[str, str], log_path: str):
+        self.storage = storage
+        self.env = env
+        self.log_path = log_path
+        self.process = None
+        self._storage_root = None
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self.process.pid if self.process is not None else None
+
+    def start(self, timeout: float = 60):
+        env = dict(os.environ, STORAGE_BACKEND=self.storage, PYTHONUNBUFFERED="1")
+        if self.storage == "filesystem":
+            self._storage_root = tempfile.mkdtemp(prefix="pcf-benchmark-")
+            env["STORAGE_ROOT"] = self._storage_root
+        env.update(self.env)
+
+        log = open(self.log_path, "ab")
+        self.process = subprocess.Popen(
+            [sys.executable, "app.py"], cwd=REPOSITORY_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+        log.close()
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Server exited with code {self.process.returncode}, see {self.log_path}")
+            if self._responds():
+                return
+            time.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f"Server did not come up within {timeout} seconds, see {self.log_path}")
+
+    @staticmethod
+    def _responds() -> bool:
+        try:
+            connection = http.client.HTTPConnection(HTTP_ADDRESS, timeout=1)
+            #/ready answers 200 only once the storage of the server is usable
+            connection.request("GET", "/ready")
+            response = connection.getresponse()
+            response.read()
+            connection.close()
+            if response.status != 200:
+                return False
+            with grpc.insecure_channel(SERVER_ADDRESS) as channel:
+                grpc.channel_ready_future(channel).result(timeout=1)
+            return True
+        except (OSError, grpc.FutureTimeoutError):
+            return False
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.process = None
+        if self._storage_root is not None:
+            shutil.rmtree(self._storage_root, ignore_errors=True)
+            self._storage_root = None
+
+
+# ------------------ Clients -----------------------------------------#
+
+class HttpClient:
+    """Keeps one HTTP connection per worker thread."""
+
+    def __init__(self, address: str):
+        self.address = address
+        self._local = threading.local()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = http.client.HTTPConnection(self.address, timeout=300)
+        return connection
+
+    def request(self, method: str, path: str, body: bytes = None, headers: dict = None,
+                read_size: int = CHUNK_SIZE) -> Tuple[float, int]:
+        """Sends a request and reads the whole response; returns the time of the first response byte and the body size."""
+        connection = self._connection()
+        try:
+            connection.request(method, path, body=body, headers=headers or {})
+            response = connection.getresponse()
+            first_byte_at = time.perf_counter()
+            nbytes = 0
+            while True:
+                block = response.read(read_size)
+                if not block:
+                    break
+                nbytes += len(block)
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            self._local.connection = None
+            raise
+
+        if response.status >= 400:
+            raise RuntimeError(f"HTTP {response.status} for {method} {path}")
+        return first_byte_at, nbytes
+
+
+class Clients:
+    """The HTTP client and the gRPC stub shared by the workers of a case."""
+
+    def __init__(self, http_address: str, grpc_address: str):
+        self.http = HttpClient(http_address)
+        self.channel = grpc.insecure_channel(grpc_address, options=[
+            ("grpc.max_receive_message_length", GRPC_MAX_MESSAGE_LENGTH),
+            ("grpc.max_send_message_length", GRPC_MAX_MESSAGE_LENGTH),
+        ])
+        self.stub = json_streaming_pb2_grpc.JsonStreamingServiceStub(self.channel)
+
+    def close(self):
+        self.channel.close()
+
+
+def http_post(clients: Clients, name: str, payload: bytes, chunk_size: int) -> Tuple[float, int]:
+    first_byte_at, _ = clients.http.request(
+        "POST", f"/pcf-registry/{name}", body=payload, headers={"Content-Type": "application/json"}
+    )
+    return first_byte_at, len(payload)
+
+
+def http_get(clients: Clients, name: str, payload: bytes, chunk_size: int) -> Tuple[float, int]:
+    first_byte_at, nbytes = clients.http.request("GET", f"/pcf-registry/{name}", read_size=chunk_size)
+    if nbytes != len(payload):
+        raise RuntimeError(f"Received {nbytes} of {len(payload)} bytes")
+    return first_byte_at, nbytes
+
+
+def grpc_upload(clients: Clients, name: str, payload: bytes, chunk_size: int) -> Tuple[float, int]:
+    view = memoryview(payload)
+
+    def chunks():
+        for offset in range(0, len(payload), chunk_size):
+            yield json_streaming_pb2.JsonChunk(data=bytes(view[offset:offset + chunk_size]))
+
+    response = clients.stub.UploadJson(chunks(), metadata=[("filename", name)])
+    if not response.success:
+        raise RuntimeError(response.message)
+    return time.perf_counter(), len(payload)
+
+
+def grpc_get(clients: Clients, name: str, payload: bytes, chunk_size: int) -> Tuple[float, int]:
+    first_byte_at = None
+    nbytes = 0
+    for chunk in clients.stub.GetJson(json_streaming_pb2.GetRequest(message=name)):
+        if first_byte_at is None:
+            first_byte_at = time.perf_counter()
+        nbytes += len(chunk.data)
+    if nbytes != len(payload):
+        raise RuntimeError(f"Received {nbytes} of {len(payload)} bytes")
+    return first_byte_at or time.perf_counter(), nbytes
+
+
+OPERATION_FUNCTIONS = {
+    "http-post": http_post,
+    "http-get": http_get,
+    "grpc-upload": grpc_upload,
+    "grpc-get": grpc_get,
+}
+
+
+# ------------------ Cases -------------------------------------------#
+
+def timed(operation: Callable, clients: Clients, name: str, payload: bytes, chunk_size: int) -> Sample:
+    start = time.perf_counter()
+    try:
+        first_byte_at, nbytes = operation(clients, name, payload, chunk_size)
+    except (grpc.RpcError, RuntimeError, OSError, http.client.HTTPException) as e:
+        return Sample(time.perf_counter() - start, 0.0, 0, error=str(e) or type(e).__name__)
+    return Sample(time.perf_counter() - start, first_byte_at - start, nbytes)
+
+
+def run_case(clients: Clients, operation: str, size: int, concurrency: int, chunk_size: int,
+             args: argparse.Namespace, server_pid: Optional[int]) -> dict:
+    """
+    Runs one case: size/concurrency/chunk size for one operation.
+
+    Every worker has its own object (uploaded beforehand for the reads). The
+    number of requests is args.requests, lowered so that a case moves at most
+    args.max_bytes_per_case bytes, but at least one request per worker.
+    """
+    payload = make_payload(size, args.payload, args.seed)
+    names = [f"benchmark-{uuid.uuid4().hex[:12]}-{i}" for i in range(concurrency)]
+    function = OPERATION_FUNCTIONS[operation]
+    count = max(concurrency, min(args.requests, args.max_bytes_per_case // max(len(payload), 1)))
+
+    try:
+        if operation in ("http-get", "grpc-get"):
+            for name in names:
+                grpc_upload(clients, name, payload, PRELOAD_CHUNK_SIZE)
+
+        with futures.ThreadPoolExecutor(max_workers=concurrency) as pool:
+            warmup = [pool.submit(timed, function, clients, names[i % concurrency], payload, chunk_size)
+                      for i in range(args.warmup)]
+            futures.wait(warmup)
+
+            with RssSampler(server_pid) as sampler:
+                start = time.perf_counter()
+                samples = list(pool.map(
+                    lambda i: timed(function, clients, names[i % concurrency], payload, chunk_size), range(count)
+                ))
+                seconds = time.perf_counter() - start
+            rss = sampler.result()
+    finally:
+        for name in names:
+            try:
+                clients.http.request("DELETE", f"/pcf-registry/{name}")
+            except (RuntimeError, OSError, http.client.HTTPException):
+                pass
+
+    succeeded = [sample for sample in samples if sample.error is None]
+    errors = [sample.error for sample in samples if sample.error is not None]
+    transferred = sum(sample.nbytes for sample in succeeded)
+    return {
+        "operation": operation,
+        "size": len(payload),
+        "concurrency": concurrency,
+        "chunk_size": chunk_size,
+        "payload": args.payload,
+        "storage": args.spawn_server or "external",
+        "requests": len(samples),
+        "errors": len(errors),
+        "error_sample": errors[0] if errors else None,
+        "seconds": round(seconds, 6),
+        "throughput_mb_s": round(transferred / seconds / 1024 ** 2, 3) if seconds > 0 else None,
+        "requests_per_s": round(len(succeeded) / seconds, 3) if seconds > 0 else None,
+        "latency_ms": percentiles([sample.latency for sample in succeeded]),
+        "ttfb_ms": percentiles([sample.ttfb for sample in succeeded]),
+        "server_rss_bytes": rss,
+        "timestamp": time.time(),
+    }
+
+
+def case_key(result: dict) -> tuple:
+    return result["operation"], result["size"], result["concurrency"], result["chunk_size"], result["payload"]
+
+
+def find_regressions(results: List[dict], baseline_path: str, tolerance: float) -> List[str]:
+    """Compares throughput and p95 latency with the matching cases of an earlier run."""
+    with open(baseline_path) as f:
+        baseline = {case_key(result): result for result in map(json.loads, filter(str.strip, f))}
+
+    regressions = []
+    for result in results:
+        before = baseline.get(case_key(result))
+        if before is None:
+            continue
+        label = "{} size={} concurrency={} chunk={}".format(*case_key(result)[:4])
+        if result["errors"] > before["errors"]:
+            regressions.append(f"{label}: {result['errors']} errors (baseline {before['errors']})")
+        if before["throughput_mb_s"] and (result["throughput_mb_s"] or 0) < before["throughput_mb_s"] * (1 - tolerance):
+            regressions.append(f"{label}: {result['throughput_mb_s']} MB/s (baseline {before['throughput_mb_s']})")
+        if before["latency_ms"] and result["latency_ms"] \
+                and result["latency_ms"]["p95"] > before["latency_ms"]["p95"] * (1 + tolerance):
+            regressions.append(f"{label}: p95 {result['latency_ms']['p95']} ms (baseline {before['latency_ms']['p95']})")
+    return regressions
+
+
+def parse_arguments(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the HTTP routes and gRPC RPCs of the PCF registry.")
+    parser.add_argument("--operations", default=",".join(OPERATIONS),
+                        help=f"comma separated subset of {', '.join(OPERATIONS)}")
+    parser.add_argument("--sizes", default="1KB,64KB,1MB,16MB", help="object sizes, e.g. 1KB,1MB,500MB")
+    parser.add_argument("--concurrency", default="1,8", help="parallel requests")
+    parser.add_argument("--chunk-sizes", default="64KB,1MB", help="upload chunk / read block sizes")
+    parser.add_argument("--requests", type=int, default=50, help="requests per case (at most)")
+    parser.add_argument("--max-bytes-per-case", type=parse_size, default=parse_size("2GB"),
+                        help="limits the requests of large objects")
+    parser.add_argument("--warmup", type=int, default=2, help="unmeasured requests before each case")
+    parser.add_argument("--payload", choices=("repetitive", "random"), default="random")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random payload")
+    parser.add_argument("--spawn-server", choices=("memory", "filesystem", "minio"),
+                        help="start ../app.py with this storage backend instead of using a running server")
+    parser.add_argument("--server-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra environment of the spawned server, e.g. MINIO_ENDPOINT=localhost:9000")
+    parser.add_argument("--server-log", default=os.devnull, help="where the output of the spawned server goes")
+    parser.add_argument("--server-pid", type=int, help="pid of a running server to report its RSS")
+    parser.add_argument("--http-address", default=HTTP_ADDRESS)
+    parser.add_argument("--grpc-address", default=SERVER_ADDRESS)
+    parser.add_argument("--output", help="JSON lines file for the results (default: stdout)")
+    parser.add_argument("--baseline", help="results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed relative slowdown against the baseline")
+    args = parser.parse_args(argv)
+
+    args.operations = parse_list(args.operations, str.strip)
+    unknown = set(args.operations) - set(OPERATIONS)
+    if unknown:
+        parser.error(f"unknown operations: {', '.join(sorted(unknown))}")
+    args.sizes = parse_list(args.sizes, parse_size)
+    args.concurrency = parse_list(args.concurrency)
+    args.chunk_sizes = parse_list(args.chunk_sizes, parse_size)
+    args.server_env = dict(item.split("=", 1) for item in args.server_env)
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_arguments(argv)
+    output = open(args.output, "w") if args.output else sys.stdout
+    results = []
+
+    try:
+        for chunk_size in args.chunk_sizes:
+            server = None
+            server_pid = args.server_pid
+            if args.spawn_server:
+                #the server streams downloads with the same chunk size the client uses for uploads
+                env = {"GRPC_CHUNK_SIZE": str(chunk_size), "HTTP_CHUNK_SIZE": str(chunk_size), **args.server_env}
+                server = ServerProcess(args.spawn_server, env, args.server_log)
+                server.start()
+                server_pid = server.pid
+
+            clients = Clients(args.http_address, args.grpc_address)
+            try:
+                for size in args.sizes:
+                    for concurrency in args.concurrency:
+                        for operation in args.operations:
+                            result = run_case(clients, operation, size, concurrency, chunk_size, args, server_pid)
+                            results.append(result)
+                            output.write(json.dumps(result) + "\n")
+                            output.flush()
+                            latency = result["latency_ms"] or {}
+                            print(
+                                f"{operation:<12} size={size:<10} concurrency={concurrency:<4} chunk={chunk_size:<9}"
+                                f" {result['throughput_mb_s']} MB/s p50={latency.get('p50')} ms"
+                                f" p99={latency.get('p99')} ms errors={result['errors']}",
+                                file=sys.stderr
+                            )
+            finally:
+                clients.close()
+                if server is not None:
+                    server.stop()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    if args.baseline:
+        regressions = find_regressions(results, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
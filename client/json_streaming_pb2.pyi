@@ -1,6 +1,8 @@
+from google.protobuf.internal import containers as _containers
 from google.protobuf import descriptor as _descriptor
 from google.protobuf import message as _message
-from typing import ClassVar as _ClassVar, Optional as _Optional
+from collections.abc import Iterable as _Iterable, Mapping as _Mapping
+from typing import ClassVar as _ClassVar, Optional as _Optional, Union as _Union
 
 DESCRIPTOR: _descriptor.FileDescriptor
 
@@ -11,15 +13,129 @@ class JsonChunk(_message.Message):
     def __init__(self, data: _Optional[bytes] = ...) -> None: ...
 
 class UploadResponse(_message.Message):
-    __slots__ = ("success", "message")
+    __slots__ = ("success", "message", "digest")
     SUCCESS_FIELD_NUMBER: _ClassVar[int]
     MESSAGE_FIELD_NUMBER: _ClassVar[int]
+    DIGEST_FIELD_NUMBER: _ClassVar[int]
     success: bool
     message: str
-    def __init__(self, success: bool = ..., message: _Optional[str] = ...) -> None: ...
+    digest: str
+    def __init__(self, success: bool = ..., message: _Optional[str] = ..., digest: _Optional[str] = ...) -> None: ...
 
 class GetRequest(_message.Message):
-    __slots__ = ("message",)
+    __slots__ = ("message", "pointers", "offset", "length", "etag")
     MESSAGE_FIELD_NUMBER: _ClassVar[int]
+    POINTERS_FIELD_NUMBER: _ClassVar[int]
+    OFFSET_FIELD_NUMBER: _ClassVar[int]
+    LENGTH_FIELD_NUMBER: _ClassVar[int]
+    ETAG_FIELD_NUMBER: _ClassVar[int]
     message: str
-    def __init__(self, message: _Optional[str] = ...) -> None: ...
+    pointers: _containers.RepeatedScalarFieldContainer[str]
+    offset: int
+    length: int
+    etag: str
+    def __init__(self, message: _Optional[str] = ..., pointers: _Optional[_Iterable[str]] = ..., offset: _Optional[int] = ..., length: _Optional[int] = ..., etag: _Optional[str] = ...) -> None: ...
+
+class StatRequest(_message.Message):
+    __slots__ = ("name",)
+    NAME_FIELD_NUMBER: _ClassVar[int]
+    name: str
+    def __init__(self, name: _Optional[str] = ...) -> None: ...
+
+class ObjectStat(_message.Message):
+    __slots__ = ("name", "size", "etag", "digest", "content_type")
+    NAME_FIELD_NUMBER: _ClassVar[int]
+    SIZE_FIELD_NUMBER: _ClassVar[int]
+    ETAG_FIELD_NUMBER: _ClassVar[int]
+    DIGEST_FIELD_NUMBER: _ClassVar[int]
+    CONTENT_TYPE_FIELD_NUMBER: _ClassVar[int]
+    name: str
+    size: int
+    etag: str
+    digest: str
+    content_type: str
+    def __init__(self, name: _Optional[str] = ..., size: _Optional[int] = ..., etag: _Optional[str] = ..., digest: _Optional[str] = ..., content_type: _Optional[str] = ...) -> None: ...
+
+class BatchGetRequest(_message.Message):
+    __slots__ = ("names",)
+    NAMES_FIELD_NUMBER: _ClassVar[int]
+    names: _containers.RepeatedScalarFieldContainer[str]
+    def __init__(self, names: _Optional[_Iterable[str]] = ...) -> None: ...
+
+class BatchChunk(_message.Message):
+    __slots__ = ("name", "data", "last", "success", "message")
+    NAME_FIELD_NUMBER: _ClassVar[int]
+    DATA_FIELD_NUMBER: _ClassVar[int]
+    LAST_FIELD_NUMBER: _ClassVar[int]
+    SUCCESS_FIELD_NUMBER: _ClassVar[int]
+    MESSAGE_FIELD_NUMBER: _ClassVar[int]
+    name: str
+    data: bytes
+    last: bool
+    success: bool
+    message: str
+    def __init__(self, name: _Optional[str] = ..., data: _Optional[bytes] = ..., last: bool = ..., success: bool = ..., message: _Optional[str] = ...) -> None: ...
+
+class BatchItemStatus(_message.Message):
+    __slots__ = ("name", "success", "message")
+    NAME_FIELD_NUMBER: _ClassVar[int]
+    SUCCESS_FIELD_NUMBER: _ClassVar[int]
+    MESSAGE_FIELD_NUMBER: _ClassVar[int]
+    name: str
+    success: bool
+    message: str
+    def __init__(self, name: _Optional[str] = ..., success: bool = ..., message: _Optional[str] = ...) -> None: ...
+
+class CreateUploadSessionRequest(_message.Message):
+    __slots__ = ("name", "size", "part_size")
+    NAME_FIELD_NUMBER: _ClassVar[int]
+    SIZE_FIELD_NUMBER: _ClassVar[int]
+    PART_SIZE_FIELD_NUMBER: _ClassVar[int]
+    name: str
+    size: int
+    part_size: int
+    def __init__(self, name: _Optional[str] = ..., size: _Optional[int] = ..., part_size: _Optional[int] = ...) -> None: ...
+
+class UploadSession(_message.Message):
+    __slots__ = ("session_id", "name", "size", "part_size", "part_count", "expires_at", "parts")
+    SESSION_ID_FIELD_NUMBER: _ClassVar[int]
+    NAME_FIELD_NUMBER: _ClassVar[int]
+    SIZE_FIELD_NUMBER: _ClassVar[int]
+    PART_SIZE_FIELD_NUMBER: _ClassVar[int]
+    PART_COUNT_FIELD_NUMBER: _ClassVar[int]
+    EXPIRES_AT_FIELD_NUMBER: _ClassVar[int]
+    PARTS_FIELD_NUMBER: _ClassVar[int]
+    session_id: str
+    name: str
+    size: int
+    part_size: int
+    part_count: int
+    expires_at: float
+    parts: _containers.RepeatedCompositeFieldContainer[UploadedPart]
+    def __init__(self, session_id: _Optional[str] = ..., name: _Optional[str] = ..., size: _Optional[int] = ..., part_size: _Optional[int] = ..., part_count: _Optional[int] = ..., expires_at: _Optional[float] = ..., parts: _Optional[_Iterable[_Union[UploadedPart, _Mapping]]] = ...) -> None: ...
+
+class UploadedPart(_message.Message):
+    __slots__ = ("number", "etag", "size")
+    NUMBER_FIELD_NUMBER: _ClassVar[int]
+    ETAG_FIELD_NUMBER: _ClassVar[int]
+    SIZE_FIELD_NUMBER: _ClassVar[int]
+    number: int
+    etag: str
+    size: int
+    def __init__(self, number: _Optional[int] = ..., etag: _Optional[str] = ..., size: _Optional[int] = ...) -> None: ...
+
+class UploadSessionRequest(_message.Message):
+    __slots__ = ("session_id",)
+    SESSION_ID_FIELD_NUMBER: _ClassVar[int]
+    session_id: str
+    def __init__(self, session_id: _Optional[str] = ...) -> None: ...
+
+class UploadPartChunk(_message.Message):
+    __slots__ = ("session_id", "part_number", "data")
+    SESSION_ID_FIELD_NUMBER: _ClassVar[int]
+    PART_NUMBER_FIELD_NUMBER: _ClassVar[int]
+    DATA_FIELD_NUMBER: _ClassVar[int]
+    session_id: str
+    part_number: int
+    data: bytes
+    def __init__(self, session_id: _Optional[str] = ..., part_number: _Optional[int] = ..., data: _Optional[bytes] = ...) -> None: ...
@@ -0,0 +1,23 @@
+"""
+Client library of the PCF registry, with a blocking (RegistryClient) and an
+asyncio (AsyncRegistryClient) API over the gRPC interface.
+
+Both clients keep a pool of channels, limit the RPCs running at the same time,
+retry transient failures with backoff, download large documents in parallel
+ranges and can keep a local cache of downloads keyed by ETag. Failed calls
+raise a RegistryError.
+"""
+from .aio import AsyncRegistryClient
+from .cache import ETagCache
+from .client import RegistryClient
+from .errors import (
+    InvalidDocument, LimitExceeded, ObjectChanged, ObjectNotFound, RegistryError, TransferErrors, Unavailable
+)
+from .retry import PUSHBACK_CODES, TRANSIENT_CODES, RetryPolicy
+from .transport import ObjectStat
+
+__all__ = [
+    "AsyncRegistryClient", "ETagCache", "InvalidDocument", "LimitExceeded", "ObjectChanged", "ObjectNotFound",
+    "ObjectStat", "PUSHBACK_CODES", "RegistryClient", "RegistryError", "RetryPolicy", "TRANSIENT_CODES",
+    "TransferErrors", "Unavailable",
+]
@@ -0,0 +1,237 @@
+"""
+asyncio client of the PCF registry, the counterpart of RegistryClient. Create it
+inside the event loop that uses it:
+
+    async with AsyncRegistryClient("pcf-registry:50052") as registry:
+        digests = await registry.upload_many({"proofs/1.json": "1.json", "proofs/2.json": "2.json"})
+        proof = await registry.download("proofs/1.json")
+"""
+import asyncio
+import json
+import os
+import shutil
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Mapping, Optional, Union
+
+import grpc
+
+import json_streaming_pb2
+from .cache import ETagCache
+from .client import Source
+from .errors import RegistryError, TransferErrors, from_rpc_error
+from .retry import RetryPolicy
+from .transport import CHUNK_SIZE, DEFAULT_TARGET, RANGE_SIZE, ChannelPool, Methods, ObjectStat, channel_options, \
+    data_chunks, file_chunks, plan_ranges, to_stat
+
+
+class AsyncRegistryClient:
+    """
+    Arguments:
+        target: host:port of the gRPC server
+        channels: connections the calls are spread over
+        max_concurrency: RPCs running at the same time, further calls wait for a free slot
+        retry: how calls that fail with a transient status code are repeated
+        chunk_size: size of the upload messages
+        range_size: documents larger than this are downloaded in ranges of this size, in parallel
+        cache_dir: directory of the local read-through cache (keyed by ETag), None to disable it
+        cache_max_bytes: size of the cache
+        timeout: deadline of every RPC in seconds, None for none
+        compression: compression of the upload messages (e.g. grpc.Compression.Gzip)
+        credentials: grpc.ChannelCredentials for TLS, None for plaintext
+    """
+
+    def __init__(self, target: str = DEFAULT_TARGET, channels: int = 4, max_concurrency: int = 16,
+                 retry: RetryPolicy = RetryPolicy(), chunk_size: int = CHUNK_SIZE, range_size: int = RANGE_SIZE,
+                 cache_dir: Optional[str] = None, cache_max_bytes: int = 1024 ** 3, timeout: Optional[float] = None,
+                 compression: Optional[grpc.Compression] = None, credentials: Optional[grpc.ChannelCredentials] = None):
+        options = channel_options()
+        if credentials is None:
+            self._pool = ChannelPool(lambda: grpc.aio.insecure_channel(target, options), channels)
+        else:
+            self._pool = ChannelPool(lambda: grpc.aio.secure_channel(target, credentials, options), channels)
+        self.retry = retry
+        self.chunk_size = chunk_size
+        self.range_size = range_size
+        self.timeout = timeout
+        self.compression = compression
+        self.cache = ETagCache(cache_dir, cache_max_bytes) if cache_dir else None
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    async def close(self):
+        await asyncio.gather(*(channel.close() for channel in self._pool.channels))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _call(self, name: str, function: Callable[[Methods], Awaitable]):
+        """Runs function with the RPCs of the next channel in a concurrency slot, again after transient errors."""
+        attempt = 1
+        while True:
+            try:
+                async with self._slots:
+                    return await function(self._pool.pick())
+            except grpc.RpcError as e:
+                if not self.retry.retryable(e, attempt):
+                    raise from_rpc_error(e, name) from None
+                delay = self.retry.delay(attempt, e)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def stat(self, name: str) -> ObjectStat:
+        """Size (of the uncompressed document), ETag and digest of an object."""
+        request = json_streaming_pb2.StatRequest(name=name)
+
+        async def call(methods):
+            return await methods.stat(request, timeout=self.timeout)
+        return to_stat(await self._call(name, call))
+
+    async def upload(self, name: str, data) -> str:
+        """Stores a document (any bytes-like object) under name and returns its SHA-256 digest."""
+        return await self._upload(name, lambda: data_chunks(data, self.chunk_size))
+
+    async def upload_file(self, name: str, path: Union[str, os.PathLike]) -> str:
+        """Stores the document in a file under name and returns its SHA-256 digest."""
+        return await self._upload(name, lambda: file_chunks(os.fspath(path), self.chunk_size))
+
+    async def _upload(self, name: str, chunks: Callable[[], Iterable[memoryview]]) -> str:
+        async def call(methods):
+            response = await methods.upload(
+                chunks(), metadata=(("filename", name),), timeout=self.timeout, compression=self.compression
+            )
+            return response.digest
+        return await self._call(name, call)
+
+    async def download(self, name: str) -> bytearray:
+        """The document stored under name."""
+        stat = await self.stat(name)
+        if self.cache is not None:
+            cached = await asyncio.to_thread(self.cache.get, name, stat.etag)
+            if cached is not None:
+                return cached
+
+        data = bytearray(stat.size)
+        view = memoryview(data)
+
+        async def write(offset, chunk):
+            view[offset:offset + len(chunk)] = chunk
+
+        await self._fetch(stat, write)
+        if self.cache is not None:
+            await asyncio.to_thread(self.cache.put, name, stat.etag, data)
+        return data
+
+    async def download_file(self, name: str, path: Union[str, os.PathLike]) -> ObjectStat:
+        """
+        Writes the document stored under name to path. The data goes to '<path>.part'
+        first, path only appears once the download is complete.
+        """
+        path = os.fspath(path)
+        stat = await self.stat(name)
+        cached = self.cache.path(name, stat.etag) if self.cache is not None else None
+        if cached is not None:
+            await asyncio.to_thread(shutil.copyfile, cached, path)
+            return stat
+
+        partial = path + ".part"
+        fd = os.open(partial, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+
+        async def write(offset, chunk):
+            #the chunk is a view of the received message, it stays valid while the thread writes it
+            await asyncio.to_thread(os.pwrite, fd, chunk, offset)
+
+        try:
+            os.ftruncate(fd, stat.size)
+            await self._fetch(stat, write)
+        except BaseException:
+            os.close(fd)
+            os.remove(partial)
+            raise
+        os.close(fd)
+        os.replace(partial, path)
+        if self.cache is not None:
+            await asyncio.to_thread(self.cache.put_file, name, stat.etag, path)
+        return stat
+
+    async def _fetch(self, stat: ObjectStat, write: Callable[[int, memoryview], Awaitable]):
+        """Downloads the document described by stat, several ranges at a time if it is large."""
+        results = await asyncio.gather(
+            *(self._fetch_range(stat, offset, length, write) for offset, length in plan_ranges(stat.size, self.range_size)),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+    async def _fetch_range(self, stat: ObjectStat, offset: int, length: int, write: Callable[[int, memoryview], Awaitable]):
+        """
+        Fetches one range of the version of the document stat describes (ObjectChanged
+        if it was replaced). A retry only asks for the bytes that are still missing.
+        """
+        received = 0
+
+        async def call(methods):
+            nonlocal received
+            if length and received == length:
+                return
+            request = json_streaming_pb2.GetRequest(
+                message=stat.name, offset=offset + received, length=length - received, etag=stat.etag
+            )
+            async for chunk in methods.get(request, timeout=self.timeout):
+                await write(offset + received, chunk)
+                received += len(chunk)
+
+        await self._call(stat.name, call)
+        if received != length:
+            raise RegistryError(f"{stat.name}: the range at {offset} ended after {received} of {length} bytes",
+                                name=stat.name)
+
+    async def get_values(self, name: str, pointers: List[str]) -> Dict[str, Any]:
+        """The values at JSON Pointers (e.g. "/header/commitment") of a document, keyed by pointer."""
+        request = json_streaming_pb2.GetRequest(message=name, pointers=pointers)
+
+        async def call(methods):
+            return b"".join([chunk.data async for chunk in methods.get_values(request, timeout=self.timeout)])
+
+        values = json.loads(await self._call(name, call))
+        return {pointers[0]: values} if len(pointers) == 1 else values
+
+    async def upload_many(self, sources: Mapping[str, Source]) -> Dict[str, str]:
+        """
+        Uploads several documents at once, keyed by object name; a document is given
+        as a bytes-like object or as the path of a file. Returns the digests.
+
+        Raises:
+            TransferErrors: some uploads failed (the others are complete)
+        """
+        async def upload(name, source):
+            if isinstance(source, (str, os.PathLike)):
+                return await self.upload_file(name, source)
+            return await self.upload(name, source)
+        return await self._many(sources.items(), upload)
+
+    async def download_many(self, names: Iterable[str]) -> Dict[str, bytearray]:
+        """Downloads several documents at once. Raises TransferErrors if some of them failed."""
+        return await self._many(((name, None) for name in names), lambda name, _: self.download(name))
+
+    async def download_files(self, targets: Mapping[str, Union[str, os.PathLike]]) -> Dict[str, ObjectStat]:
+        """Downloads several documents at once into the files they are mapped to. Raises TransferErrors if some failed."""
+        return await self._many(targets.items(), self.download_file)
+
+    @staticmethod
+    async def _many(items: Iterable, transfer: Callable[[str, Any], Awaitable]) -> dict:
+        items = list(items)
+        outcomes = await asyncio.gather(*(transfer(name, value) for name, value in items), return_exceptions=True)
+        results = {}
+        errors = {}
+        for (name, _), outcome in zip(items, outcomes):
+            if isinstance(outcome, RegistryError):
+                errors[name] = outcome
+            elif isinstance(outcome, BaseException):
+                raise outcome
+            else:
+                results[name] = outcome
+        if errors:
+            raise TransferErrors(errors, results)
+        return results
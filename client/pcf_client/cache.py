@@ -0,0 +1,127 @@
+"""
+Local read-through cache of downloaded documents, keyed by object name and ETag.
+
+A download asks the server for the current ETag of the object first (Stat); if
+the cache has the document for that ETag, nothing else is transferred. Every
+name keeps only its latest version, and the least recently used documents are
+removed once the cache grows beyond its size. Several processes may share the
+directory: entries are written to a temporary file and renamed into place.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from typing import Optional
+
+
+def _digest(value: str) -> str:
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+class ETagCache:
+    """
+    Arguments:
+        directory: where the documents are kept (created if missing)
+        max_bytes: total size above which the least recently used documents are removed
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 1024 ** 3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        #estimate of the total size, recounted whenever it exceeds max_bytes (other processes write too)
+        self._size = sum(size for _, size, _ in self._entries())
+
+    def _entry_directory(self, name: str) -> str:
+        return os.path.join(self.directory, _digest(name))
+
+    def path(self, name: str, etag: str) -> Optional[str]:
+        """The file with the document of name at etag, None if it is not cached."""
+        path = os.path.join(self._entry_directory(name), _digest(etag))
+        try:
+            #the modification time orders the entries for eviction
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def get(self, name: str, etag: str) -> Optional[bytearray]:
+        path = self.path(name, etag)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                data = bytearray(os.fstat(f.fileno()).st_size)
+                f.readinto(data)
+        except FileNotFoundError:
+            #evicted in the meantime
+            return None
+        return data
+
+    def put(self, name: str, etag: str, data) -> None:
+        """Stores the document of name at etag, replacing older versions of name."""
+        self._store(name, etag, lambda f: f.write(data), len(data))
+
+    def put_file(self, name: str, etag: str, source: str) -> None:
+        """Like put, for a document in a file (copied inside the kernel where the platform supports it)."""
+        self._store(name, etag, None, os.path.getsize(source), source)
+
+    def _store(self, name: str, etag: str, write, size: int, source: Optional[str] = None):
+        if size > self.max_bytes:
+            return
+        entry_directory = self._entry_directory(name)
+        os.makedirs(entry_directory, exist_ok=True)
+        target = os.path.join(entry_directory, _digest(etag))
+        fd, temporary = tempfile.mkstemp(dir=entry_directory, prefix=".tmp-")
+        try:
+            if source is None:
+                with os.fdopen(fd, "wb") as f:
+                    write(f)
+            else:
+                os.close(fd)
+                shutil.copyfile(source, temporary)
+            os.replace(temporary, target)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+
+        for entry in os.listdir(entry_directory):
+            if entry != os.path.basename(target) and not entry.startswith(".tmp-"):
+                self._remove(os.path.join(entry_directory, entry))
+        with self._lock:
+            self._size += size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        """(path, size, last use) of every cached document."""
+        for entry_directory in os.scandir(self.directory):
+            if not entry_directory.is_dir():
+                continue
+            for entry in os.scandir(entry_directory.path):
+                if entry.name.startswith(".tmp-"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield entry.path, stat.st_size, stat.st_mtime
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        self._size = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if self._size <= self.max_bytes:
+                break
+            self._remove(path)
+            self._size -= size
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,237 @@
+"""
+Blocking client of the PCF registry; one instance is meant to be shared by all threads of a process.
+
+    with RegistryClient("pcf-registry:50052", cache_dir="/var/cache/pcf") as registry:
+        digest = registry.upload_file("proofs/42.json", "42.json")
+        proof = registry.download("proofs/42.json")
+        registry.download_files({"proofs/1.json": "1.json", "proofs/2.json": "2.json"})
+"""
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Union
+
+import grpc
+
+import json_streaming_pb2
+from .cache import ETagCache
+from .errors import RegistryError, TransferErrors, from_rpc_error
+from .retry import RetryPolicy
+from .transport import CHUNK_SIZE, DEFAULT_TARGET, RANGE_SIZE, ChannelPool, Methods, ObjectStat, channel_options, \
+    data_chunks, file_chunks, plan_ranges, to_stat
+
+Source = Union[bytes, bytearray, memoryview, str, os.PathLike]
+
+
+class RegistryClient:
+    """
+    Arguments:
+        target: host:port of the gRPC server
+        channels: connections the calls are spread over
+        max_concurrency: RPCs running at the same time, further calls wait for a free slot
+        retry: how calls that fail with a transient status code are repeated
+        chunk_size: size of the upload messages
+        range_size: documents larger than this are downloaded in ranges of this size, in parallel
+        cache_dir: directory of the local read-through cache (keyed by ETag), None to disable it
+        cache_max_bytes: size of the cache
+        timeout: deadline of every RPC in seconds, None for none
+        compression: compression of the upload messages (e.g. grpc.Compression.Gzip)
+        credentials: grpc.ChannelCredentials for TLS, None for plaintext
+    """
+
+    def __init__(self, target: str = DEFAULT_TARGET, channels: int = 4, max_concurrency: int = 16,
+                 retry: RetryPolicy = RetryPolicy(), chunk_size: int = CHUNK_SIZE, range_size: int = RANGE_SIZE,
+                 cache_dir: Optional[str] = None, cache_max_bytes: int = 1024 ** 3, timeout: Optional[float] = None,
+                 compression: Optional[grpc.Compression] = None, credentials: Optional[grpc.ChannelCredentials] = None):
+        options = channel_options()
+        if credentials is None:
+            self._pool = ChannelPool(lambda: grpc.insecure_channel(target, options), channels)
+        else:
+            self._pool = ChannelPool(lambda: grpc.secure_channel(target, credentials, options), channels)
+        self.retry = retry
+        self.chunk_size = chunk_size
+        self.range_size = range_size
+        self.timeout = timeout
+        self.compression = compression
+        self.cache = ETagCache(cache_dir, cache_max_bytes) if cache_dir else None
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        #transfers of upload_many/download_many and the ranges of large downloads run on separate pools,
+        #so a transfer never waits for a pool thread its own ranges need
+        self._transfers = ThreadPoolExecutor(max_concurrency, thread_name_prefix="pcf-transfer")
+        self._ranges = ThreadPoolExecutor(max_concurrency, thread_name_prefix="pcf-range")
+
+    def close(self):
+        self._transfers.shutdown()
+        self._ranges.shutdown()
+        for channel in self._pool.channels:
+            channel.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _call(self, name: str, function: Callable[[Methods], Any]):
+        """Runs function with the RPCs of the next channel in a concurrency slot, again after transient errors."""
+        attempt = 1
+        while True:
+            try:
+                with self._slots:
+                    return function(self._pool.pick())
+            except grpc.RpcError as e:
+                if not self.retry.retryable(e, attempt):
+                    raise from_rpc_error(e, name) from None
+                delay = self.retry.delay(attempt, e)
+            time.sleep(delay)
+            attempt += 1
+
+    def stat(self, name: str) -> ObjectStat:
+        """Size (of the uncompressed document), ETag and digest of an object."""
+        request = json_streaming_pb2.StatRequest(name=name)
+        return to_stat(self._call(name, lambda methods: methods.stat(request, timeout=self.timeout)))
+
+    def upload(self, name: str, data) -> str:
+        """Stores a document (any bytes-like object) under name and returns its SHA-256 digest."""
+        return self._upload(name, lambda: data_chunks(data, self.chunk_size))
+
+    def upload_file(self, name: str, path: Union[str, os.PathLike]) -> str:
+        """Stores the document in a file under name and returns its SHA-256 digest."""
+        return self._upload(name, lambda: file_chunks(os.fspath(path), self.chunk_size))
+
+    def _upload(self, name: str, chunks: Callable[[], Iterable[memoryview]]) -> str:
+        def call(methods):
+            response = methods.upload(
+                chunks(), metadata=(("filename", name),), timeout=self.timeout, compression=self.compression
+            )
+            return response.digest
+        return self._call(name, call)
+
+    def download(self, name: str) -> bytearray:
+        """The document stored under name."""
+        stat = self.stat(name)
+        if self.cache is not None:
+            cached = self.cache.get(name, stat.etag)
+            if cached is not None:
+                return cached
+
+        data = bytearray(stat.size)
+        view = memoryview(data)
+
+        def write(offset, chunk):
+            view[offset:offset + len(chunk)] = chunk
+
+        self._fetch(stat, write)
+        if self.cache is not None:
+            self.cache.put(name, stat.etag, data)
+        return data
+
+    def download_file(self, name: str, path: Union[str, os.PathLike]) -> ObjectStat:
+        """
+        Writes the document stored under name to path. The data goes to '<path>.part'
+        first, path only appears once the download is complete.
+        """
+        path = os.fspath(path)
+        stat = self.stat(name)
+        cached = self.cache.path(name, stat.etag) if self.cache is not None else None
+        if cached is not None:
+            shutil.copyfile(cached, path)
+            return stat
+
+        partial = path + ".part"
+        fd = os.open(partial, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, stat.size)
+            self._fetch(stat, lambda offset, chunk: os.pwrite(fd, chunk, offset))
+        except BaseException:
+            os.close(fd)
+            os.remove(partial)
+            raise
+        os.close(fd)
+        os.replace(partial, path)
+        if self.cache is not None:
+            self.cache.put_file(name, stat.etag, path)
+        return stat
+
+    def _fetch(self, stat: ObjectStat, write: Callable[[int, memoryview], Any]):
+        """Downloads the document described by stat, several ranges at a time if it is large."""
+        ranges = plan_ranges(stat.size, self.range_size)
+        if len(ranges) == 1:
+            self._fetch_range(stat, *ranges[0], write)
+            return
+        pending = [self._ranges.submit(self._fetch_range, stat, offset, length, write) for offset, length in ranges]
+        errors = [future.exception() for future in pending]
+        for error in errors:
+            if error is not None:
+                raise error
+
+    def _fetch_range(self, stat: ObjectStat, offset: int, length: int, write: Callable[[int, memoryview], Any]):
+        """
+        Fetches one range of the version of the document stat describes (ObjectChanged
+        if it was replaced). A retry only asks for the bytes that are still missing.
+        """
+        received = 0
+
+        def call(methods):
+            nonlocal received
+            if length and received == length:
+                return
+            request = json_streaming_pb2.GetRequest(
+                message=stat.name, offset=offset + received, length=length - received, etag=stat.etag
+            )
+            for chunk in methods.get(request, timeout=self.timeout):
+                write(offset + received, chunk)
+                received += len(chunk)
+
+        self._call(stat.name, call)
+        if received != length:
+            raise RegistryError(f"{stat.name}: the range at {offset} ended after {received} of {length} bytes",
+                                name=stat.name)
+
+    def get_values(self, name: str, pointers: List[str]) -> Dict[str, Any]:
+        """The values at JSON Pointers (e.g. "/header/commitment") of a document, keyed by pointer."""
+        request = json_streaming_pb2.GetRequest(message=name, pointers=pointers)
+
+        def call(methods):
+            return b"".join(chunk.data for chunk in methods.get_values(request, timeout=self.timeout))
+
+        values = json.loads(self._call(name, call))
+        return {pointers[0]: values} if len(pointers) == 1 else values
+
+    def upload_many(self, sources: Mapping[str, Source]) -> Dict[str, str]:
+        """
+        Uploads several documents at once, keyed by object name; a document is given
+        as a bytes-like object or as the path of a file. Returns the digests.
+
+        Raises:
+            TransferErrors: some uploads failed (the others are complete)
+        """
+        def upload(name, source):
+            if isinstance(source, (str, os.PathLike)):
+                return self.upload_file(name, source)
+            return self.upload(name, source)
+        return self._many(sources.items(), upload)
+
+    def download_many(self, names: Iterable[str]) -> Dict[str, bytearray]:
+        """Downloads several documents at once. Raises TransferErrors if some of them failed."""
+        return self._many(((name, None) for name in names), lambda name, _: self.download(name))
+
+    def download_files(self, targets: Mapping[str, Union[str, os.PathLike]]) -> Dict[str, ObjectStat]:
+        """Downloads several documents at once into the files they are mapped to. Raises TransferErrors if some failed."""
+        return self._many(targets.items(), self.download_file)
+
+    def _many(self, items: Iterable, transfer: Callable) -> dict:
+        pending = {name: self._transfers.submit(transfer, name, value) for name, value in items}
+        results = {}
+        errors = {}
+        for name, future in pending.items():
+            try:
+                results[name] = future.result()
+            except RegistryError as e:
+                errors[name] = e
+        if errors:
+            raise TransferErrors(errors, results)
+        return results
@@ -0,0 +1,79 @@
+"""Exceptions of the client library; every failed call raises a RegistryError."""
+from typing import Dict, Optional
+
+import grpc
+
+from .retry import server_pushback
+
+
+class RegistryError(Exception):
+    """
+    A call to the registry failed.
+
+    Arguments:
+        message: what failed
+        code: the gRPC status code of the failed call
+        name: the object the call was about, if any
+    """
+
+    def __init__(self, message: str, code: grpc.StatusCode = grpc.StatusCode.UNKNOWN, name: Optional[str] = None):
+        super().__init__(message)
+        self.code = code
+        self.name = name
+
+
+class ObjectNotFound(RegistryError):
+    """The object does not exist."""
+
+
+class InvalidDocument(RegistryError):
+    """The server rejected an upload that is not one JSON document (or a malformed request)."""
+
+
+class ObjectChanged(RegistryError):
+    """The object was replaced while it was downloaded in several ranges."""
+
+
+class Unavailable(RegistryError):
+    """The server could not be reached or stayed overloaded for all attempts."""
+
+
+class LimitExceeded(RegistryError):
+    """The call is above a limit of the server that retries don't lift, like a document above MAX_DOCUMENT_BYTES."""
+
+
+class TransferErrors(RegistryError):
+    """
+    Some transfers of an upload_many/download_many call failed.
+
+    Arguments:
+        errors: the error of every failed transfer, keyed by object name
+        results: the results of the transfers that succeeded
+    """
+
+    def __init__(self, errors: Dict[str, RegistryError], results: dict):
+        names = ", ".join(sorted(errors)[:10]) + (" ..." if len(errors) > 10 else "")
+        super().__init__(f"{len(errors)} of {len(errors) + len(results)} transfers failed: {names}")
+        self.errors = errors
+        self.results = results
+
+
+_ERRORS_BY_CODE = {
+    grpc.StatusCode.NOT_FOUND: ObjectNotFound,
+    grpc.StatusCode.INVALID_ARGUMENT: InvalidDocument,
+    grpc.StatusCode.FAILED_PRECONDITION: ObjectChanged,
+    grpc.StatusCode.UNAVAILABLE: Unavailable,
+    grpc.StatusCode.DEADLINE_EXCEEDED: Unavailable,
+    grpc.StatusCode.RESOURCE_EXHAUSTED: LimitExceeded,
+}
+
+
+def from_rpc_error(error: grpc.RpcError, name: Optional[str] = None) -> RegistryError:
+    """The RegistryError for a failed RPC (grpc and grpc.aio errors alike)."""
+    code = error.code()
+    details = error.details() or code.name
+    message = f"{name}: {details}" if name else details
+    if code == grpc.StatusCode.RESOURCE_EXHAUSTED and server_pushback(error) is not None:
+        #turned away by the admission control of an overloaded server
+        return Unavailable(message, code, name)
+    return _ERRORS_BY_CODE.get(code, RegistryError)(message, code, name)
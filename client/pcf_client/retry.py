@@ -0,0 +1,59 @@
+"""When and how often failed calls are repeated."""
+import random
+from typing import FrozenSet, NamedTuple, Optional
+
+import grpc
+
+#status codes of failures that may go away by themselves: the server restarts, is overloaded or too slow
+TRANSIENT_CODES = frozenset({
+    grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED, grpc.StatusCode.ABORTED,
+})
+#status codes that are only transient if the server says when to retry: RESOURCE_EXHAUSTED is an overloaded
+#server with a grpc-retry-pushback-ms hint, but a document above the size limit without one
+PUSHBACK_CODES = frozenset({grpc.StatusCode.RESOURCE_EXHAUSTED})
+
+
+class RetryPolicy(NamedTuple):
+    """
+    Retries of calls that fail with one of codes, with jittered exponential backoff.
+
+    Arguments:
+        attempts: calls in total, 1 disables retries
+        backoff: upper bound of the first delay in seconds, doubled for every further attempt
+        max_backoff: upper bound of every delay
+        codes: status codes that are retried
+        pushback_codes: status codes that are retried if the server sent a grpc-retry-pushback-ms hint
+    """
+    attempts: int = 5
+    backoff: float = 0.1
+    max_backoff: float = 5.0
+    codes: FrozenSet[grpc.StatusCode] = TRANSIENT_CODES
+    pushback_codes: FrozenSet[grpc.StatusCode] = PUSHBACK_CODES
+
+    def retryable(self, error: grpc.RpcError, attempt: int) -> bool:
+        """Whether the call that failed with error in attempt (counted from 1) is made again."""
+        if attempt >= self.attempts:
+            return False
+        code = error.code()
+        return code in self.codes or (code in self.pushback_codes and server_pushback(error) is not None)
+
+    def delay(self, attempt: int, error: Optional[grpc.RpcError] = None) -> float:
+        """
+        Seconds to wait after attempt failed; "full jitter" keeps many clients from retrying in lockstep.
+        A server that turned the call away because it is overloaded says when to come back
+        (grpc-retry-pushback-ms), the jittered backoff is added to that.
+        """
+        jitter = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+        return (server_pushback(error) or 0) + jitter
+
+
+def server_pushback(error: Optional[grpc.RpcError]) -> Optional[float]:
+    """The retry hint in seconds the server sent with error (grpc-retry-pushback-ms), None if none."""
+    trailing_metadata = getattr(error, "trailing_metadata", None)
+    for key, value in (trailing_metadata() if trailing_metadata is not None else None) or ():
+        if key == "grpc-retry-pushback-ms":
+            try:
+                return max(0, int(value)) / 1000
+            except ValueError:
+                return 0
+    return None
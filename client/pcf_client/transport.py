@@ -0,0 +1,164 @@
+"""
+Channels, RPC methods and the encoding of the bulk data, shared by the sync and the asyncio client.
+
+The data of an upload or download travels in JsonChunk messages, a single bytes
+field: the tag, the length as a varint and the data. The methods here encode and
+decode that directly instead of going through protobuf objects. An upload chunk
+is built from a memoryview of the (memory mapped) file with one copy instead of
+two, and a download chunk is a memoryview of the data inside the received
+message instead of a copy of it.
+"""
+import itertools
+import mmap
+import os
+from typing import Any, Callable, Iterator, List, NamedTuple, Tuple
+
+import json_streaming_pb2
+
+DEFAULT_TARGET = "localhost:50052"
+SERVICE = "/JsonStreamingService"
+#largest message the client sends or accepts, the server never sends more than its GRPC_MAX_MESSAGE_LENGTH
+MAX_MESSAGE_LENGTH = 64 * 1024 * 1024
+#size of the upload messages, must stay below the GRPC_MAX_MESSAGE_LENGTH of the server (4 MiB by default)
+CHUNK_SIZE = 1024 * 1024
+#documents larger than this are downloaded in ranges of this size, several at a time
+RANGE_SIZE = 16 * 1024 * 1024
+
+_CHUNK_TAG = b"\x0a"
+
+
+class ObjectStat(NamedTuple):
+    name: str
+    #size of the (uncompressed) document in bytes
+    size: int
+    etag: str
+    #SHA-256 of the document (hex), empty if the server does not know it
+    digest: str
+    content_type: str
+
+
+def _varint(value: int) -> bytes:
+    encoded = bytearray()
+    while value > 0x7F:
+        encoded.append(value & 0x7F | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def encode_chunk(data) -> bytes:
+    """The serialized JsonChunk carrying data (bytes or a memoryview)."""
+    return b"".join((_CHUNK_TAG, _varint(len(data)), data))
+
+
+def decode_chunk(message: bytes) -> memoryview:
+    """The data of a serialized JsonChunk, without copying it."""
+    if not message:
+        return memoryview(b"")
+    if message[:1] != _CHUNK_TAG:
+        #not the plain encoding (e.g. unknown fields first), let protobuf sort it out
+        return memoryview(json_streaming_pb2.JsonChunk.FromString(message).data)
+    length = shift = 0
+    position = 1
+    while True:
+        byte = message[position]
+        position += 1
+        length |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            break
+        shift += 7
+    return memoryview(message)[position:position + length]
+
+
+def data_chunks(data, chunk_size: int) -> Iterator[memoryview]:
+    """Pieces of a bytes-like document, as views of it."""
+    view = memoryview(data).cast("B")
+    for offset in range(0, len(view), chunk_size):
+        yield view[offset:offset + chunk_size]
+
+
+def file_chunks(path: str, chunk_size: int) -> Iterator[memoryview]:
+    """Pieces of a file, as views of a memory map of it (the page cache, no read buffers)."""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield from data_chunks(mapped, chunk_size)
+    finally:
+        try:
+            mapped.close()
+        except BufferError:
+            #a view of the last chunk is still referenced, the map is closed once it is collected
+            pass
+
+
+class Methods(NamedTuple):
+    """The RPCs of one channel (grpc.Channel or grpc.aio.Channel)."""
+    upload: Any
+    get: Any
+    get_values: Any
+    stat: Any
+
+
+def bind(channel) -> Methods:
+    return Methods(
+        upload=channel.stream_unary(
+            f"{SERVICE}/UploadJson", request_serializer=encode_chunk,
+            response_deserializer=json_streaming_pb2.UploadResponse.FromString
+        ),
+        get=channel.unary_stream(
+            f"{SERVICE}/GetJson", request_serializer=json_streaming_pb2.GetRequest.SerializeToString,
+            response_deserializer=decode_chunk
+        ),
+        get_values=channel.unary_stream(
+            f"{SERVICE}/GetJson", request_serializer=json_streaming_pb2.GetRequest.SerializeToString,
+            response_deserializer=json_streaming_pb2.JsonChunk.FromString
+        ),
+        stat=channel.unary_unary(
+            f"{SERVICE}/Stat", request_serializer=json_streaming_pb2.StatRequest.SerializeToString,
+            response_deserializer=json_streaming_pb2.ObjectStat.FromString
+        ),
+    )
+
+
+def channel_options(max_message_length: int = MAX_MESSAGE_LENGTH) -> List[Tuple[str, Any]]:
+    return [
+        ("grpc.max_send_message_length", max_message_length),
+        ("grpc.max_receive_message_length", max_message_length),
+        #channels to the same target would otherwise share one connection
+        ("grpc.use_local_subchannel_pool", 1),
+        ("grpc.keepalive_time_ms", 30 * 1000),
+    ]
+
+
+class ChannelPool:
+    """
+    A fixed number of channels, each with its own HTTP/2 connection; calls are
+    spread over them round robin, so a large transfer does not hold up the others
+    behind the flow control window of a single connection.
+
+    Arguments:
+        create_channel: returns a new channel (grpc or grpc.aio)
+        size: number of channels
+    """
+
+    def __init__(self, create_channel: Callable[[], Any], size: int):
+        self.channels = [create_channel() for _ in range(max(1, size))]
+        self._methods = [bind(channel) for channel in self.channels]
+        self._next = itertools.count()
+
+    def pick(self) -> Methods:
+        return self._methods[next(self._next) % len(self._methods)]
+
+
+def plan_ranges(size: int, range_size: int) -> List[Tuple[int, int]]:
+    """Splits a document of size bytes into (offset, length) ranges of at most range_size bytes."""
+    if size == 0:
+        return [(0, 0)]
+    return [(offset, min(range_size, size - offset)) for offset in range(0, size, range_size)]
+
+
+def to_stat(message) -> ObjectStat:
+    return ObjectStat(message.name, message.size, message.etag, message.digest, message.content_type)
@@ -0,0 +1,101 @@
+"""
+Compression of stored objects.
+
+Objects can be stored gzip or zstd compressed; the encoding is recorded in the
+object metadata (see ENCODING_KEY) so readers know how to decode them. zstd
+needs the optional zstandard package, gzip only uses the standard library.
+"""
+import zlib
+from typing import Iterable, Iterator
+
+try:
+    import zstandard
+except ImportError:  # zstd support is optional
+    zstandard = None
+
+#object metadata holding the encoding and the size of the uncompressed document
+ENCODING_KEY = "encoding"
+IDENTITY_SIZE_KEY = "identity-size"
+
+SUPPORTED_ENCODINGS = ("gzip", "zstd")
+
+
+def available(encoding: str) -> bool:
+    """True if objects can be compressed and decompressed with the given encoding here."""
+    if encoding == "gzip":
+        return True
+    if encoding == "zstd":
+        return zstandard is not None
+    return False
+
+
+def compressor(encoding: str, level: int = -1):
+    """Returns a streaming compressor with compress(data) and flush() methods."""
+    if encoding == "gzip":
+        return zlib.compressobj(level, zlib.DEFLATED, 31)
+    if encoding == "zstd" and zstandard is not None:
+        return zstandard.ZstdCompressor(level=3 if level < 0 else level).compressobj()
+    raise ValueError(f"Unsupported encoding '{encoding}'")
+
+
+def decompressor(encoding: str):
+    """Returns a streaming decompressor with decompress(data) and flush() methods."""
+    if encoding == "gzip":
+        return zlib.decompressobj(31)
+    if encoding == "zstd" and zstandard is not None:
+        return zstandard.ZstdDecompressor().decompressobj()
+    raise ValueError(f"Unsupported encoding '{encoding}'")
+
+
+def compress(data: bytes, encoding: str, level: int = -1) -> bytes:
+    engine = compressor(encoding, level)
+    return engine.compress(data) + engine.flush()
+
+
+def decompress(data: bytes, encoding: str) -> bytes:
+    if not encoding:
+        return data
+    engine = decompressor(encoding)
+    return engine.decompress(data) + engine.flush()
+
+
+def decode_chunks(chunks: Iterable[bytes], encoding: str) -> Iterator[bytes]:
+    """Decompresses a stream of stored chunks on the fly (passes them through for encoding "")."""
+    if not encoding:
+        yield from chunks
+        return
+
+    engine = decompressor(encoding)
+    for chunk in chunks:
+        data = engine.decompress(chunk)
+        if data:
+            yield data
+    data = engine.flush()
+    if data:
+        yield data
+
+
+def rechunk(chunks: Iterable[bytes], size: int) -> Iterator[bytes]:
+    """Splits chunks larger than size (decompressed chunks can be much bigger than the input)."""
+    for chunk in chunks:
+        for offset in range(0, len(chunk), size):
+            yield chunk[offset:offset + size]
+
+
+def slice_chunks(chunks: Iterable[bytes], offset: int, length: int) -> Iterator[bytes]:
+    """Yields the bytes [offset, offset + length) of a stream of chunks."""
+    position = 0
+    end = offset + length
+    try:
+        for chunk in chunks:
+            chunk_end = position + len(chunk)
+            if chunk_end > offset and position < end:
+                yield chunk[max(0, offset - position):min(len(chunk), end - position)]
+            position = chunk_end
+            if position >= end:
+                return
+    finally:
+        #stop the producer (and release its storage stream) when the slice is complete
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
@@ -0,0 +1,64 @@
+"""
+Gunicorn configuration of the production entry point:
+
+    gunicorn app:app
+
+Starts WORKERS processes (default: one per CPU). Every worker serves HTTP with
+a pool of HTTP_THREADS threads and runs its own asyncio gRPC server on
+GRPC_PORT; the gRPC servers of all workers share the port through SO_REUSEPORT,
+so the kernel spreads the connections over the processes. On SIGTERM a worker
+fails its readiness check (/ready), stops taking new gRPC calls and lets the
+running HTTP requests and RPCs finish within SHUTDOWN_GRACE_SECONDS.
+"""
+import os
+import shutil
+import signal
+import tempfile
+
+bind = f"0.0.0.0:{os.environ.get('HTTP_PORT', 5002)}"
+workers = int(os.environ.get("WORKERS", os.cpu_count() or 1))
+worker_class = "gthread"
+threads = int(os.environ.get("HTTP_THREADS", 8))
+graceful_timeout = int(float(os.environ.get("SHUTDOWN_GRACE_SECONDS", 30)))
+#a worker whose main loop hangs this long is restarted (streaming requests run on the threads and don't count)
+timeout = int(os.environ.get("WORKER_TIMEOUT", 60))
+#every worker imports the app itself, gRPC must not be initialised before the fork
+preload_app = False
+
+#the workers write their metrics to files in this directory, /metrics of any worker reports the sum
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "pcf-registry-metrics"))
+
+
+def on_starting(server):
+    #values of an earlier run must not be added to the new ones
+    directory = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory, exist_ok=True)
+
+
+def post_worker_init(worker):
+    import app
+
+    app.grpc_server.start()
+
+    #gunicorn's own SIGTERM handler stops the HTTP loop, the gRPC server starts draining at the same time
+    stop_http = signal.getsignal(signal.SIGTERM)
+
+    def handle_sigterm(signum, frame):
+        app.drain()
+        stop_http(signum, frame)
+
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
+
+def worker_exit(server, worker):
+    import app
+
+    app.drain()
+    app.grpc_server.join(app.SHUTDOWN_GRACE_SECONDS + 5)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
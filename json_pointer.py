@@ -0,0 +1,136 @@
+"""
+JSON Pointers (RFC 6901) evaluated on a document while it is being read.
+
+extract() pushes the chunks of a document through an incremental parser
+(ijson) and only builds the values the pointers refer to. It stops consuming
+the chunks as soon as the last of them is complete, so the rest of the document
+is never read (or fetched from the storage).
+"""
+from typing import Any, Dict, Iterable, List, Tuple
+
+import ijson
+
+from json_validation import InvalidDocument
+
+
+class PointerError(ValueError):
+    """A pointer is not a valid JSON Pointer."""
+
+
+class PointerNotFound(KeyError):
+    """Some pointers refer to nothing in the document; args[0] lists them."""
+
+
+def parse_pointer(pointer: str) -> Tuple[str, ...]:
+    """Splits a pointer into its reference tokens ("" is the whole document)."""
+    if pointer == "":
+        return ()
+    if not pointer.startswith("/"):
+        raise PointerError(f"JSON Pointer '{pointer}' must be empty or start with '/'")
+    return tuple(token.replace("~1", "/").replace("~0", "~") for token in pointer[1:].split("/"))
+
+
+class _Capture:
+    """Builds one selected value from the parser events."""
+
+    def __init__(self, pointers: List[str]):
+        self.pointers = pointers
+        self.builder = ijson.ObjectBuilder()
+        self.depth = 0
+
+    def feed(self, event: str, value) -> bool:
+        """Returns True once the value is complete."""
+        self.builder.event(event, value)
+        if event in ("start_map", "start_array"):
+            self.depth += 1
+        elif event in ("end_map", "end_array"):
+            self.depth -= 1
+        return self.depth == 0
+
+
+def extract(chunks: Iterable[bytes], pointers: Iterable[str]) -> Dict[str, Any]:
+    """
+    Evaluates JSON Pointers on a streamed document.
+
+    Arguments:
+        chunks: the (uncompressed) document in pieces of any size
+        pointers: JSON Pointers, e.g. "/header/commitment" or "/items/0"
+    Returns:
+        the value of every pointer, keyed by the pointer
+    Raises:
+        PointerError: a pointer is malformed
+        PointerNotFound: the document has no value at some of the pointers
+        InvalidDocument: the document is not valid JSON
+    """
+    targets = {}
+    pointers = list(dict.fromkeys(pointers))
+    for pointer in pointers:
+        targets.setdefault(parse_pointer(pointer), []).append(pointer)
+    #paths of the containers on the way to a target, only inside them the current path has to be computed
+    prefixes = {path[:length] for path in targets for length in range(len(path))}
+
+    found = {}
+    active = []
+    path = []
+    #per open container: whether it is on the way to a target
+    relevant = [True]
+
+    def handle(event: str, value):
+        for capture in list(active):
+            if capture.feed(event, value):
+                active.remove(capture)
+                result = capture.builder.value
+                for pointer in capture.pointers:
+                    found[pointer] = result
+
+        if event == "map_key":
+            path[-1] = value
+            return
+        if event in ("end_map", "end_array"):
+            path.pop()
+            relevant.pop()
+            return
+
+        #a value starts here: the next element of an array, the value of a key or the document itself
+        if path and isinstance(path[-1], int):
+            path[-1] += 1
+        current = None
+        if relevant[-1]:
+            current = tuple(str(token) for token in path)
+            if current in targets and targets[current][0] not in found:
+                capture = _Capture(targets[current])
+                if capture.feed(event, value):
+                    for pointer in capture.pointers:
+                        found[pointer] = capture.builder.value
+                else:
+                    active.append(capture)
+
+        if event == "start_map":
+            relevant.append(current is not None and current in prefixes)
+            path.append(None)
+        elif event == "start_array":
+            relevant.append(current is not None and current in prefixes)
+            path.append(-1)
+
+    events = ijson.sendable_list()
+    parser = ijson.basic_parse_coro(events, use_float=True)
+    try:
+        for chunk in chunks:
+            parser.send(bytes(chunk))
+            for event, value in events:
+                handle(event, value)
+            events.clear()
+
+            if len(found) == len(pointers):
+                return found
+        #a number at the end of the document (e.g. a document that is just a number) is only complete now
+        parser.close()
+        for event, value in events:
+            handle(event, value)
+    except ijson.JSONError as e:
+        raise InvalidDocument(f"Invalid JSON document: {e}") from e
+
+    missing = [pointer for pointer in pointers if pointer not in found]
+    if missing:
+        raise PointerNotFound(missing)
+    return found
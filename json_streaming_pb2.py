@@ -24,7 +24,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x14json_streaming.proto\"\x19\n\tJsonChunk\x12\x0c\n\x04\x64\x61ta\x18\x01 \x01(\x0c\"2\n\x0eUploadResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t\"\x1d\n\nGetRequest\x12\x0f\n\x07message\x18\x01 \x01(\t2i\n\x14JsonStreamingService\x12+\n\nUploadJson\x12\n.JsonChunk\x1a\x0f.UploadResponse(\x01\x12$\n\x07GetJson\x12\x0b.GetRequest\x1a\n.JsonChunk0\x01\x62\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x14json_streaming.proto\"\x19\n\tJsonChunk\x12\x0c\n\x04\x64\x61ta\x18\x01 \x01(\x0c\"B\n\x0eUploadResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t\x12\x0e\n\x06\x64igest\x18\x03 \x01(\t\"]\n\nGetRequest\x12\x0f\n\x07message\x18\x01 \x01(\t\x12\x10\n\x08pointers\x18\x02 \x03(\t\x12\x0e\n\x06offset\x18\x03 \x01(\x04\x12\x0e\n\x06length\x18\x04 \x01(\x04\x12\x0c\n\x04\x65tag\x18\x05 \x01(\t\"\x1b\n\x0bStatRequest\x12\x0c\n\x04name\x18\x01 \x01(\t\"\\\n\nObjectStat\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\x0c\n\x04size\x18\x02 \x01(\x04\x12\x0c\n\x04\x65tag\x18\x03 \x01(\t\x12\x0e\n\x06\x64igest\x18\x04 \x01(\t\x12\x14\n\x0c\x63ontent_type\x18\x05 \x01(\t\" \n\x0f\x42\x61tchGetRequest\x12\r\n\x05names\x18\x01 \x03(\t\"X\n\nBatchChunk\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\x0c\n\x04\x64\x61ta\x18\x02 \x01(\x0c\x12\x0c\n\x04last\x18\x03 \x01(\x08\x12\x0f\n\x07success\x18\x04 \x01(\x08\x12\x0f\n\x07message\x18\x05 \x01(\t\"A\n\x0f\x42\x61tchItemStatus\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\x0f\n\x07success\x18\x02 \x01(\x08\x12\x0f\n\x07message\x18\x03 \x01(\t\"K\n\x1a\x43reateUploadSessionRequest\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\x0c\n\x04size\x18\x02 \x01(\x04\x12\x11\n\tpart_size\x18\x03 \x01(\x04\"\x98\x01\n\rUploadSession\x12\x12\n\nsession_id\x18\x01 \x01(\t\x12\x0c\n\x04name\x18\x02 \x01(\t\x12\x0c\n\x04size\x18\x03 \x01(\x04\x12\x11\n\tpart_size\x18\x04 \x01(\x04\x12\x12\n\npart_count\x18\x05 \x01(\r\x12\x12\n\nexpires_at\x18\x06 \x01(\x01\x12\x1c\n\x05parts\x18\x07 \x03(\x0b\x32\r.UploadedPart\":\n\x0cUploadedPart\x12\x0e\n\x06number\x18\x01 \x01(\r\x12\x0c\n\x04\x65tag\x18\x02 \x01(\t\x12\x0c\n\x04size\x18\x03 \x01(\x04\"*\n\x14UploadSessionRequest\x12\x12\n\nsession_id\x18\x01 \x01(\t\"H\n\x0fUploadPartChunk\x12\x12\n\nsession_id\x18\x01 \x01(\t\x12\x13\n\x0bpart_number\x18\x02 \x01(\r\x12\x0c\n\x04\x64\x61ta\x18\x03 \x01(\x0c\x32\x9a\x04\n\x14JsonStreamingService\x12+\n\nUploadJson\x12\n.JsonChunk\x1a\x0f.UploadResponse(\x01\x12$\n\x07GetJson\x12\x0b.GetRequest\x1a\n.JsonChunk0\x01\x12!\n\x04Stat\x12\x0c.StatRequest\x1a\x0b.ObjectStat\x12+\n\x08\x42\x61tchGet\x12\x10.BatchGetRequest\x1a\x0b.BatchChunk0\x01\x12\x30\n\x0b\x42\x61tchUpload\x12\x0b.BatchChunk\x1a\x10.BatchItemStatus(\x01\x30\x01\x12\x42\n\x13\x43reateUploadSession\x12\x1b.CreateUploadSessionRequest\x1a\x0e.UploadSession\x12/\n\nUploadPart\x12\x10.UploadPartChunk\x1a\r.UploadedPart(\x01\x12\x39\n\x10GetUploadSession\x12\x15.UploadSessionRequest\x1a\x0e.UploadSession\x12?\n\x15\x43ompleteUploadSession\x12\x15.UploadSessionRequest\x1a\x0f.UploadResponse\x12<\n\x12\x41\x62ortUploadSession\x12\x15.UploadSessionRequest\x1a\x0f.UploadResponseb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -34,9 +34,29 @@ if not _descriptor._USE_C_DESCRIPTORS:
   _globals['_JSONCHUNK']._serialized_start=24
   _globals['_JSONCHUNK']._serialized_end=49
   _globals['_UPLOADRESPONSE']._serialized_start=51
-  _globals['_UPLOADRESPONSE']._serialized_end=101
-  _globals['_GETREQUEST']._serialized_start=103
-  _globals['_GETREQUEST']._serialized_end=132
-  _globals['_JSONSTREAMINGSERVICE']._serialized_start=134
-  _globals['_JSONSTREAMINGSERVICE']._serialized_end=239
+  _globals['_UPLOADRESPONSE']._serialized_end=117
+  _globals['_GETREQUEST']._serialized_start=119
+  _globals['_GETREQUEST']._serialized_end=212
+  _globals['_STATREQUEST']._serialized_start=214
+  _globals['_STATREQUEST']._serialized_end=241
+  _globals['_OBJECTSTAT']._serialized_start=243
+  _globals['_OBJECTSTAT']._serialized_end=335
+  _globals['_BATCHGETREQUEST']._serialized_start=337
+  _globals['_BATCHGETREQUEST']._serialized_end=369
+  _globals['_BATCHCHUNK']._serialized_start=371
+  _globals['_BATCHCHUNK']._serialized_end=459
+  _globals['_BATCHITEMSTATUS']._serialized_start=461
+  _globals['_BATCHITEMSTATUS']._serialized_end=526
+  _globals['_CREATEUPLOADSESSIONREQUEST']._serialized_start=528
+  _globals['_CREATEUPLOADSESSIONREQUEST']._serialized_end=603
+  _globals['_UPLOADSESSION']._serialized_start=606
+  _globals['_UPLOADSESSION']._serialized_end=758
+  _globals['_UPLOADEDPART']._serialized_start=760
+  _globals['_UPLOADEDPART']._serialized_end=818
+  _globals['_UPLOADSESSIONREQUEST']._serialized_start=820
+  _globals['_UPLOADSESSIONREQUEST']._serialized_end=862
+  _globals['_UPLOADPARTCHUNK']._serialized_start=864
+  _globals['_UPLOADPARTCHUNK']._serialized_end=936
+  _globals['_JSONSTREAMINGSERVICE']._serialized_start=939
+  _globals['_JSONSTREAMINGSERVICE']._serialized_end=1477
 # @@protoc_insertion_point(module_scope)
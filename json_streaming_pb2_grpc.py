@@ -44,6 +44,46 @@ class JsonStreamingServiceStub(object):
                 request_serializer=json__streaming__pb2.GetRequest.SerializeToString,
                 response_deserializer=json__streaming__pb2.JsonChunk.FromString,
                 _registered_method=True)
+        self.Stat = channel.unary_unary(
+                '/JsonStreamingService/Stat',
+                request_serializer=json__streaming__pb2.StatRequest.SerializeToString,
+                response_deserializer=json__streaming__pb2.ObjectStat.FromString,
+                _registered_method=True)
+        self.BatchGet = channel.unary_stream(
+                '/JsonStreamingService/BatchGet',
+                request_serializer=json__streaming__pb2.BatchGetRequest.SerializeToString,
+                response_deserializer=json__streaming__pb2.BatchChunk.FromString,
+                _registered_method=True)
+        self.BatchUpload = channel.stream_stream(
+                '/JsonStreamingService/BatchUpload',
+                request_serializer=json__streaming__pb2.BatchChunk.SerializeToString,
+                response_deserializer=json__streaming__pb2.BatchItemStatus.FromString,
+                _registered_method=True)
+        self.CreateUploadSession = channel.unary_unary(
+                '/JsonStreamingService/CreateUploadSession',
+                request_serializer=json__streaming__pb2.CreateUploadSessionRequest.SerializeToString,
+                response_deserializer=json__streaming__pb2.UploadSession.FromString,
+                _registered_method=True)
+        self.UploadPart = channel.stream_unary(
+                '/JsonStreamingService/UploadPart',
+                request_serializer=json__streaming__pb2.UploadPartChunk.SerializeToString,
+                response_deserializer=json__streaming__pb2.UploadedPart.FromString,
+                _registered_method=True)
+        self.GetUploadSession = channel.unary_unary(
+                '/JsonStreamingService/GetUploadSession',
+                request_serializer=json__streaming__pb2.UploadSessionRequest.SerializeToString,
+                response_deserializer=json__streaming__pb2.UploadSession.FromString,
+                _registered_method=True)
+        self.CompleteUploadSession = channel.unary_unary(
+                '/JsonStreamingService/CompleteUploadSession',
+                request_serializer=json__streaming__pb2.UploadSessionRequest.SerializeToString,
+                response_deserializer=json__streaming__pb2.UploadResponse.FromString,
+                _registered_method=True)
+        self.AbortUploadSession = channel.unary_unary(
+                '/JsonStreamingService/AbortUploadSession',
+                request_serializer=json__streaming__pb2.UploadSessionRequest.SerializeToString,
+                response_deserializer=json__streaming__pb2.UploadResponse.FromString,
+                _registered_method=True)
 
 
 class JsonStreamingServiceServicer(object):
@@ -61,6 +101,61 @@ class JsonStreamingServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def Stat(self, request, context):
+        """Size and ETag of an object, used to split a download into ranges (GetRequest offset/length)
+        and to make sure all ranges come from the same version (GetRequest etag).
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def BatchGet(self, request, context):
+        """Fetches many objects in one call; the chunks of different objects may interleave.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def BatchUpload(self, request_iterator, context):
+        """Stores many framed objects in one call and reports one status per object.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def CreateUploadSession(self, request, context):
+        """Resumable uploads: create a session, upload its numbered parts (in any order, in parallel,
+        again after a failure), then complete or abort it. GetUploadSession lists the parts the
+        server has, so an interrupted upload only sends the missing ones.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def UploadPart(self, request_iterator, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetUploadSession(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def CompleteUploadSession(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def AbortUploadSession(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_JsonStreamingServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -74,6 +169,46 @@ def add_JsonStreamingServiceServicer_to_server(servicer, server):
                     request_deserializer=json__streaming__pb2.GetRequest.FromString,
                     response_serializer=json__streaming__pb2.JsonChunk.SerializeToString,
             ),
+            'Stat': grpc.unary_unary_rpc_method_handler(
+                    servicer.Stat,
+                    request_deserializer=json__streaming__pb2.StatRequest.FromString,
+                    response_serializer=json__streaming__pb2.ObjectStat.SerializeToString,
+            ),
+            'BatchGet': grpc.unary_stream_rpc_method_handler(
+                    servicer.BatchGet,
+                    request_deserializer=json__streaming__pb2.BatchGetRequest.FromString,
+                    response_serializer=json__streaming__pb2.BatchChunk.SerializeToString,
+            ),
+            'BatchUpload': grpc.stream_stream_rpc_method_handler(
+                    servicer.BatchUpload,
+                    request_deserializer=json__streaming__pb2.BatchChunk.FromString,
+                    response_serializer=json__streaming__pb2.BatchItemStatus.SerializeToString,
+            ),
+            'CreateUploadSession': grpc.unary_unary_rpc_method_handler(
+                    servicer.CreateUploadSession,
+                    request_deserializer=json__streaming__pb2.CreateUploadSessionRequest.FromString,
+                    response_serializer=json__streaming__pb2.UploadSession.SerializeToString,
+            ),
+            'UploadPart': grpc.stream_unary_rpc_method_handler(
+                    servicer.UploadPart,
+                    request_deserializer=json__streaming__pb2.UploadPartChunk.FromString,
+                    response_serializer=json__streaming__pb2.UploadedPart.SerializeToString,
+            ),
+            'GetUploadSession': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetUploadSession,
+                    request_deserializer=json__streaming__pb2.UploadSessionRequest.FromString,
+                    response_serializer=json__streaming__pb2.UploadSession.SerializeToString,
+            ),
+            'CompleteUploadSession': grpc.unary_unary_rpc_method_handler(
+                    servicer.CompleteUploadSession,
+                    request_deserializer=json__streaming__pb2.UploadSessionRequest.FromString,
+                    response_serializer=json__streaming__pb2.UploadResponse.SerializeToString,
+            ),
+            'AbortUploadSession': grpc.unary_unary_rpc_method_handler(
+                    servicer.AbortUploadSession,
+                    request_deserializer=json__streaming__pb2.UploadSessionRequest.FromString,
+                    response_serializer=json__streaming__pb2.UploadResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'JsonStreamingService', rpc_method_handlers)
@@ -138,3 +273,219 @@ class JsonStreamingService(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def Stat(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/JsonStreamingService/Stat',
+            json__streaming__pb2.StatRequest.SerializeToString,
+            json__streaming__pb2.ObjectStat.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def BatchGet(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/JsonStreamingService/BatchGet',
+            json__streaming__pb2.BatchGetRequest.SerializeToString,
+            json__streaming__pb2.BatchChunk.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def BatchUpload(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(
+            request_iterator,
+            target,
+            '/JsonStreamingService/BatchUpload',
+            json__streaming__pb2.BatchChunk.SerializeToString,
+            json__streaming__pb2.BatchItemStatus.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def CreateUploadSession(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/JsonStreamingService/CreateUploadSession',
+            json__streaming__pb2.CreateUploadSessionRequest.SerializeToString,
+            json__streaming__pb2.UploadSession.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def UploadPart(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_unary(
+            request_iterator,
+            target,
+            '/JsonStreamingService/UploadPart',
+            json__streaming__pb2.UploadPartChunk.SerializeToString,
+            json__streaming__pb2.UploadedPart.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def GetUploadSession(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/JsonStreamingService/GetUploadSession',
+            json__streaming__pb2.UploadSessionRequest.SerializeToString,
+            json__streaming__pb2.UploadSession.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def CompleteUploadSession(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/JsonStreamingService/CompleteUploadSession',
+            json__streaming__pb2.UploadSessionRequest.SerializeToString,
+            json__streaming__pb2.UploadResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def AbortUploadSession(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/JsonStreamingService/AbortUploadSession',
+            json__streaming__pb2.UploadSessionRequest.SerializeToString,
+            json__streaming__pb2.UploadResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
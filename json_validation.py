@@ -0,0 +1,160 @@
+"""
+Incremental validation of JSON documents that arrive in pieces.
+
+JsonValidator runs the chunks of an upload through ijson's push parser while
+they are passed on to the storage, so a malformed document is rejected as soon
+as the first invalid byte arrives and the bytes are never parsed into objects
+or buffered for validation.
+
+The parser (yajl) re-reads a token that is split over several chunks from its
+start every time more data arrives, which is quadratic for the long strings
+proofs tend to contain (hex or base64 blobs). So the validator finds the string
+boundaries itself, checks the content of strings that cross a chunk boundary
+on its own (control characters, escapes, UTF-8) and only hands the parser the
+rest; such a string reaches the parser as "".
+"""
+import codecs
+import re
+
+import ijson
+
+#a quote after an odd number of backslashes is part of a string, after an even number it starts or ends one
+_ESCAPED_QUOTE = re.compile(rb'(?<!\\)(?:\\\\)*\\"')
+_UNESCAPED_QUOTE = re.compile(rb'(?<!\\)(?:\\\\)*"')
+_VALID_ESCAPE = re.compile(rb'\\(?:["\\/bfnrt]|u[0-9a-fA-F]{4})')
+#an escape that may be completed by the next chunk
+_INCOMPLETE_ESCAPE = re.compile(rb'\\(?:u[0-9a-fA-F]{0,3})?\Z')
+_CONTROL_CHARACTERS = bytes(range(0x20))
+
+
+class InvalidDocument(ValueError):
+    """The document is not valid JSON (up to where it was read)."""
+
+
+class _DiscardEvents:
+    """Event sink of the parser, validation only needs to know that parsing succeeds."""
+
+    def send(self, event):
+        pass
+
+
+def _escaped(data: bytes, position: int) -> bool:
+    """Whether the byte at position follows an odd number of backslashes."""
+    start = position
+    while start > 0 and data[start - 1] == 0x5C:
+        start -= 1
+    return (position - start) % 2 == 1
+
+
+def _first_quote(data: bytes) -> int:
+    """Position of the first quote that is not escaped, -1 if there is none."""
+    if b"\\" not in data:
+        return data.find(b'"')
+    match = _UNESCAPED_QUOTE.search(data)
+    return match.end() - 1 if match is not None else -1
+
+
+def _last_quote(data: bytes, start: int) -> int:
+    """Position of the last quote in data[start:] that is not escaped, -1 if there is none."""
+    position = data.rfind(b'"', start)
+    while position >= 0 and _escaped(data, position):
+        position = data.rfind(b'"', start, position)
+    return position
+
+
+class JsonValidator:
+    """Checks that the fed chunks form exactly one well-formed JSON document."""
+
+    def __init__(self):
+        self._parser = ijson.basic_parse_coro(_DiscardEvents())
+        self.size = 0
+        #inside a string that is checked here instead of by the parser
+        self._in_string = False
+        #end of the string content seen so far that may be an incomplete escape
+        self._held = b""
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+
+    def feed(self, chunk: bytes):
+        """Raises InvalidDocument as soon as the data received so far can't be the start of a JSON document."""
+        if not chunk:
+            return
+        self.size += len(chunk)
+        data = self._held + bytes(chunk) if self._held else bytes(chunk)
+        self._held = b""
+
+        position = outside = 0
+        if self._in_string:
+            end = _first_quote(data)
+            if end < 0:
+                self._held = self._check_string(data, final=False)
+                return
+            self._check_string(data[:end], final=True)
+            self._in_string = False
+            #the closing quote goes to the parser, which saw the opening one
+            position = end
+            outside = end + 1
+
+        #an odd number of quotes after that: the chunk ends inside a string, which starts at the last one
+        quotes = data.count(b'"', outside)
+        if quotes and data.find(b"\\", outside) >= 0:
+            quotes -= len(_ESCAPED_QUOTE.findall(data, outside))
+        opening = _last_quote(data, outside) if quotes % 2 else -1
+
+        if opening < 0:
+            self._send(data[position:])
+        else:
+            self._send(data[position:opening + 1])
+            self._in_string = True
+            self._held = self._check_string(data[opening + 1:], final=False)
+
+    def close(self):
+        """Raises InvalidDocument if the document is empty or incomplete."""
+        if self._in_string:
+            raise InvalidDocument("Invalid JSON document: unterminated string")
+        try:
+            self._parser.close()
+        except (ijson.JSONError, UnicodeDecodeError) as e:
+            raise InvalidDocument(f"Invalid JSON document: {e}") from e
+
+    def _send(self, data: bytes):
+        if not data:
+            return
+        try:
+            self._parser.send(data)
+        except (ijson.JSONError, UnicodeDecodeError) as e:
+            raise InvalidDocument(f"Invalid JSON document: {e}") from e
+
+    def _check_string(self, content: bytes, final: bool) -> bytes:
+        """
+        Checks a piece of string content the parser does not see; returns the
+        bytes at its end that have to wait for the next chunk (an incomplete escape).
+        """
+        if len(content.translate(None, _CONTROL_CHARACTERS)) != len(content):
+            raise InvalidDocument("Invalid JSON document: control character in string")
+
+        held = b""
+        if b"\\" in content:
+            incomplete = None if final else _INCOMPLETE_ESCAPE.search(content)
+            if incomplete is not None:
+                start = incomplete.start()
+                #unless its backslash is itself escaped
+                if (start - len(content[:start].rstrip(b"\\"))) % 2 == 0:
+                    held = content[start:]
+                    content = content[:start]
+            if b"\\" in _VALID_ESCAPE.sub(b"", content):
+                raise InvalidDocument("Invalid JSON document: invalid escape in string")
+
+        try:
+            self._utf8.decode(content, final)
+        except UnicodeDecodeError as e:
+            raise InvalidDocument(f"Invalid JSON document: {e}") from e
+        if final:
+            self._utf8.reset()
+        return held
+
+
+def validate_json(data: bytes):
+    """Raises InvalidDocument unless data is one well-formed JSON document."""
+    validator = JsonValidator()
+    validator.feed(data)
+    validator.close()
@@ -0,0 +1,303 @@
+"""
+Persistent index of the stored objects: name, size, digest, content type and timestamps.
+
+The write and delete paths record every change, reconcile() brings the index in
+line with a full listing of the storage (objects written by other replicas or
+directly to the bucket). Listing pages are answered from the index with a range
+scan over the primary key, without touching the storage.
+
+The index is an SQLite database in WAL mode, so the worker processes of one
+server share it; ":memory:" keeps it inside the process.
+"""
+import os
+import time
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table, case, create_engine, delete, event, func, \
+    select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.pool import StaticPool
+
+from storage import ObjectInfo
+
+#number of listed objects compared with the index per transaction
+RECONCILE_BATCH_SIZE = 500
+
+_schema = MetaData()
+
+objects = Table(
+    "objects", _schema,
+    Column("name", String, primary_key=True),
+    #size of the document (uncompressed)
+    Column("size", Integer, nullable=False),
+    Column("digest", String),
+    Column("content_type", String),
+    #etag of the stored object, tells reconcile whether an indexed object changed
+    Column("etag", String),
+    Column("created_at", Float, nullable=False),
+    Column("updated_at", Float, nullable=False),
+    #start of the last reconcile that found the object in the storage
+    Column("seen_at", Float),
+    #deleted names are kept until the next reconcile, so a listing taken before the delete can't bring them back
+    Column("deleted_at", Float),
+)
+
+_state = Table(
+    "index_state", _schema,
+    Column("key", String, primary_key=True),
+    Column("value", Float, nullable=False),
+)
+
+
+class IndexedObject(NamedTuple):
+    name: str
+    size: int
+    digest: Optional[str]
+    content_type: Optional[str]
+    created_at: float
+    updated_at: float
+    #etag of the stored object the entry describes
+    etag: Optional[str] = None
+
+
+class ObjectDescription(NamedTuple):
+    """What reconcile records about an object that is new or changed since it was indexed."""
+    size: int
+    digest: Optional[str]
+    content_type: Optional[str]
+    #etag of the stored document, if the listing shows another one (content addressed pointers)
+    etag: Optional[str] = None
+
+
+def _prefix_end(prefix: str) -> Optional[str]:
+    """Smallest string that is greater than every string starting with prefix, None if there is none."""
+    prefix = prefix.rstrip(chr(0x10FFFF))
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _batches(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class MetadataIndex:
+    """
+    Object metadata in an SQLite database.
+
+    Arguments:
+        path: database file (its directory is created if missing) or ":memory:"
+    """
+
+    def __init__(self, path: str):
+        if path == ":memory:":
+            #one shared connection, every new connection to ":memory:" would open a separate empty database
+            self.engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            #SQLite's busy timeout: how long a writer waits for the lock another process holds
+            self.engine = create_engine(f"sqlite:///{path}", connect_args={"timeout": 30})
+            event.listen(self.engine, "connect", self._configure_connection)
+        _schema.create_all(self.engine)
+
+    @staticmethod
+    def _configure_connection(connection, _record):
+        cursor = connection.cursor()
+        #readers and the writer don't block each other; NORMAL only syncs the log at checkpoints
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+    def record_write(self, name: str, size: int, digest: Optional[str], content_type: Optional[str],
+                     etag: Optional[str] = None):
+        """Records that name was (re)written; an existing name keeps its creation time."""
+        now = time.time()
+        statement = insert(objects).values(
+            name=name, size=size, digest=digest, content_type=content_type, etag=etag,
+            created_at=now, updated_at=now
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[objects.c.name],
+            set_={
+                "size": statement.excluded.size,
+                "digest": statement.excluded.digest,
+                "content_type": statement.excluded.content_type,
+                "etag": statement.excluded.etag,
+                "updated_at": statement.excluded.updated_at,
+                #a name that had been deleted starts over
+                "created_at": case((objects.c.deleted_at.is_(None), objects.c.created_at), else_=now),
+                "deleted_at": None,
+            }
+        )
+        with self.engine.begin() as connection:
+            connection.execute(statement)
+
+    def record_delete(self, name: str):
+        with self.engine.begin() as connection:
+            connection.execute(
+                update(objects).where(objects.c.name == name, objects.c.deleted_at.is_(None))
+                .values(deleted_at=time.time())
+            )
+
+    def get(self, name: str) -> Optional[IndexedObject]:
+        with self.engine.connect() as connection:
+            row = connection.execute(
+                select(*self._columns()).where(objects.c.name == name, objects.c.deleted_at.is_(None))
+            ).first()
+        return IndexedObject(*row) if row is not None else None
+
+    def page(self, prefix: str = "", after: str = "", limit: int = 100) -> Tuple[List[IndexedObject], Optional[str]]:
+        """
+        Returns up to limit objects whose names start with prefix, in name order.
+
+        Arguments:
+            prefix: only names starting with it
+            after: only names greater than it (the cursor returned with the previous page)
+            limit: page size
+        Returns:
+            the objects and the cursor of the next page (None on the last page)
+        """
+        query = select(*self._columns()).where(objects.c.deleted_at.is_(None))
+        #a range on the primary key instead of LIKE, which is case insensitive in SQLite and can't use the index
+        if prefix:
+            query = query.where(objects.c.name >= prefix)
+            end = _prefix_end(prefix)
+            if end is not None:
+                query = query.where(objects.c.name < end)
+        if after:
+            query = query.where(objects.c.name > after)
+        query = query.order_by(objects.c.name).limit(limit + 1)
+
+        with self.engine.connect() as connection:
+            rows = connection.execute(query).all()
+        page = [IndexedObject(*row) for row in rows[:limit]]
+        return page, (page[-1].name if len(rows) > limit else None)
+
+    def __len__(self) -> int:
+        with self.engine.connect() as connection:
+            return connection.execute(
+                select(func.count()).select_from(objects).where(objects.c.deleted_at.is_(None))
+            ).scalar_one()
+
+    def claim_reconcile(self, min_interval: float) -> bool:
+        """
+        Returns True if no other process started a reconcile within the last
+        min_interval seconds (and records that this one starts now).
+        """
+        return self.claim("reconcile_started", min_interval)
+
+    def claim(self, key: str, min_interval: float) -> bool:
+        """
+        Returns True if no other process claimed key within the last
+        min_interval seconds (and records that this one claims it now).
+        """
+        now = time.time()
+        with self.engine.begin() as connection:
+            connection.execute(insert(_state).values(key=key, value=0).on_conflict_do_nothing())
+            claimed = connection.execute(
+                update(_state).where(_state.c.key == key, _state.c.value <= now - min_interval).values(value=now)
+            )
+        return claimed.rowcount == 1
+
+    def reconcile(self, listing: Iterable[ObjectInfo],
+                  describe: Callable[[str], Optional[ObjectDescription]],
+                  listed_etag: Optional[Callable[[str], str]] = None) -> int:
+        """
+        Brings the index in line with a full listing of the storage.
+
+        Listed objects that are not indexed or whose etag changed are looked up
+        with describe (None if the object is gone by then); indexed objects that
+        are not listed are removed. Writes and deletes recorded while the
+        listing is consumed win over it.
+
+        Arguments:
+            listing: every object in the storage (usually StorageBackend.list())
+            describe: returns size, digest and content type of an object
+            listed_etag: the etag the listing shows for the document with a digest, if it is not the etag of the
+                         document (content addressed storage lists pointers)
+        Returns:
+            number of listed objects
+        """
+        started = time.time()
+        listed = 0
+        for batch in _batches(listing, RECONCILE_BATCH_SIZE):
+            listed += len(batch)
+            with self.engine.connect() as connection:
+                known = {
+                    row.name: row for row in connection.execute(
+                        select(objects.c.name, objects.c.etag, objects.c.digest, objects.c.deleted_at)
+                        .where(objects.c.name.in_([info.name for info in batch]))
+                    )
+                }
+
+            unchanged = []
+            changed = []
+            #the storage calls of describe happen outside of a transaction, it would block the writers
+            for info in batch:
+                row = known.get(info.name)
+                if row is not None and row.deleted_at is None and self._same(row, info, listed_etag):
+                    unchanged.append(info.name)
+                    continue
+                description = describe(info.name)
+                if description is not None:
+                    changed.append((info, description))
+
+            with self.engine.begin() as connection:
+                if unchanged:
+                    connection.execute(
+                        update(objects).where(objects.c.name.in_(unchanged)).values(seen_at=started)
+                    )
+                for info, description in changed:
+                    connection.execute(self._upsert_listed(info, description, started))
+
+        with self.engine.begin() as connection:
+            connection.execute(
+                delete(objects).where(
+                    (objects.c.seen_at.is_(None)) | (objects.c.seen_at < started),
+                    objects.c.updated_at < started,
+                    (objects.c.deleted_at.is_(None)) | (objects.c.deleted_at < started),
+                )
+            )
+        return listed
+
+    @staticmethod
+    def _same(row, info: ObjectInfo, listed_etag: Optional[Callable[[str], str]]) -> bool:
+        """True if the listed object is the document the index row records."""
+        if row.etag == info.etag:
+            return True
+        return listed_etag is not None and row.digest is not None and listed_etag(row.digest) == info.etag
+
+    @staticmethod
+    def _upsert_listed(info: ObjectInfo, description: ObjectDescription, started: float):
+        modified = info.last_modified.timestamp() if info.last_modified is not None else started
+        statement = insert(objects).values(
+            name=info.name, size=description.size, digest=description.digest,
+            content_type=description.content_type, etag=description.etag or info.etag,
+            created_at=modified, updated_at=modified, seen_at=started
+        )
+        return statement.on_conflict_do_update(
+            index_elements=[objects.c.name],
+            set_={
+                "size": statement.excluded.size,
+                "digest": statement.excluded.digest,
+                "content_type": statement.excluded.content_type,
+                "etag": statement.excluded.etag,
+                "updated_at": statement.excluded.updated_at,
+                "seen_at": started,
+                "created_at": case((objects.c.deleted_at.is_(None), objects.c.created_at), else_=modified),
+                "deleted_at": None,
+            },
+            #the listing is older than writes and deletes recorded since the reconcile started
+            where=(objects.c.updated_at < started) & (objects.c.deleted_at.is_(None) | (objects.c.deleted_at < started))
+        )
+
+    @staticmethod
+    def _columns():
+        return (objects.c.name, objects.c.size, objects.c.digest, objects.c.content_type,
+                objects.c.created_at, objects.c.updated_at, objects.c.etag)
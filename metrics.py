@@ -0,0 +1,353 @@
+"""
+Prometheus metrics of the PCF registry, served by GET /metrics.
+
+    HTTP routes     install_http_metrics(app): latency by route/method/status, bytes, streams in flight
+    gRPC methods    GrpcMetricsInterceptor: latency by method/status code, bytes, streams in flight
+    thread pools    PoolMonitor: calls waiting for and running on a pool, time spent waiting
+    storage         observe_storage (observer of storage.ObservedBackend): latency and errors by operation
+    MinIO pool      StoragePoolMetrics: connections in use, time waited for one, new connections, retries
+    write-behind    observe_write_behind: writes waiting for the flush, age of the oldest, flushes by result
+    admission       observe_admission_rejected: calls turned away by admission.py, by method and reason
+
+With several worker processes (gunicorn.conf.py sets PROMETHEUS_MULTIPROC_DIR)
+every process writes its values to that directory and /metrics reports the
+sum over all live workers.
+"""
+import asyncio
+import os
+import time
+from concurrent import futures
+from typing import Callable, Optional
+
+import grpc
+from flask import Flask, Response, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+
+from storage import ConnectionPoolObserver, ObjectNotFound
+
+#from fast cache hits up to multi-minute uploads of large proofs
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "pcf_http_request_duration_seconds", "HTTP requests until the response body was sent",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS
+)
+HTTP_RECEIVED_BYTES = Counter("pcf_http_received_bytes_total", "HTTP request body bytes", ["method", "route"])
+HTTP_SENT_BYTES = Counter("pcf_http_sent_bytes_total", "HTTP response body bytes", ["method", "route"])
+HTTP_STREAMS_IN_FLIGHT = Gauge(
+    "pcf_http_streams_in_flight", "HTTP responses being streamed", ["route"], multiprocess_mode="livesum"
+)
+
+GRPC_REQUEST_SECONDS = Histogram(
+    "pcf_grpc_request_duration_seconds", "gRPC calls until the last message was sent",
+    ["method", "code"], buckets=LATENCY_BUCKETS
+)
+GRPC_RECEIVED_BYTES = Counter("pcf_grpc_received_bytes_total", "Serialized size of received gRPC messages", ["method"])
+GRPC_SENT_BYTES = Counter("pcf_grpc_sent_bytes_total", "Serialized size of sent gRPC messages", ["method"])
+GRPC_STREAMS_IN_FLIGHT = Gauge(
+    "pcf_grpc_streams_in_flight", "gRPC calls in progress", ["method"], multiprocess_mode="livesum"
+)
+
+POOL_QUEUED = Gauge(
+    "pcf_thread_pool_queued", "Calls waiting for a thread of the pool", ["pool"], multiprocess_mode="livesum"
+)
+POOL_ACTIVE = Gauge(
+    "pcf_thread_pool_active", "Calls running on the pool", ["pool"], multiprocess_mode="livesum"
+)
+POOL_WAIT_SECONDS = Histogram(
+    "pcf_thread_pool_wait_seconds", "Time calls waited for a thread of the pool", ["pool"], buckets=LATENCY_BUCKETS
+)
+
+STORAGE_SECONDS = Histogram(
+    "pcf_storage_operation_duration_seconds", "Calls of the storage engine",
+    ["backend", "operation"], buckets=LATENCY_BUCKETS
+)
+STORAGE_ERRORS = Counter(
+    "pcf_storage_errors_total", "Failed calls of the storage engine", ["backend", "operation", "code"]
+)
+
+#waiting for a pooled connection should take microseconds unless the pool is too small
+POOL_WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30)
+
+STORAGE_POOL_SIZE = Gauge(
+    "pcf_storage_pool_size", "Connections the MinIO pool keeps per host", multiprocess_mode="livesum"
+)
+STORAGE_POOL_IN_USE = Gauge(
+    "pcf_storage_pool_connections_in_use", "MinIO connections taken from the pool", multiprocess_mode="livesum"
+)
+STORAGE_POOL_WAIT_SECONDS = Histogram(
+    "pcf_storage_pool_wait_seconds", "Time requests waited for a MinIO connection", buckets=POOL_WAIT_BUCKETS
+)
+STORAGE_POOL_CREATED = Counter("pcf_storage_pool_connections_created_total", "MinIO connections opened")
+STORAGE_RETRIES = Counter(
+    "pcf_storage_retries_total", "MinIO requests repeated after an error", ["method", "reason"]
+)
+
+WRITE_BEHIND_PENDING = Gauge(
+    "pcf_write_behind_pending_writes", "Writes in the write-behind log that are not in the storage yet",
+    multiprocess_mode="livemax"
+)
+WRITE_BEHIND_OLDEST_SECONDS = Gauge(
+    "pcf_write_behind_oldest_pending_seconds", "Age of the oldest write waiting for the flush",
+    multiprocess_mode="livemax"
+)
+WRITE_BEHIND_FLUSHES = Counter(
+    "pcf_write_behind_flushes_total", "Writes of the write-behind log flushed to the storage", ["result"]
+)
+
+ADMISSION_REJECTED = Counter(
+    "pcf_admission_rejected_total", "Calls turned away by admission control", ["protocol", "method", "reason"]
+)
+
+
+def metrics_response() -> Response:
+    """The current value of all metrics in the Prometheus text format."""
+    registry = REGISTRY
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+# ------------------ HTTP --------------------------------------------#
+
+class _CountingBody:
+    """Wraps a streamed response body to count the bytes actually sent."""
+
+    def __init__(self, body):
+        self.body = body
+        self.sent = 0
+
+    def __iter__(self):
+        for chunk in self.body:
+            self.sent += len(chunk)
+            yield chunk
+
+    def close(self):
+        close = getattr(self.body, "close", None)
+        if close is not None:
+            close()
+
+
+def install_http_metrics(app: Flask):
+    """Measures every request of the Flask app, streamed responses until their body is closed."""
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started_at = time.perf_counter()
+
+    @app.after_request
+    def measure(response: Response) -> Response:
+        started_at = g.get("metrics_started_at", time.perf_counter())
+        method = request.method
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        status = str(response.status_code)
+        HTTP_RECEIVED_BYTES.labels(method, route).inc(request.content_length or 0)
+
+        if not response.is_streamed:
+            HTTP_SENT_BYTES.labels(method, route).inc(response.content_length or 0)
+            response.call_on_close(
+                lambda: HTTP_REQUEST_SECONDS.labels(method, route, status).observe(time.perf_counter() - started_at)
+            )
+            return response
+
+        body = _CountingBody(response.response)
+        response.response = body
+        in_flight = HTTP_STREAMS_IN_FLIGHT.labels(route)
+        in_flight.inc()
+
+        def finished():
+            in_flight.dec()
+            HTTP_SENT_BYTES.labels(method, route).inc(body.sent)
+            HTTP_REQUEST_SECONDS.labels(method, route, status).observe(time.perf_counter() - started_at)
+
+        response.call_on_close(finished)
+        return response
+
+
+# ------------------ gRPC --------------------------------------------#
+
+def _message_size(message) -> int:
+    return message.ByteSize() if hasattr(message, "ByteSize") else 0
+
+
+class GrpcMetricsInterceptor(grpc.aio.ServerInterceptor):
+    """Measures every call of the asyncio gRPC server, streaming calls until their last message."""
+
+    async def intercept_service(self, continuation, handler_call_details):
+        handler = await continuation(handler_call_details)
+        if handler is None:
+            return None
+
+        method = handler_call_details.method.rsplit("/", 1)[-1]
+        if handler.response_streaming:
+            behavior = handler.stream_stream if handler.request_streaming else handler.unary_stream
+            wrapped = self._streaming_response(method, behavior, handler.request_streaming)
+            factory = grpc.stream_stream_rpc_method_handler if handler.request_streaming \
+                else grpc.unary_stream_rpc_method_handler
+        else:
+            behavior = handler.stream_unary if handler.request_streaming else handler.unary_unary
+            wrapped = self._unary_response(method, behavior, handler.request_streaming)
+            factory = grpc.stream_unary_rpc_method_handler if handler.request_streaming \
+                else grpc.unary_unary_rpc_method_handler
+
+        return factory(
+            wrapped,
+            request_deserializer=handler.request_deserializer,
+            response_serializer=handler.response_serializer
+        )
+
+    @staticmethod
+    def _count_requests(method: str, request_or_iterator, request_streaming: bool):
+        received = GRPC_RECEIVED_BYTES.labels(method)
+        if not request_streaming:
+            received.inc(_message_size(request_or_iterator))
+            return request_or_iterator
+
+        async def counted():
+            async for message in request_or_iterator:
+                received.inc(_message_size(message))
+                yield message
+
+        return counted()
+
+    @staticmethod
+    def _finish(method: str, context, started_at: float, error: Optional[BaseException]):
+        if isinstance(error, asyncio.CancelledError):
+            code = grpc.StatusCode.CANCELLED
+        elif error is not None and not isinstance(error, grpc.aio.AbortError):
+            code = grpc.StatusCode.UNKNOWN
+        else:
+            code = context.code() or grpc.StatusCode.OK
+        name = code.name if isinstance(code, grpc.StatusCode) else str(code)
+        GRPC_REQUEST_SECONDS.labels(method, name).observe(time.perf_counter() - started_at)
+        GRPC_STREAMS_IN_FLIGHT.labels(method).dec()
+
+    def _unary_response(self, method: str, behavior: Callable, request_streaming: bool):
+        async def wrapped(request_or_iterator, context):
+            started_at = time.perf_counter()
+            GRPC_STREAMS_IN_FLIGHT.labels(method).inc()
+            error = None
+            try:
+                response = await behavior(self._count_requests(method, request_or_iterator, request_streaming), context)
+                GRPC_SENT_BYTES.labels(method).inc(_message_size(response))
+                return response
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                self._finish(method, context, started_at, error)
+
+        return wrapped
+
+    def _streaming_response(self, method: str, behavior: Callable, request_streaming: bool):
+        async def wrapped(request_or_iterator, context):
+            started_at = time.perf_counter()
+            GRPC_STREAMS_IN_FLIGHT.labels(method).inc()
+            sent = GRPC_SENT_BYTES.labels(method)
+            error = None
+            try:
+                async for response in behavior(self._count_requests(method, request_or_iterator, request_streaming), context):
+                    sent.inc(_message_size(response))
+                    yield response
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                self._finish(method, context, started_at, error)
+
+        return wrapped
+
+
+# ------------------ Thread pools and storage ------------------------#
+
+class PoolMonitor:
+    """Counts the calls waiting for and running on a thread pool."""
+
+    def __init__(self, pool: futures.Executor, name: str):
+        self.pool = pool
+        self.queued = POOL_QUEUED.labels(name)
+        self.active = POOL_ACTIVE.labels(name)
+        self.wait_seconds = POOL_WAIT_SECONDS.labels(name)
+
+    def submit(self, func: Callable) -> futures.Future:
+        submitted_at = time.perf_counter()
+
+        def run():
+            self.queued.dec()
+            self.wait_seconds.observe(time.perf_counter() - submitted_at)
+            self.active.inc()
+            try:
+                return func()
+            finally:
+                self.active.dec()
+
+        self.queued.inc()
+        future = self.pool.submit(run)
+        #a call cancelled before a thread picked it up never runs, so it leaves the queue here
+        future.add_done_callback(lambda done: self.queued.dec() if done.cancelled() else None)
+        return future
+
+
+def storage_error_code(error: BaseException) -> str:
+    """S3 error code (NoSuchKey, AccessDenied, ...) of a failed storage call, else the type of the error."""
+    code = getattr(error.__cause__, "code", None) or getattr(error, "code", None)
+    if isinstance(code, str) and code:
+        return code
+    if isinstance(error, ObjectNotFound):
+        return "NotFound"
+    return type(error).__name__
+
+
+def observe_storage(backend: str, operation: str, seconds: float, error: Optional[BaseException]):
+    """Observer of storage.ObservedBackend."""
+    STORAGE_SECONDS.labels(backend, operation).observe(seconds)
+    if error is not None:
+        STORAGE_ERRORS.labels(backend, operation, storage_error_code(error)).inc()
+
+
+class StoragePoolMetrics(ConnectionPoolObserver):
+    """
+    Observer of the MinIO connection pool (storage.minio_http_client). The pool
+    is too small when the connections in use exceed its size (extra connections
+    are opened and closed again, so the created counter keeps growing) or, with
+    a blocking pool, when the wait time grows.
+    """
+
+    def __init__(self, pool_size: int):
+        STORAGE_POOL_SIZE.set(pool_size)
+
+    def waited(self, seconds: float):
+        STORAGE_POOL_WAIT_SECONDS.observe(seconds)
+
+    def acquired(self):
+        STORAGE_POOL_IN_USE.inc()
+
+    def released(self):
+        STORAGE_POOL_IN_USE.dec()
+
+    def created(self):
+        STORAGE_POOL_CREATED.inc()
+
+    def retried(self, method: str, reason: str):
+        STORAGE_RETRIES.labels(method, reason).inc()
+
+
+# ------------------ Write-behind ------------------------------------#
+
+def observe_write_behind(flushed: int, failed: int, pending: int, oldest_seconds: float):
+    """Records a flush round of the write-behind log (write_behind.FlushResult)."""
+    if flushed:
+        WRITE_BEHIND_FLUSHES.labels("ok").inc(flushed)
+    if failed:
+        WRITE_BEHIND_FLUSHES.labels("error").inc(failed)
+    WRITE_BEHIND_PENDING.set(pending)
+    WRITE_BEHIND_OLDEST_SECONDS.set(oldest_seconds)
+
+
+# ------------------ Admission control -------------------------------#
+
+def observe_admission_rejected(protocol: str, method: str, reason: str):
+    ADMISSION_REJECTED.labels(protocol, method or "unmatched", reason).inc()
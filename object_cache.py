@@ -0,0 +1,149 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, NamedTuple, Optional
+
+
+class CachedObject(NamedTuple):
+    """Stored bytes of an object together with their ETag and encoding ("" if stored uncompressed)."""
+    data: bytes
+    etag: str
+    encoding: str = ""
+
+
+class ObjectCache:
+    """
+    Byte-budgeted LRU cache of whole objects, shared by the HTTP and gRPC read paths.
+
+    Entries larger than max_entry_bytes are never cached, entries older than
+    ttl_seconds are treated as misses, and the least recently used entries are
+    evicted once the cached bytes exceed max_bytes. A max_bytes of 0 disables the cache.
+
+    The cache is per process; is_current(name, ticket) is asked on every hit
+    whether the object is unchanged since the fetch that started at ticket
+    (writes and deletes of other processes), a False drops the entry.
+    """
+
+    #how long invalidations are remembered to reject puts of fetches that started before them
+    INVALIDATION_WINDOW_SECONDS = 60.0
+
+    def __init__(self, max_bytes: int, max_entry_bytes: int, ttl_seconds: float,
+                 is_current: Optional[Callable[[str, float], bool]] = None):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes, max_bytes)
+        self.ttl_seconds = ttl_seconds
+        self.is_current = is_current
+        self._entries = OrderedDict()  # name -> (CachedObject, stored_at, ticket)
+        self._invalidated = {}  # name -> time of the last invalidation
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.rejections = 0
+        self.stale = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def ticket(self) -> float:
+        """Marks the start of a backend fetch; pass the result to put() once the fetch is done."""
+        #wall clock time, is_current compares it with the write times other processes record
+        return time.time()
+
+    def accepts(self, size: int) -> bool:
+        """True if an object of the given size would be cached at all."""
+        return self.enabled and size <= self.max_entry_bytes
+
+    def get(self, name: str) -> Optional[CachedObject]:
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            cached, stored_at, ticket = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                self._remove(name)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+        #outside of the lock, the check may have to ask a database
+        if self.is_current is not None and not self.is_current(name, ticket):
+            with self._lock:
+                if self._entries.get(name) is entry:
+                    self._remove(name)
+                self.stale += 1
+                self.misses += 1
+            return None
+
+        with self._lock:
+            if name in self._entries:
+                self._entries.move_to_end(name)
+            self.hits += 1
+        return cached
+
+    def put(self, name: str, cached: CachedObject, ticket: float) -> bool:
+        """
+        Stores an object that was fetched after ticket() returned the given value.
+
+        The object is dropped if it is too large or if the name was invalidated
+        while it was being fetched (the bytes may then predate a newer write).
+        """
+        size = len(cached.data)
+        if not self.accepts(size):
+            return False
+
+        with self._lock:
+            if self._invalidated.get(name, -1.0) >= ticket:
+                self.rejections += 1
+                return False
+
+            self._remove(name)
+            self._entries[name] = (cached, time.monotonic(), ticket)
+            self._size += size
+            while self._size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+        return True
+
+    def invalidate(self, name: str):
+        """Drops the cached copy of an object after it was written or deleted."""
+        if not self.enabled:
+            return
+
+        now = time.time()
+        with self._lock:
+            self._remove(name)
+            self._invalidated[name] = now
+            if len(self._invalidated) > 1024:
+                horizon = now - self.INVALIDATION_WINDOW_SECONDS
+                self._invalidated = {key: at for key, at in self._invalidated.items() if at >= horizon}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "rejections": self.rejections,
+                "stale": self.stale,
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "max_entry_bytes": self.max_entry_bytes,
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+    def _remove(self, name: str):
+        entry = self._entries.pop(name, None)
+        if entry is not None:
+            self._size -= len(entry[0].data)
@@ -0,0 +1,246 @@
+"""
+Coalescing of concurrent reads of the same object ("single flight").
+
+When many clients ask for the same object at once (e.g. right after a proof was
+published), only the first read fetches it from the storage. The fetch runs on
+a thread pool and keeps every chunk it has read, and all readers follow it:
+blocking readers (HTTP responses) and asyncio readers (gRPC streams) alike.
+Readers that join while the fetch is running start from the first chunk too, so
+the storage sees one GET per object and burst, not one per reader.
+
+Only objects up to max_bytes are shared, since the whole object stays in memory
+until the fetch is complete. The size is known before the object is opened (from
+size_hint, else a stat), so a larger object is never opened by the fetch: every
+reader opens a stream of its own and the storage sees one GET per reader.
+"""
+import asyncio
+import threading
+from concurrent import futures
+from typing import Callable, Dict, Iterator, List, Optional
+
+from storage import ObjectInfo, StorageBackend
+
+
+class Flight:
+    """
+    One fetch of an object that any number of readers follow.
+
+    wait() (or wait_async()) returns the object info once the object is open;
+    the chunks are then read with chunks() (or chunks_async()) from the first one.
+    A flight that is not shared has no info, its readers open the object themselves.
+    """
+
+    def __init__(self):
+        self.info: Optional[ObjectInfo] = None
+        self.opened = False
+        self.done = False
+        self.error: Optional[BaseException] = None
+        #False if the object is too large to share, its readers open streams of their own
+        self.shared = True
+        self._chunks: List[bytes] = []
+        self._condition = threading.Condition()
+        #futures of asyncio readers waiting for the next change, with their loops
+        self._waiters = []
+
+    # ---------------- the fetch ----------------
+
+    def _change(self, update: Callable[[], None]):
+        with self._condition:
+            update()
+            self._condition.notify_all()
+            waiters, self._waiters = self._waiters, []
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(_wake, waiter)
+
+    def _open(self, info: Optional[ObjectInfo], shared: bool = True):
+        def update():
+            self.info = info
+            self.opened = True
+            self.shared = shared
+        self._change(update)
+
+    def _append(self, chunk: bytes):
+        self._change(lambda: self._chunks.append(chunk))
+
+    def _finish(self, error: Optional[BaseException] = None):
+        def update():
+            self.done = True
+            self.error = error
+        self._change(update)
+
+    # ---------------- readers ----------------
+
+    def _opened(self) -> bool:
+        return self.opened or self.error is not None
+
+    def _check(self):
+        if self.error is not None:
+            raise self.error
+
+    def wait(self) -> Optional[ObjectInfo]:
+        """Waits until the object is open (None if not shared); raises the error of the fetch (e.g. ObjectNotFound)."""
+        with self._condition:
+            self._condition.wait_for(self._opened)
+            if not self.opened:
+                self._check()
+            return self.info
+
+    async def wait_async(self) -> Optional[ObjectInfo]:
+        while True:
+            with self._condition:
+                if self._opened():
+                    if not self.opened:
+                        self._check()
+                    return self.info
+                waiter = self._register()
+            await waiter
+
+    def _register(self) -> asyncio.Future:
+        """A future that is resolved on the next change (called with the condition held)."""
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._waiters.append((loop, waiter))
+        return waiter
+
+    def chunks(self) -> Iterator[bytes]:
+        """The stored chunks of the object from the first one, waiting for the fetch where needed."""
+        index = 0
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: index < len(self._chunks) or self.done)
+                if index < len(self._chunks):
+                    chunk = self._chunks[index]
+                else:
+                    self._check()
+                    return
+            yield chunk
+            index += 1
+
+    async def chunks_async(self):
+        index = 0
+        while True:
+            with self._condition:
+                if index < len(self._chunks):
+                    chunk = self._chunks[index]
+                elif self.done:
+                    self._check()
+                    return
+                else:
+                    chunk = None
+                    waiter = self._register()
+            if chunk is None:
+                await waiter
+                continue
+            yield chunk
+            index += 1
+
+    def data(self) -> bytes:
+        """The whole stored object once the fetch is complete (blocking)."""
+        with self._condition:
+            self._condition.wait_for(lambda: self.done)
+            self._check()
+            return b"".join(self._chunks)
+
+
+def _wake(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class SingleFlight:
+    """
+    The fetches of one process that are in progress, by object name.
+
+    Arguments:
+        storage: where the objects are read from
+        executor: runs the fetches
+        max_bytes: objects up to this size are shared, larger ones are read by every reader on its own
+        chunk_size: size of the chunks read from the storage
+        ticket: called when a fetch starts, its result is handed to on_complete
+        on_complete: called with (name, info, data, ticket) after a fetch read the whole object (e.g. to cache it)
+        size_hint: the size of an object if it is known without asking the storage (e.g. from an index), else None
+    """
+
+    def __init__(self, storage: StorageBackend, executor: futures.Executor, max_bytes: int, chunk_size: int,
+                 ticket: Callable[[], object] = lambda: None,
+                 on_complete: Optional[Callable[[str, ObjectInfo, bytes, object], None]] = None,
+                 size_hint: Callable[[str], Optional[int]] = lambda name: None):
+        self.storage = storage
+        self.size_hint = size_hint
+        self.executor = executor
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.ticket = ticket
+        self.on_complete = on_complete
+        self._flights: Dict[str, Flight] = {}
+        self._lock = threading.Lock()
+        self.fetches = 0
+        self.joined = 0
+
+    def fetch(self, name: str) -> Flight:
+        """The running fetch of name, or a new one."""
+        with self._lock:
+            flight = self._flights.get(name)
+            if flight is not None:
+                self.joined += 1
+                return flight
+            flight = self._flights[name] = Flight()
+            self.fetches += 1
+        self.executor.submit(self._run, name, flight, self.ticket())
+        return flight
+
+    def forget(self, name: str):
+        """Lets the next read of name start a fetch of its own (after the object was written or deleted)."""
+        with self._lock:
+            self._flights.pop(name, None)
+
+    def _leave(self, name: str, flight: Flight):
+        with self._lock:
+            if self._flights.get(name) is flight:
+                del self._flights[name]
+
+    def _unshared(self, name: str, flight: Flight):
+        self._leave(name, flight)
+        flight._open(None, shared=False)
+        flight._finish()
+
+    def _run(self, name: str, flight: Flight, ticket):
+        try:
+            size = self.size_hint(name)
+            if size is None:
+                size = self.storage.stat(name).size
+            if size > self.max_bytes:
+                self._unshared(name, flight)
+                return
+            stream = self.storage.open(name)
+        except BaseException as e:
+            self._leave(name, flight)
+            flight._finish(e)
+            return
+
+        if stream.length > self.max_bytes:
+            #the hint was out of date (the object was replaced by a larger one); rare enough to pay a second GET
+            stream.close()
+            self._unshared(name, flight)
+            return
+
+        flight._open(stream.info)
+        try:
+            with stream:
+                for chunk in stream.iter_chunks(self.chunk_size):
+                    flight._append(chunk)
+        except BaseException as e:
+            self._leave(name, flight)
+            flight._finish(e)
+            return
+        flight._finish()
+        try:
+            if self.on_complete is not None:
+                self.on_complete(name, stream.info, flight.data(), ticket)
+        finally:
+            #readers that come later find the object in the cache or start a fetch of their own
+            self._leave(name, flight)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"fetches": self.fetches, "joined": self.joined, "in_flight": len(self._flights)}
@@ -0,0 +1,1273 @@
+"""
+Storage backends of the PCF registry.
+
+Every backend stores flat objects (name -> bytes plus a content type and a few
+string metadata fields) and offers the same small set of operations, so the
+HTTP routes and the gRPC servicer don't depend on where the bytes live:
+
+    MinioBackend       the S3 bucket used in the cluster deployment
+    FilesystemBackend  plain files below a directory, read through mmap
+    MemoryBackend      a dict, for tests, benchmarks and throwaway instances
+
+ContentAddressedBackend wraps any of them to store identical documents only once,
+ObservedBackend reports the duration and outcome of every call (see metrics.py).
+"""
+import hashlib
+import json
+import logging
+import mmap
+import os
+import shutil
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from io import BytesIO
+from typing import Callable, Iterator, List, NamedTuple, Optional, Tuple
+
+import certifi
+import urllib3
+from minio import Minio, S3Error
+from minio.commonconfig import REPLACE, CopySource
+from minio.datatypes import Part
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import HTTPError
+from urllib3.util import Retry, Timeout
+
+import compression
+
+logger = logging.getLogger("pcf_registry.storage")
+
+#errors of the MinIO client that are turned into StorageError
+MINIO_ERRORS = (S3Error, HTTPError, OSError)
+
+#object metadata with the hex SHA-256 digest of the (uncompressed) document
+DIGEST_KEY = "sha256"
+
+#internal objects of the registry: content addressed blobs, their staging objects and upload sessions
+BLOB_PREFIX = ".blobs/sha256/"
+STAGING_PREFIX = ".staging/"
+SESSION_PREFIX = ".sessions/"
+RESERVED_PREFIXES = (BLOB_PREFIX, STAGING_PREFIX, SESSION_PREFIX)
+
+
+def is_reserved_name(name: str) -> bool:
+    """True for names below RESERVED_PREFIXES, which clients can neither read nor write."""
+    return name.startswith(RESERVED_PREFIXES)
+
+
+class StorageError(Exception):
+    """A storage operation failed."""
+
+
+class ObjectNotFound(StorageError):
+    """The requested object does not exist."""
+
+
+class ObjectInfo(NamedTuple):
+    name: str
+    size: int
+    etag: str
+    content_type: str = "application/octet-stream"
+    metadata: dict = {}
+    last_modified: Optional[datetime] = None
+
+
+class UploadedPart(NamedTuple):
+    """A part of an unfinished multipart upload."""
+    number: int
+    etag: str
+    size: int
+
+
+class ObjectStream:
+    """
+    Readable body of a stored object (or of a byte range of it).
+
+    info describes the whole object, length is the number of bytes this stream
+    returns. The stream has to be closed after use, it is also a context manager.
+    """
+
+    def __init__(self, info: ObjectInfo, length: int, read, close=None):
+        self.info = info
+        self.length = length
+        self._read = read
+        self._close = close
+        self._closed = False
+
+    def read(self, size: int) -> bytes:
+        """Returns the next size bytes (fewer only at the end), b"" once the stream is exhausted."""
+        return self._read(size)
+
+    def iter_chunks(self, size: int) -> Iterator[bytes]:
+        while True:
+            chunk = self._read(size)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            if self._close is not None:
+                self._close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class StorageBackend:
+    """Interface every storage engine implements."""
+
+    name = "abstract"
+
+    def ensure_ready(self):
+        """Prepares the backend (bucket, directories); raises StorageError if it is not usable."""
+
+    def put(self, name: str, data: bytes, content_type: str = "application/json",
+            metadata: Optional[dict] = None) -> ObjectInfo:
+        raise NotImplementedError
+
+    def open(self, name: str, offset: int = 0, length: Optional[int] = None) -> ObjectStream:
+        """Opens the object (or length bytes of it starting at offset) for reading."""
+        raise NotImplementedError
+
+    def stat(self, name: str) -> ObjectInfo:
+        raise NotImplementedError
+
+    def delete(self, name: str):
+        """Removes the object; removing an object that does not exist is not an error."""
+        raise NotImplementedError
+
+    def list(self, prefix: str = "") -> Iterator[ObjectInfo]:
+        raise NotImplementedError
+
+    def copy(self, source: str, target: str, metadata: Optional[dict] = None) -> ObjectInfo:
+        """Copies an object (bytes, content type and metadata) to another name, with other metadata if given."""
+        raise NotImplementedError
+
+    def writer(self, name: str, part_size: int, content_type: str = "application/json",
+               metadata: Optional[dict] = None, encoding: str = "", level: int = -1) -> "MultipartWriter":
+        """Returns a writer that stores a document of unknown length under name while it is received."""
+        return MultipartWriter(self, name, part_size, content_type, metadata, encoding, level)
+
+    # multipart uploads: parts are numbered from 1, MinIO needs all but the last one to be at least 5 MiB
+
+    def create_multipart(self, name: str, content_type: str = "application/json",
+                         metadata: Optional[dict] = None) -> str:
+        raise NotImplementedError
+
+    def upload_part(self, name: str, upload_id: str, part_number: int, data: bytes) -> str:
+        raise NotImplementedError
+
+    def complete_multipart(self, name: str, upload_id: str, parts: List[Tuple[int, str]]) -> ObjectInfo:
+        raise NotImplementedError
+
+    def abort_multipart(self, name: str, upload_id: str):
+        raise NotImplementedError
+
+    def list_parts(self, name: str, upload_id: str) -> List[UploadedPart]:
+        """The parts uploaded so far, by part number (lets an interrupted upload resume)."""
+        raise NotImplementedError
+
+    def read_all(self, name: str) -> Tuple[ObjectInfo, bytes]:
+        """Convenience wrapper that reads a whole object into memory."""
+        with self.open(name) as stream:
+            chunks = []
+            for chunk in stream.iter_chunks(1024 * 1024):
+                chunks.append(chunk)
+            return stream.info, b"".join(chunks)
+
+
+# ------------------ MinIO -------------------------------------------#
+
+#S3 requests that can be repeated safely; creating and completing multipart uploads (POST) are not retried
+RETRY_METHODS = frozenset({"GET", "HEAD", "PUT", "DELETE"})
+#throttling and server side errors that are worth another attempt
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class ConnectionPoolObserver:
+    """Receives the events of the MinIO connection pool; this default ignores them (see metrics.py)."""
+
+    def waited(self, seconds: float):
+        """A request waited this long for a free connection."""
+
+    def acquired(self):
+        """A connection was taken from the pool."""
+
+    def released(self):
+        """A connection was handed back to the pool."""
+
+    def created(self):
+        """A new connection was opened."""
+
+    def retried(self, method: str, reason: str):
+        """A request is repeated after a connection error, timeout or retryable status."""
+
+
+def _observed_pool_class(base, observer: ConnectionPoolObserver, wait_timeout: float):
+    class ObservedConnectionPool(base):
+        def _new_conn(self):
+            observer.created()
+            return super()._new_conn()
+
+        def _get_conn(self, timeout=None):
+            start = time.perf_counter()
+            conn = super()._get_conn(wait_timeout if timeout is None else timeout)
+            observer.waited(time.perf_counter() - start)
+            observer.acquired()
+            return conn
+
+        def _put_conn(self, conn):
+            observer.released()
+            super()._put_conn(conn)
+
+    return ObservedConnectionPool
+
+
+def _observed_retry_class(observer: ConnectionPoolObserver):
+    class ObservedRetry(Retry):
+        def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+            retry = super().increment(method, url, response, error, _pool, _stacktrace)
+            reason = str(response.status) if response is not None else type(error).__name__
+            observer.retried(method or "", reason)
+            return retry
+
+    return ObservedRetry
+
+
+def minio_http_client(pool_size: int = 10, connect_timeout: float = 5.0, read_timeout: float = 60.0,
+                      pool_block: bool = False, pool_timeout: float = 30.0, retries: int = 3,
+                      retry_backoff: float = 0.1, retry_backoff_max: float = 5.0,
+                      observer: Optional[ConnectionPoolObserver] = None) -> urllib3.PoolManager:
+    """
+    Builds the connection pool of the MinIO client.
+
+    pool_size keep-alive connections per host are shared by all threads of the
+    process. When all of them are busy an extra connection is opened and closed
+    after the request, or with pool_block the request waits up to pool_timeout
+    for a pooled one (this caps the connections, but an open download stream
+    holds its connection until it is closed). Idempotent requests are repeated up to retries times on connection errors,
+    timeouts and 429/5xx responses, after an exponential backoff (retry_backoff
+    doubling up to retry_backoff_max) with random jitter of up to retry_backoff,
+    or after the Retry-After the server asked for.
+
+    Arguments:
+        connect_timeout: seconds to establish a connection
+        read_timeout: seconds to wait for the next bytes of a response
+    """
+    observer = observer or ConnectionPoolObserver()
+    retry = _observed_retry_class(observer)(
+        total=retries, connect=retries, read=retries, status=retries, other=0,
+        allowed_methods=RETRY_METHODS, status_forcelist=RETRY_STATUSES,
+        backoff_factor=retry_backoff, backoff_max=retry_backoff_max, backoff_jitter=retry_backoff,
+        respect_retry_after_header=True, raise_on_status=False
+    )
+
+    #detect connections the server or a load balancer dropped silently
+    socket_options = HTTPConnectionPool.ConnectionCls.default_socket_options + [
+        (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    ]
+    if hasattr(socket, "TCP_KEEPIDLE"):
+        socket_options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 60))
+
+    manager = urllib3.PoolManager(
+        maxsize=pool_size,
+        block=pool_block,
+        timeout=Timeout(connect=connect_timeout, read=read_timeout),
+        retries=retry,
+        socket_options=socket_options,
+        cert_reqs="CERT_REQUIRED",
+        ca_certs=os.environ.get("SSL_CERT_FILE") or certifi.where()
+    )
+    manager.pool_classes_by_scheme = {
+        "http": _observed_pool_class(HTTPConnectionPool, observer, pool_timeout),
+        "https": _observed_pool_class(HTTPSConnectionPool, observer, pool_timeout),
+    }
+    return manager
+
+
+class MinioBackend(StorageBackend):
+    """Objects in a MinIO (or any other S3 compatible) bucket."""
+
+    name = "minio"
+
+    def __init__(self, client, bucket: str):
+        self.client = client
+        self.bucket = bucket
+
+    @staticmethod
+    def _translate(error: Exception) -> StorageError:
+        if isinstance(error, S3Error) and error.code in ("NoSuchKey", "NoSuchUpload"):
+            return ObjectNotFound(str(error))
+        return StorageError(f"MinIO S3 Error: {error}")
+
+    @staticmethod
+    def _metadata_headers(content_type: str, metadata: Optional[dict]) -> dict:
+        headers = {"Content-Type": content_type}
+        for key, value in (metadata or {}).items():
+            headers[f"x-amz-meta-{key}"] = value
+        return headers
+
+    @staticmethod
+    def _metadata_from_headers(headers) -> dict:
+        return {
+            key[len("x-amz-meta-"):].lower(): value
+            for key, value in headers.items()
+            if key.lower().startswith("x-amz-meta-")
+        }
+
+    def ensure_ready(self):
+        try:
+            if not self.client.bucket_exists(self.bucket):
+                self.client.make_bucket(self.bucket)
+        except MINIO_ERRORS as e:
+            raise self._translate(e) from e
+
+    def put(self, name, data, content_type="application/json", metadata=None):
+        try:
+            result = self.client.put_object(
+                bucket_name=self.bucket,
+                object_name=name,
+                data=BytesIO(data),
+                length=len(data),
+                content_type=content_type,
+                metadata=metadata
+            )
+        except MINIO_ERRORS as e:
+            raise self._translate(e) from e
+        return ObjectInfo(name, len(data), result.etag, content_type, dict(metadata or {}))
+
+    def open(self, name, offset=0, length=None):
+        try:
+            response = self.client.get_object(self.bucket, name, offset=offset, length=length or 0)
+        except MINIO_ERRORS as e:
+            raise self._translate(e) from e
+
+        headers = response.headers
+        stream_length = int(headers.get("Content-Length", 0))
+        size = stream_length
+        content_range = headers.get("Content-Range")
+        if content_range and "/" in content_range:
+            size = int(content_range.rsplit("/", 1)[1])
+        info = ObjectInfo(
+            name, size, headers.get("ETag", "").strip('"'),
+            headers.get("Content-Type", "application/octet-stream"),
+            self._metadata_from_headers(headers)
+        )
+
+        def close():
+            response.close()
+            response.release_conn()
+
+        return ObjectStream(info, stream_length, response.read, close)
+
+    def stat(self, name):
+        try:
+            stat = self.client.stat_object(self.bucket, name)
+        except MINIO_ERRORS as e:
+            raise self._translate(e) from e
+        return ObjectInfo(
+            name, stat.size, stat.etag, stat.content_type or "application/octet-stream",
+            self._metadata_from_headers(stat.metadata or {}), stat.last_modified
+        )
+
+    def delete(self, name):
+        try:
+            self.client.remove_object(self.bucket, name)
+        except MINIO_ERRORS as e:
+            raise self._translate(e) from e
+
+    def list(self, prefix=""):
+        try:
+            for minio_object in self.client.list_objects(bucket_name=self.bucket, prefix=prefix or None, recursive=True):
+                yield ObjectInfo(
+                    minio_object.object_name, minio_object.size or 0, (minio_object.etag or "").strip('"'),
+                    last_modified=minio_object.last_modified
+                )
+        except MINIO_ERRORS as e:
+            raise self._translate(e) from e
+
+    def copy(self, source, target, metadata=None):
+        #the REPLACE directive sets the metadata in the same copy, the content type has to be sent along with it
+        content_type = self.stat(source).content_type if metadata is not None else None
+        try:
+            if metadata is None:
+                self.client.copy_object(self.bucket, target, CopySource(self.bucket, source))
+            else:
+                self.client.copy_object(
+                    self.bucket, target, CopySource(self.bucket, source),
+                    metadata=self._metadata_headers(content_type, metadata), metadata_directive=REPLACE
+                )
+        except MINIO_ERRORS as e:
+            raise self._translate(e) from e
+        return self.stat(target)
+
+    # minio-py only exposes multipart uploads through these (underscore) S3 API wrappers
+
+    def create_multipart(self, name, content_type="application/json", metadata=None):
+        try:
+            return self.client._create_multipart_upload(self.bucket, name, self._metadata_headers(content_type, metadata))
+        except MINIO_ERRORS as e:
+            raise self._translate(e) from e
+
+    def upload_part(self, name, upload_id, part_number, data):
+        try:
+            return self.client._upload_part(self.bucket, name, data, None, upload_id, part_number)
+        except MINIO_ERRORS as e:
+            raise self._translate(e) from e
+
+    def complete_multipart(self, name, upload_id, parts):
+        try:
+            self.client._complete_multipart_upload(
+                self.bucket, name, upload_id, [Part(number, etag) for number, etag in sorted(parts)]
+            )
+        except MINIO_ERRORS as e:
+            raise self._translate(e) from e
+        return self.stat(name)
+
+    def abort_multipart(self, name, upload_id):
+        try:
+            self.client._abort_multipart_upload(self.bucket, name, upload_id)
+        except MINIO_ERRORS as e:
+            raise self._translate(e) from e
+
+    def list_parts(self, name, upload_id):
+        parts = []
+        marker = None
+        try:
+            while True:
+                result = self.client._list_parts(self.bucket, name, upload_id, part_number_marker=marker)
+                parts.extend(UploadedPart(part.part_number, part.etag.strip('"'), part.size or 0) for part in result.parts)
+                if not result.is_truncated:
+                    return parts
+                marker = str(result.next_part_number_marker)
+        except MINIO_ERRORS as e:
+            raise self._translate(e) from e
+
+
+# ------------------ Local filesystem --------------------------------#
+
+class FilesystemBackend(StorageBackend):
+    """
+    Objects as files below root (names may contain "/" to form directories).
+
+    Writes go to a temporary file that is renamed into place, so readers never
+    see partial objects. Reads are served from a memory map of the file, which
+    lets the page cache answer repeated reads without copies into a read buffer.
+    """
+
+    name = "filesystem"
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self._objects = os.path.join(self.root, "objects")
+        self._meta = os.path.join(self.root, "meta")
+        self._uploads = os.path.join(self.root, "uploads")
+        self._tmp = os.path.join(self.root, "tmp")
+
+    def _path(self, base: str, name: str, suffix: str = "") -> str:
+        path = os.path.normpath(os.path.join(base, name + suffix))
+        if not name or not path.startswith(base + os.sep):
+            raise StorageError(f"Invalid object name '{name}'")
+        return path
+
+    def ensure_ready(self):
+        try:
+            for directory in (self._objects, self._meta, self._uploads, self._tmp):
+                os.makedirs(directory, exist_ok=True)
+        except OSError as e:
+            raise StorageError(f"Storage directory {self.root} is not usable: {e}") from e
+
+    def _write_file(self, path: str, data) -> int:
+        """Atomically replaces path with the given bytes (or iterable of bytes)."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = os.path.join(self._tmp, uuid.uuid4().hex)
+        size = 0
+        try:
+            with open(temp_path, "wb") as f:
+                for chunk in ([data] if isinstance(data, (bytes, bytearray, memoryview)) else data):
+                    f.write(chunk)
+                    size += len(chunk)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return size
+
+    def _info(self, name: str, path: str) -> ObjectInfo:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            raise ObjectNotFound(f"Object '{name}' does not exist") from None
+
+        content_type, metadata = "application/octet-stream", {}
+        try:
+            with open(self._path(self._meta, name, ".json"), "r") as f:
+                stored = json.load(f)
+            content_type, metadata = stored.get("content_type", content_type), stored.get("metadata", {})
+        except (FileNotFoundError, ValueError):
+            pass
+
+        return ObjectInfo(
+            name, stat.st_size, f"{stat.st_mtime_ns:x}-{stat.st_size:x}", content_type, metadata,
+            datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc)
+        )
+
+    def _store(self, name: str, data, content_type: str, metadata: Optional[dict]) -> ObjectInfo:
+        path = self._path(self._objects, name)
+        try:
+            #metadata first: a reader that sees the new file also sees its metadata
+            self._write_file(
+                self._path(self._meta, name, ".json"),
+                json.dumps({"content_type": content_type, "metadata": dict(metadata or {})}).encode()
+            )
+            self._write_file(path, data)
+        except OSError as e:
+            raise StorageError(f"Could not write '{name}': {e}") from e
+        return self._info(name, path)
+
+    def put(self, name, data, content_type="application/json", metadata=None):
+        return self._store(name, data, content_type, metadata)
+
+    def open(self, name, offset=0, length=None):
+        path = self._path(self._objects, name)
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            raise ObjectNotFound(f"Object '{name}' does not exist") from None
+        except OSError as e:
+            raise StorageError(f"Could not open '{name}': {e}") from e
+
+        try:
+            info = self._info(name, path)
+            end = info.size if length is None else min(info.size, offset + length)
+            view = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if info.size else b""
+        except BaseException:
+            f.close()
+            raise
+
+        position = [min(offset, end)]
+
+        def read(size):
+            start = position[0]
+            stop = min(end, start + size)
+            position[0] = stop
+            return view[start:stop]
+
+        def close():
+            if isinstance(view, mmap.mmap):
+                view.close()
+            f.close()
+
+        return ObjectStream(info, end - position[0], read, close)
+
+    def stat(self, name):
+        return self._info(name, self._path(self._objects, name))
+
+    def delete(self, name):
+        for path in (self._path(self._objects, name), self._path(self._meta, name, ".json")):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                raise StorageError(f"Could not delete '{name}': {e}") from e
+
+    def list(self, prefix=""):
+        names = []
+        for directory, _, files in os.walk(self._objects):
+            for file_name in files:
+                name = os.path.relpath(os.path.join(directory, file_name), self._objects).replace(os.sep, "/")
+                if name.startswith(prefix):
+                    names.append(name)
+        for name in sorted(names):
+            try:
+                yield self.stat(name)
+            except ObjectNotFound:
+                continue
+
+    def copy(self, source, target, metadata=None):
+        info = self.stat(source)
+        try:
+            with open(self._path(self._objects, source), "rb") as f:
+                return self._store(
+                    target, iter(lambda: f.read(1024 * 1024), b""), info.content_type,
+                    info.metadata if metadata is None else metadata
+                )
+        except FileNotFoundError:
+            raise ObjectNotFound(f"Object '{source}' does not exist") from None
+
+    def create_multipart(self, name, content_type="application/json", metadata=None):
+        self._path(self._objects, name)
+        upload_id = uuid.uuid4().hex
+        upload_dir = os.path.join(self._uploads, upload_id)
+        try:
+            os.makedirs(upload_dir)
+            with open(os.path.join(upload_dir, "upload.json"), "w") as f:
+                json.dump({"name": name, "content_type": content_type, "metadata": dict(metadata or {})}, f)
+        except OSError as e:
+            raise StorageError(f"Could not start an upload of '{name}': {e}") from e
+        return upload_id
+
+    def _upload_dir(self, name: str, upload_id: str) -> Tuple[str, dict]:
+        upload_dir = os.path.join(self._uploads, os.path.basename(upload_id))
+        try:
+            with open(os.path.join(upload_dir, "upload.json"), "r") as f:
+                upload = json.load(f)
+        except (FileNotFoundError, ValueError):
+            raise ObjectNotFound(f"Upload '{upload_id}' does not exist") from None
+        if upload["name"] != name:
+            raise ObjectNotFound(f"Upload '{upload_id}' does not belong to '{name}'")
+        return upload_dir, upload
+
+    def upload_part(self, name, upload_id, part_number, data):
+        upload_dir, _ = self._upload_dir(name, upload_id)
+        try:
+            self._write_file(os.path.join(upload_dir, f"{part_number:05d}"), data)
+        except OSError as e:
+            raise StorageError(f"Could not write part {part_number} of '{name}': {e}") from e
+        return hashlib.md5(data).hexdigest()
+
+    def complete_multipart(self, name, upload_id, parts):
+        upload_dir, upload = self._upload_dir(name, upload_id)
+
+        def part_chunks():
+            for number, _ in sorted(parts):
+                with open(os.path.join(upload_dir, f"{number:05d}"), "rb") as f:
+                    while True:
+                        chunk = f.read(1024 * 1024)
+                        if not chunk:
+                            break
+                        yield chunk
+
+        try:
+            info = self._store(name, part_chunks(), upload["content_type"], upload["metadata"])
+        except FileNotFoundError as e:
+            raise StorageError(f"Upload of '{name}' is missing a part: {e}") from e
+        shutil.rmtree(upload_dir, ignore_errors=True)
+        return info
+
+    def abort_multipart(self, name, upload_id):
+        upload_dir, _ = self._upload_dir(name, upload_id)
+        shutil.rmtree(upload_dir, ignore_errors=True)
+
+    def list_parts(self, name, upload_id):
+        upload_dir, _ = self._upload_dir(name, upload_id)
+        parts = []
+        for entry in sorted(os.listdir(upload_dir)):
+            if not entry.isdigit():
+                continue
+            md5 = hashlib.md5()
+            with open(os.path.join(upload_dir, entry), "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    md5.update(chunk)
+            parts.append(UploadedPart(int(entry), md5.hexdigest(), os.path.getsize(os.path.join(upload_dir, entry))))
+        return parts
+
+
+# ------------------ In memory ---------------------------------------#
+
+class MemoryBackend(StorageBackend):
+    """Objects in a dict of this process; nothing survives a restart."""
+
+    name = "memory"
+
+    def __init__(self):
+        self._objects = {}  # name -> (ObjectInfo, bytes)
+        self._uploads = {}  # upload_id -> (name, content_type, metadata, {part_number: bytes})
+        self._lock = threading.Lock()
+
+    def _store(self, name, data, content_type, metadata):
+        data = bytes(data)
+        info = ObjectInfo(
+            name, len(data), hashlib.md5(data).hexdigest(), content_type, dict(metadata or {}),
+            datetime.fromtimestamp(time.time(), tz=timezone.utc)
+        )
+        with self._lock:
+            self._objects[name] = (info, data)
+        return info
+
+    def _get(self, name):
+        with self._lock:
+            entry = self._objects.get(name)
+        if entry is None:
+            raise ObjectNotFound(f"Object '{name}' does not exist")
+        return entry
+
+    def put(self, name, data, content_type="application/json", metadata=None):
+        return self._store(name, data, content_type, metadata)
+
+    def open(self, name, offset=0, length=None):
+        info, data = self._get(name)
+        end = info.size if length is None else min(info.size, offset + length)
+        view = memoryview(data)
+        position = [min(offset, end)]
+
+        def read(size):
+            start = position[0]
+            stop = min(end, start + size)
+            position[0] = stop
+            return bytes(view[start:stop])
+
+        return ObjectStream(info, end - position[0], read)
+
+    def stat(self, name):
+        return self._get(name)[0]
+
+    def delete(self, name):
+        with self._lock:
+            self._objects.pop(name, None)
+
+    def list(self, prefix=""):
+        with self._lock:
+            infos = [info for name, (info, _) in self._objects.items() if name.startswith(prefix)]
+        return iter(sorted(infos, key=lambda info: info.name))
+
+    def copy(self, source, target, metadata=None):
+        info, data = self._get(source)
+        return self._store(target, data, info.content_type, info.metadata if metadata is None else metadata)
+
+    def create_multipart(self, name, content_type="application/json", metadata=None):
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self._uploads[upload_id] = (name, content_type, dict(metadata or {}), {})
+        return upload_id
+
+    def _upload(self, name, upload_id):
+        with self._lock:
+            upload = self._uploads.get(upload_id)
+        if upload is None or upload[0] != name:
+            raise ObjectNotFound(f"Upload '{upload_id}' does not exist")
+        return upload
+
+    def upload_part(self, name, upload_id, part_number, data):
+        self._upload(name, upload_id)[3][part_number] = bytes(data)
+        return hashlib.md5(data).hexdigest()
+
+    def complete_multipart(self, name, upload_id, parts):
+        _, content_type, metadata, stored_parts = self._upload(name, upload_id)
+        try:
+            data = b"".join(stored_parts[number] for number, _ in sorted(parts))
+        except KeyError as e:
+            raise StorageError(f"Upload of '{name}' is missing part {e}") from e
+        with self._lock:
+            self._uploads.pop(upload_id, None)
+        return self._store(name, data, content_type, metadata)
+
+    def abort_multipart(self, name, upload_id):
+        self._upload(name, upload_id)
+        with self._lock:
+            self._uploads.pop(upload_id, None)
+
+    def list_parts(self, name, upload_id):
+        stored_parts = self._upload(name, upload_id)[3]
+        #parts of the same upload may be stored concurrently
+        with self._lock:
+            items = sorted(stored_parts.items())
+        return [UploadedPart(number, hashlib.md5(data).hexdigest(), len(data)) for number, data in items]
+
+
+# ------------------ Streaming writes --------------------------------#
+
+class MultipartWriter:
+    """
+    Writes one object part by part while it is being received.
+
+    feed() only buffers and hands out full parts, the blocking calls (start,
+    upload_part, commit, abort) talk to the backend. An object that never grows
+    beyond one part is stored with a single put. With an encoding the data is
+    compressed on the fly and the encoding is recorded in the object metadata.
+    The SHA-256 digest of the received (uncompressed) bytes is computed on the way.
+    """
+
+    def __init__(self, backend: StorageBackend, object_name: str, part_size: int,
+                 content_type: str = "application/json", metadata: Optional[dict] = None,
+                 encoding: str = "", level: int = -1):
+        self.backend = backend
+        self.object_name = object_name
+        self.part_size = part_size
+        self.content_type = content_type
+        self.metadata = dict(metadata or {})
+        self.size = 0
+        self.upload_id = None
+        self._buffer = bytearray()
+        self._next_part = 1
+        self._etags = {}
+        self._compressor = compression.compressor(encoding, level) if encoding else None
+        if encoding:
+            self.metadata[compression.ENCODING_KEY] = encoding
+        self._sha256 = hashlib.sha256()
+
+    @property
+    def digest(self) -> str:
+        """Hex SHA-256 of everything fed so far."""
+        return self._sha256.hexdigest()
+
+    def feed(self, data: bytes) -> list:
+        """
+        Buffers data and returns the (part_number, bytes) parts that are complete.
+        At least one byte is always kept back so the last part is never empty.
+        """
+        self.size += len(data)
+        self._sha256.update(data)
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        self._buffer += data
+        return self._take_parts()
+
+    def _take_parts(self) -> list:
+        parts = []
+        while len(self._buffer) > self.part_size:
+            parts.append((self._next_part, bytes(self._buffer[:self.part_size])))
+            del self._buffer[:self.part_size]
+            self._next_part += 1
+        return parts
+
+    def write(self, data: bytes):
+        """Blocking variant of feed() that uploads complete parts right away."""
+        for part_number, part in self.feed(data):
+            if self.upload_id is None:
+                self.start()
+            self.upload_part(part_number, part)
+
+    def start(self):
+        """Creates the multipart upload, needed before the first upload_part."""
+        self.upload_id = self.backend.create_multipart(self.object_name, self.content_type, self.metadata)
+
+    def upload_part(self, part_number: int, data: bytes):
+        self._etags[part_number] = self.backend.upload_part(self.object_name, self.upload_id, part_number, data)
+
+    def final_metadata(self) -> dict:
+        """The metadata once the whole document is known: with its digest and, if compressed, its uncompressed size."""
+        metadata = {**self.metadata, DIGEST_KEY: self.digest}
+        if compression.ENCODING_KEY in metadata:
+            metadata[compression.IDENTITY_SIZE_KEY] = str(self.size)
+        return metadata
+
+    def commit(self) -> ObjectInfo:
+        """Stores the rest of the buffer and makes the object visible."""
+        if self._compressor is not None:
+            self._buffer += self._compressor.flush()
+            self._compressor = None
+            for part_number, part in self._take_parts():
+                if self.upload_id is None:
+                    self.start()
+                self.upload_part(part_number, part)
+
+        if self.upload_id is None:
+            #the whole object is known now, so its digest and uncompressed size can be recorded as well
+            info = self.backend.put(self.object_name, bytes(self._buffer), self.content_type, self.final_metadata())
+            self._buffer = bytearray()
+            return info
+
+        self.upload_part(self._next_part, bytes(self._buffer))
+        self._buffer = bytearray()
+        return self._complete()
+
+    def _complete(self) -> ObjectInfo:
+        #the upload was started before the digest was known, so the object's metadata has neither it nor the uncompressed
+        #size; the caller records both in the metadata index, rewriting the object for them would copy it once more
+        return self.backend.complete_multipart(self.object_name, self.upload_id, list(self._etags.items()))
+
+    def abort(self):
+        """Drops the parts uploaded so far; errors are ignored because abandoned uploads expire anyway."""
+        self._buffer = bytearray()
+        if self.upload_id is None:
+            return
+        try:
+            self.backend.abort_multipart(self.object_name, self.upload_id)
+        except StorageError as e:
+            logger.warning("Could not abort a multipart upload", extra={"object": self.object_name, "error": str(e)})
+
+
+# ------------------ Observed ----------------------------------------#
+
+#called with the backend name, the operation, its duration in seconds and the exception (None on success)
+StorageObserver = Callable[[str, str, float, Optional[BaseException]], None]
+
+
+class ObservedBackend(StorageBackend):
+    """
+    Passes every call on to another backend and reports its duration and
+    outcome to an observer. open() is measured until the object stream is
+    available (for MinIO: the response headers), list() until the listing is consumed.
+    """
+
+    def __init__(self, inner: StorageBackend, observer: StorageObserver):
+        self.inner = inner
+        self.observer = observer
+        self.name = inner.name
+
+    def _call(self, operation: str, func, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            self.observer(self.name, operation, time.perf_counter() - start, e)
+            raise
+        self.observer(self.name, operation, time.perf_counter() - start, None)
+        return result
+
+    def ensure_ready(self):
+        self._call("ensure_ready", self.inner.ensure_ready)
+
+    def put(self, name, data, content_type="application/json", metadata=None):
+        return self._call("put", self.inner.put, name, data, content_type, metadata)
+
+    def open(self, name, offset=0, length=None):
+        return self._call("open", self.inner.open, name, offset, length)
+
+    def read_all(self, name):
+        return self._call("read_all", self.inner.read_all, name)
+
+    def stat(self, name):
+        return self._call("stat", self.inner.stat, name)
+
+    def delete(self, name):
+        self._call("delete", self.inner.delete, name)
+
+    def list(self, prefix=""):
+        start = time.perf_counter()
+        error = None
+        try:
+            yield from self.inner.list(prefix)
+        except GeneratorExit:
+            raise
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self.observer(self.name, "list", time.perf_counter() - start, error)
+
+    def copy(self, source, target, metadata=None):
+        return self._call("copy", self.inner.copy, source, target, metadata)
+
+    def create_multipart(self, name, content_type="application/json", metadata=None):
+        return self._call("create_multipart", self.inner.create_multipart, name, content_type, metadata)
+
+    def upload_part(self, name, upload_id, part_number, data):
+        return self._call("upload_part", self.inner.upload_part, name, upload_id, part_number, data)
+
+    def complete_multipart(self, name, upload_id, parts):
+        return self._call("complete_multipart", self.inner.complete_multipart, name, upload_id, parts)
+
+    def abort_multipart(self, name, upload_id):
+        self._call("abort_multipart", self.inner.abort_multipart, name, upload_id)
+
+    def list_parts(self, name, upload_id):
+        return self._call("list_parts", self.inner.list_parts, name, upload_id)
+
+
+# ------------------ Content addressed -------------------------------#
+
+#metadata of a name object that points to the blob holding its bytes
+BLOB_KEY = "blob"
+
+
+class ContentAddressedBackend(StorageBackend):
+    """
+    Stores every distinct document once, under its SHA-256 digest.
+
+    The bytes live in a blob object (BLOB_PREFIX + digest); a name is a pointer
+    object whose metadata records the digest and the blob and whose body is the
+    digest, so its etag in a listing changes with the document. Storing a
+    document whose blob exists already only writes the pointer. Streamed uploads
+    larger than one part go to a staging object first and become the blob (or
+    are dropped) once their digest is known. Reads resolve pointers transparently;
+    objects written before this mode was enabled are served as they are.
+    Deleting a name keeps its blob, since other names may point to it; collect_garbage
+    deletes the blobs that no name points to anymore.
+
+    Arguments:
+        passthrough: names that are stored as they are, without a blob (e.g. upload session state and staging
+                     objects, whose blobs would outlive them)
+    """
+
+    def __init__(self, inner: StorageBackend, passthrough: Callable[[str], bool] = lambda name: False):
+        self.inner = inner
+        self.passthrough = passthrough
+        self.name = f"{inner.name} (content-addressed)"
+
+    @staticmethod
+    def blob_name(digest: str) -> str:
+        return BLOB_PREFIX + digest
+
+    @staticmethod
+    def is_internal(name: str) -> bool:
+        return name.startswith((BLOB_PREFIX, STAGING_PREFIX))
+
+    @staticmethod
+    def pointer_etag(digest: str) -> str:
+        """The etag a listing shows for a pointer to the document with digest (its body is the digest)."""
+        return hashlib.md5(digest.encode()).hexdigest()
+
+    def _blob_info(self, blob: str) -> Optional[ObjectInfo]:
+        try:
+            return self.inner.stat(blob)
+        except ObjectNotFound:
+            return None
+
+    def _link(self, name: str, digest: str, blob_info: ObjectInfo) -> ObjectInfo:
+        """Writes the pointer of name and returns the info of the document it now refers to."""
+        pointer_metadata = {DIGEST_KEY: digest, BLOB_KEY: self.blob_name(digest)}
+        self.inner.put(name, digest.encode(), blob_info.content_type, pointer_metadata)
+        return blob_info._replace(name=name, metadata={**blob_info.metadata, DIGEST_KEY: digest})
+
+    def _resolve(self, pointer: ObjectInfo) -> ObjectInfo:
+        blob_info = self.inner.stat(pointer.metadata[BLOB_KEY])
+        return blob_info._replace(
+            name=pointer.name, metadata={**blob_info.metadata, DIGEST_KEY: pointer.metadata.get(DIGEST_KEY, "")}
+        )
+
+    def adopt(self, name: str, staging: str, digest: str, metadata: Optional[dict] = None) -> ObjectInfo:
+        """
+        Turns a complete staging object into the blob of digest (dropping it if that blob exists) and links name
+        to it. A new blob gets metadata (if given) with the same copy that creates it.
+        """
+        blob_info = self._blob_from(staging, digest, metadata)
+        self.inner.delete(staging)
+        return self._link(name, digest, blob_info)
+
+    def _blob_from(self, source: str, digest: str, metadata: Optional[dict]) -> ObjectInfo:
+        """The info of the blob of digest, which is copied from source (with metadata, if given) unless it exists."""
+        blob = self.blob_name(digest)
+        blob_info = self._blob_info(blob)
+        if blob_info is None:
+            blob_info = self.inner.copy(source, blob, metadata)
+        return blob_info
+
+    def ensure_ready(self):
+        self.inner.ensure_ready()
+
+    def put(self, name, data, content_type="application/json", metadata=None):
+        """Stores data unless its blob exists; metadata[DIGEST_KEY] should hold the digest of the uncompressed document."""
+        if self.passthrough(name):
+            return self.inner.put(name, data, content_type, metadata)
+        metadata = dict(metadata or {})
+        digest = metadata.setdefault(DIGEST_KEY, hashlib.sha256(data).hexdigest())
+        blob = self.blob_name(digest)
+        blob_info = self._blob_info(blob)
+        if blob_info is None:
+            blob_info = self.inner.put(blob, data, content_type, metadata)
+        return self._link(name, digest, blob_info)
+
+    def open(self, name, offset=0, length=None):
+        if offset == 0 and length is None:
+            stream = self.inner.open(name)
+            if BLOB_KEY not in stream.info.metadata:
+                return stream
+            stream.close()
+            info = stream.info
+        else:
+            info = self.inner.stat(name)
+            if BLOB_KEY not in info.metadata:
+                return self.inner.open(name, offset, length)
+
+        stream = self.inner.open(info.metadata[BLOB_KEY], offset, length)
+        stream.info = stream.info._replace(
+            name=name, metadata={**stream.info.metadata, DIGEST_KEY: info.metadata.get(DIGEST_KEY, "")}
+        )
+        return stream
+
+    def stat(self, name):
+        info = self.inner.stat(name)
+        return self._resolve(info) if BLOB_KEY in info.metadata else info
+
+    def delete(self, name):
+        self.inner.delete(name)
+
+    def list(self, prefix=""):
+        """Lists the names (pointer objects, so size and etag are those of the pointer) without the internal blobs."""
+        for info in self.inner.list(prefix):
+            if not self.is_internal(info.name):
+                yield info
+
+    def collect_garbage(self, grace_seconds: float,
+                        known_digest: Callable[[ObjectInfo], Optional[str]] = lambda info: None) -> int:
+        """
+        Deletes the blobs no name points to and staging objects that were never adopted, if they are older than
+        grace_seconds (so documents being written now keep theirs).
+
+        A put or adopt that found the blob of its document just before it was deleted may still link to it; names
+        changed during the collection are checked again to make this window small, not to close it.
+
+        Arguments:
+            grace_seconds: minimum age of a blob or staging object that is deleted
+            known_digest: digest a listed name points to, if the caller knows it without asking the storage
+                          (e.g. from the metadata index); the others are looked up
+        Returns:
+            number of deleted objects
+        """
+        started = datetime.now(timezone.utc)
+        referenced, seen = self._referenced_digests(known_digest)
+        garbage = []
+        for prefix in (BLOB_PREFIX, STAGING_PREFIX):
+            for info in self.inner.list(prefix):
+                old = info.last_modified is not None and (started - info.last_modified).total_seconds() > grace_seconds
+                if old and not (prefix == BLOB_PREFIX and info.name[len(prefix):] in referenced):
+                    garbage.append(info.name)
+        #names written since the first listing may point to a blob that looked unreferenced
+        recent, _ = self._referenced_digests(
+            known_digest,
+            lambda info: info.name not in seen or info.last_modified is None or info.last_modified >= started
+        )
+        deleted = 0
+        for name in garbage:
+            if not (name.startswith(BLOB_PREFIX) and name[len(BLOB_PREFIX):] in recent):
+                self.inner.delete(name)
+                deleted += 1
+        return deleted
+
+    def _referenced_digests(self, known_digest: Callable[[ObjectInfo], Optional[str]],
+                            include: Callable[[ObjectInfo], bool] = lambda info: True) -> Tuple[set, set]:
+        """Digests the listed (and included) names point to, and the names that were listed."""
+        digests = set()
+        names = set()
+        for info in self.list():
+            names.add(info.name)
+            if self.passthrough(info.name) or not include(info):
+                continue
+            digest = known_digest(info) or info.metadata.get(BLOB_KEY, "")[len(BLOB_PREFIX):]
+            #only pointers (empty, or holding the digest) refer to a blob
+            if not digest and info.size in (0, len(hashlib.sha256().hexdigest())):
+                try:
+                    digest = self.inner.stat(info.name).metadata.get(BLOB_KEY, "")[len(BLOB_PREFIX):]
+                except ObjectNotFound:
+                    continue
+            if digest:
+                digests.add(digest)
+        return digests, names
+
+    def copy(self, source, target, metadata=None):
+        """
+        A copy of a name points to the same blob. An object that is no pointer (written before this mode or a
+        passthrough name) becomes, or shares, the blob of the digest in metadata; without one it is copied as it is.
+        """
+        info = self.inner.stat(source)
+        if BLOB_KEY in info.metadata:
+            return self._link(target, info.metadata.get(DIGEST_KEY, ""), self.inner.stat(info.metadata[BLOB_KEY]))
+        digest = (metadata or {}).get(DIGEST_KEY)
+        if digest:
+            return self._link(target, digest, self._blob_from(source, digest, metadata))
+        self.inner.copy(source, target, metadata)
+        return self.stat(target)
+
+    def writer(self, name, part_size, content_type="application/json", metadata=None, encoding="", level=-1):
+        if self.passthrough(name):
+            return self.inner.writer(name, part_size, content_type, metadata, encoding, level)
+        return ContentAddressedWriter(self, name, part_size, content_type, metadata, encoding, level)
+
+    # multipart uploads go to a staging object, the upload id carries its key (passthrough names are uploaded as is)
+
+    def create_multipart(self, name, content_type="application/json", metadata=None):
+        if self.passthrough(name):
+            return self.inner.create_multipart(name, content_type, metadata)
+        staging_key = uuid.uuid4().hex
+        inner_id = self.inner.create_multipart(STAGING_PREFIX + staging_key, content_type, metadata)
+        return f"{staging_key}.{inner_id}"
+
+    @staticmethod
+    def _staging(upload_id: str) -> Tuple[str, str]:
+        staging_key, _, inner_id = upload_id.partition(".")
+        return STAGING_PREFIX + staging_key, inner_id
+
+    def upload_part(self, name, upload_id, part_number, data):
+        if self.passthrough(name):
+            return self.inner.upload_part(name, upload_id, part_number, data)
+        staging, inner_id = self._staging(upload_id)
+        return self.inner.upload_part(staging, inner_id, part_number, data)
+
+    def complete_multipart(self, name, upload_id, parts, metadata: Optional[dict] = None):
+        """
+        Completes the staging object and gives it its final metadata (which the blob keeps). Without metadata
+        from the caller (with the digest of the document) the document is read back to hash it.
+        """
+        if self.passthrough(name):
+            return self.inner.complete_multipart(name, upload_id, parts)
+        staging, inner_id = self._staging(upload_id)
+        info = self.inner.complete_multipart(staging, inner_id, parts)
+        encoding = info.metadata.get(compression.ENCODING_KEY, "")
+        if metadata is None:
+            sha256 = hashlib.sha256()
+            size = 0
+            with self.inner.open(staging) as stream:
+                for chunk in compression.decode_chunks(stream.iter_chunks(1024 * 1024), encoding):
+                    sha256.update(chunk)
+                    size += len(chunk)
+            metadata = {**info.metadata, DIGEST_KEY: sha256.hexdigest()}
+            if encoding:
+                metadata[compression.IDENTITY_SIZE_KEY] = str(size)
+        changed = any(info.metadata.get(key) != value for key, value in metadata.items())
+        return self.adopt(name, staging, metadata[DIGEST_KEY], metadata if changed else None)
+
+    def abort_multipart(self, name, upload_id):
+        if self.passthrough(name):
+            return self.inner.abort_multipart(name, upload_id)
+        staging, inner_id = self._staging(upload_id)
+        self.inner.abort_multipart(staging, inner_id)
+
+    def list_parts(self, name, upload_id):
+        if self.passthrough(name):
+            return self.inner.list_parts(name, upload_id)
+        staging, inner_id = self._staging(upload_id)
+        return self.inner.list_parts(staging, inner_id)
+
+
+class ContentAddressedWriter(MultipartWriter):
+    """MultipartWriter that hands the digest it computed while streaming to the content addressed backend."""
+
+    def _complete(self) -> ObjectInfo:
+        return self.backend.complete_multipart(
+            self.object_name, self.upload_id, list(self._etags.items()), metadata=self.final_metadata()
+        )
+
+
+def create_backend(kind: str, content_addressed: bool = False, observer: Optional[StorageObserver] = None,
+                   pool_observer: Optional[ConnectionPoolObserver] = None,
+                   passthrough: Callable[[str], bool] = lambda name: False, **settings) -> StorageBackend:
+    """
+    Builds the backend selected by kind ("minio", "filesystem" or "memory"),
+    wrapped in a ContentAddressedBackend if content_addressed is set.
+
+    Arguments:
+        passthrough: names the ContentAddressedBackend stores as they are (see there)
+        observer: if given, receives the timing of every call of the storage engine (see ObservedBackend)
+        pool_observer: if given, receives the events of the MinIO connection pool
+        settings: minio_endpoint, minio_access_key, minio_secret_key, minio_bucket, minio_secure and
+                  optionally the minio_http_client arguments prefixed with "minio_" (minio_pool_size, ...)
+                  for MinIO, storage_root for the filesystem backend
+    """
+    backend = _create_engine(kind, settings, pool_observer)
+    if observer is not None:
+        backend = ObservedBackend(backend, observer)
+    return ContentAddressedBackend(backend, passthrough) if content_addressed else backend
+
+
+def _create_engine(kind: str, settings: dict, pool_observer: Optional[ConnectionPoolObserver]) -> StorageBackend:
+    if kind == "minio":
+        pool_settings = {
+            key: settings[f"minio_{key}"]
+            for key in ("pool_size", "connect_timeout", "read_timeout", "pool_block", "pool_timeout", "retries",
+                        "retry_backoff", "retry_backoff_max")
+            if f"minio_{key}" in settings
+        }
+        client = Minio(
+            endpoint=settings["minio_endpoint"],
+            access_key=settings["minio_access_key"],
+            secret_key=settings["minio_secret_key"],
+            secure=settings.get("minio_secure", False),
+            http_client=minio_http_client(observer=pool_observer, **pool_settings)
+        )
+        return MinioBackend(client, settings["minio_bucket"])
+    if kind == "filesystem":
+        return FilesystemBackend(settings["storage_root"])
+    if kind == "memory":
+        return MemoryBackend()
+    raise ValueError(f"Unknown storage backend '{kind}'")
@@ -0,0 +1,85 @@
+"""
+Structured, non-blocking logging.
+
+configure_logging() formats every record on the calling thread (JSON lines or
+plain text) and hands it to a queue; a background thread writes the queue to
+stderr, so logging on the request path never waits for the output. Fields
+passed with extra={...} become keys of the JSON object.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from datetime import datetime, timezone
+
+#attributes every LogRecord has, everything else on a record was passed with extra
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON object with time, level, logger, message and the extra fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human readable lines for local development, the extra fields are appended as key=value."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        extra = " ".join(f"{key}={value}" for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES)
+        return f"{line} {extra}" if extra else line
+
+
+def configure_logging(level: str = "INFO", fmt: str = "json"):
+    """
+    Routes all loggers through a queue to a background writer thread.
+
+    Arguments:
+        level: name of the lowest level that is logged ("DEBUG", "INFO", ...)
+        fmt: "json" for one JSON object per line, "text" for plain lines
+    """
+    global _listener
+    _stop_listener()
+
+    records = queue.SimpleQueue()
+    handler = logging.handlers.QueueHandler(records)
+    handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level.upper())
+
+    #the records arrive formatted already (QueueHandler.prepare), the writer only prints the message
+    _listener = logging.handlers.QueueListener(records, logging.StreamHandler(sys.stderr))
+    _listener.start()
+
+
+def _stop_listener():
+    """Writes the records still queued and stops the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(_stop_listener)
@@ -0,0 +1,320 @@
+"""
+Resumable uploads of large documents in numbered parts.
+
+A session is created with the size of the document and a part size. The client
+uploads the parts in any order, in parallel and as often as it needs to (a part
+that is sent again replaces the earlier one), asks which parts arrived after an
+interruption and finally completes the session. Every part but the last is
+exactly part_size bytes, one storage multipart part each.
+
+The session state lives in the storage (SESSION_PREFIX + id), so every worker
+process and replica can serve every call of a session. The parts go to a
+staging object that replaces the target only after the assembled document was
+read back, validated and hashed; until then the target keeps its old version.
+Sessions that are neither completed nor aborted expire after their TTL and are
+cleaned up by expire().
+"""
+import hashlib
+import json
+import logging
+import re
+import time
+import uuid
+from typing import List, NamedTuple, Tuple
+
+from json_validation import InvalidDocument, JsonValidator
+from storage import DIGEST_KEY, SESSION_PREFIX, ObjectInfo, ObjectNotFound, StorageBackend, StorageError, UploadedPart
+
+logger = logging.getLogger("pcf_registry.upload_sessions")
+
+#S3 rejects multipart parts below 5 MiB (except the last one) and uploads of more than 10000 parts
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+#chunk size of the read back that validates and hashes a completed document
+READ_CHUNK_SIZE = 1024 * 1024
+
+_SESSION_ID = re.compile(r"[0-9a-f]{32}")
+
+
+class SessionNotFound(KeyError):
+    """The session does not exist, was completed or aborted, or has expired."""
+
+
+class MalformedSession(SessionNotFound):
+    """The stored state of the session can't be read; the session counts as gone and expire() removes it."""
+
+
+class SessionError(ValueError):
+    """A call does not fit the session (size, part number or part length)."""
+
+
+class IncompleteUpload(SessionError):
+    """Completing a session that still misses parts; missing lists their numbers."""
+
+    def __init__(self, missing: List[int]):
+        super().__init__(f"Missing parts: {', '.join(map(str, missing[:20]))}{' ...' if len(missing) > 20 else ''}")
+        self.missing = missing
+
+
+class UploadSession(NamedTuple):
+    session_id: str
+    name: str
+    size: int
+    part_size: int
+    #id of the multipart upload of the staging object
+    upload_id: str
+    content_type: str
+    created_at: float
+    expires_at: float
+
+    @property
+    def part_count(self) -> int:
+        return max(1, -(-self.size // self.part_size))
+
+    def part_length(self, number: int) -> int:
+        """Number of bytes part number (counted from 1) has to have."""
+        if number < self.part_count:
+            return self.part_size
+        return self.size - (self.part_count - 1) * self.part_size
+
+    @property
+    def staging_name(self) -> str:
+        return f"{SESSION_PREFIX}{self.session_id}/document"
+
+    @property
+    def state_name(self) -> str:
+        return _state_name(self.session_id)
+
+
+def _state_name(session_id: str) -> str:
+    return f"{SESSION_PREFIX}{session_id}/session.json"
+
+
+def is_session_object(name: str) -> bool:
+    """True for the internal objects of upload sessions, which listings leave out."""
+    return name.startswith(SESSION_PREFIX)
+
+
+class UploadSessions:
+    """
+    Creates, serves and expires upload sessions.
+
+    Arguments:
+        backend: storage of the session state, the parts and the finished documents
+        ttl_seconds: how long a session can be used after it was created
+        max_size: largest document a session accepts
+        max_part_size: largest part size (a part is held in memory while it is received)
+        encoding: compression of the finished documents ("" to store them as uploaded)
+        level: compression level
+    """
+
+    def __init__(self, backend: StorageBackend, ttl_seconds: float, max_size: int, max_part_size: int,
+                 encoding: str = "", level: int = -1):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self.max_part_size = max_part_size
+        self.encoding = encoding
+        self.level = level
+
+    def create(self, name: str, size: int, part_size: int, content_type: str = "application/json") -> UploadSession:
+        """
+        Starts a session for a document of size bytes that is stored under name once complete
+        (the caller checks the name, see storage.is_reserved_name).
+        """
+        if not 0 < size <= self.max_size:
+            raise SessionError(f"The document size must be between 1 and {self.max_size} bytes")
+        #a document that fits into one part may be smaller than MIN_PART_SIZE
+        part_size = min(part_size, size)
+        if not (part_size == size or MIN_PART_SIZE <= part_size) or part_size > self.max_part_size:
+            raise SessionError(f"The part size must be between {MIN_PART_SIZE} and {self.max_part_size} bytes")
+        if -(-size // part_size) > MAX_PARTS:
+            raise SessionError(f"A session has at most {MAX_PARTS} parts, use larger parts")
+
+        session_id = uuid.uuid4().hex
+        now = time.time()
+        session = UploadSession(session_id, name, size, part_size, "", content_type, now, now + self.ttl_seconds)
+        upload_id = self.backend.create_multipart(session.staging_name, content_type)
+        session = session._replace(upload_id=upload_id)
+        try:
+            self.backend.put(session.state_name, json.dumps(session._asdict()).encode(), "application/json")
+        except StorageError:
+            self._abort_staging(session)
+            raise
+        return session
+
+    def get(self, session_id: str) -> UploadSession:
+        session = self._load(session_id)
+        if session.expires_at <= time.time():
+            raise SessionNotFound(session_id)
+        return session
+
+    def _load(self, session_id: str) -> UploadSession:
+        if not _SESSION_ID.fullmatch(session_id or ""):
+            raise SessionNotFound(session_id)
+        try:
+            _, data = self.backend.read_all(_state_name(session_id))
+        except ObjectNotFound:
+            raise SessionNotFound(session_id) from None
+        try:
+            session = UploadSession(**json.loads(data))
+        except (ValueError, TypeError):
+            raise MalformedSession(session_id) from None
+        numbers = (session.size, session.part_size, session.created_at, session.expires_at)
+        texts = (session.name, session.upload_id, session.content_type)
+        if not all(isinstance(value, (int, float)) for value in numbers) or session.part_size < 1 \
+                or not all(isinstance(value, str) for value in texts):
+            raise MalformedSession(session_id)
+        return session
+
+    def upload_part(self, session: UploadSession, number: int, data: bytes) -> str:
+        """Stores (or replaces) a part and returns its ETag (the MD5 of the part, hex)."""
+        self.check_part(session, number, len(data))
+        if len(data) != session.part_length(number):
+            raise SessionError(f"Part {number} must have {session.part_length(number)} bytes, got {len(data)}")
+        return self.backend.upload_part(session.staging_name, session.upload_id, number, data)
+
+    @staticmethod
+    def check_part(session: UploadSession, number: int, received: int):
+        """Raises SessionError if part number does not exist or received bytes are already too many for it."""
+        if not 1 <= number <= session.part_count:
+            raise SessionError(f"Part numbers of this session go from 1 to {session.part_count}, got {number}")
+        if received > session.part_length(number):
+            raise SessionError(f"Part {number} must have {session.part_length(number)} bytes")
+
+    def uploaded_parts(self, session: UploadSession) -> List[UploadedPart]:
+        """The parts the storage has, with their ETags and lengths."""
+        try:
+            return self.backend.list_parts(session.staging_name, session.upload_id)
+        except ObjectNotFound:
+            raise SessionNotFound(session.session_id) from None
+
+    def complete(self, session: UploadSession) -> Tuple[ObjectInfo, str]:
+        """
+        Assembles the parts, checks that they form one JSON document and stores it under the session's name.
+
+        Returns:
+            the info of the stored object and the SHA-256 digest (hex) of the document
+        Raises:
+            IncompleteUpload: parts are missing or have the wrong length, the session stays open
+            InvalidDocument: the parts are not one JSON document, the session is removed
+        """
+        try:
+            uploaded = self.backend.list_parts(session.staging_name, session.upload_id)
+        except ObjectNotFound:
+            #assembled by an earlier complete that failed afterwards, it continues below
+            uploaded = None
+
+        if uploaded is not None:
+            parts = {part.number: part for part in uploaded}
+            missing = [
+                number for number in range(1, session.part_count + 1)
+                if number not in parts or parts[number].size != session.part_length(number)
+            ]
+            if missing:
+                raise IncompleteUpload(missing)
+            self.backend.complete_multipart(
+                session.staging_name, session.upload_id,
+                [(number, parts[number].etag) for number in range(1, session.part_count + 1)]
+            )
+
+        #a document that is stored compressed is written anew while it is read back, otherwise the staging object
+        #is copied once (to its blob if the storage is content addressed)
+        writer = None
+        if self.encoding:
+            writer = self.backend.writer(
+                session.name, session.part_size, session.content_type, encoding=self.encoding, level=self.level
+            )
+        try:
+            try:
+                digest = self._check_document(session, writer)
+                info = writer.commit() if writer is not None else None
+            except BaseException:
+                if writer is not None:
+                    writer.abort()
+                raise
+        except ObjectNotFound:
+            raise SessionNotFound(session.session_id) from None
+        except InvalidDocument:
+            self._remove(session, session.staging_name)
+            raise
+        #a storage error leaves the session as it is, so complete can be repeated
+        if writer is None:
+            #the parts were uploaded before the digest was known, the copy gets it as its metadata
+            info = self.backend.copy(session.staging_name, session.name, {DIGEST_KEY: digest})
+        self._remove(session, session.staging_name)
+        return info, digest
+
+    def _check_document(self, session: UploadSession, writer=None) -> str:
+        """Reads the staged document back to validate and hash it, writing it to writer (if given) on the way."""
+        validator = JsonValidator()
+        sha256 = hashlib.sha256()
+        with self.backend.open(session.staging_name) as stream:
+            for chunk in stream.iter_chunks(READ_CHUNK_SIZE):
+                validator.feed(chunk)
+                sha256.update(chunk)
+                if writer is not None:
+                    writer.write(chunk)
+        validator.close()
+        return sha256.hexdigest()
+
+    def abort(self, session: UploadSession):
+        """Drops the parts and the session."""
+        self._abort_staging(session)
+        self._remove(session)
+
+    def _abort_staging(self, session: UploadSession):
+        try:
+            self.backend.abort_multipart(session.staging_name, session.upload_id)
+        except ObjectNotFound:
+            pass
+
+    def _remove(self, session: UploadSession, *objects: str):
+        #the state goes last, a staged document without a state is removed by expire()
+        for name in (*objects, session.state_name):
+            self._delete(name)
+
+    def _delete(self, name: str):
+        try:
+            self.backend.delete(name)
+        except StorageError as e:
+            logger.warning("Could not remove an object of an upload session", extra={"object": name, "error": str(e)})
+
+    def expire(self) -> int:
+        """
+        Aborts the sessions whose TTL is over and removes staged documents left
+        behind by an interrupted complete. Returns the number of sessions removed.
+        """
+        states = set()
+        documents = set()
+        for info in self.backend.list(SESSION_PREFIX):
+            session_id, _, kind = info.name[len(SESSION_PREFIX):].partition("/")
+            if kind == "session.json":
+                states.add(session_id)
+            elif kind == "document":
+                documents.add(session_id)
+
+        expired = 0
+        for session_id in states:
+            if self._expire(session_id):
+                expired += 1
+        for session_id in documents - states:
+            self._delete(f"{SESSION_PREFIX}{session_id}/document")
+        return expired
+
+    def _expire(self, session_id: str) -> bool:
+        try:
+            session = self._load(session_id)
+        except MalformedSession:
+            #nothing but the objects can be dropped, an unfinished multipart upload of it expires in the storage
+            self._delete(f"{SESSION_PREFIX}{session_id}/document")
+            self._delete(_state_name(session_id))
+            return True
+        except SessionNotFound:
+            #completed or aborted in the meantime
+            return False
+        if session.expires_at > time.time():
+            return False
+        self.abort(session)
+        logger.info("Upload session expired", extra={"session": session_id, "object": session.name})
+        return True
@@ -0,0 +1,694 @@
+"""
+Write-behind mode: writes are acknowledged once they are durable in a local log
+and reach the storage later, so MinIO latency spikes and short outages do not
+stall the uploads.
+
+Every worker process appends its writes to a segment of its own
+(DIRECTORY/segments) and fsyncs them before the write returns; concurrent writes
+of a process share one fsync. Streamed uploads larger than one part are spooled
+to a file of their own (DIRECTORY/spool) that the log record refers to. A write
+then publishes a pointer to its record (DIRECTORY/pending/<hash of the name>),
+so every process of the server finds the pending version of an object and reads
+are served from the log until it is flushed.
+
+One process at a time (the holder of DIRECTORY/flush.lock) flushes the pointers
+to the storage, a batch at a time, and retries the ones that failed. A record
+that is flushed or replaced by a newer write is listed in the ".done" file next
+to its segment; a segment whose records are all done is deleted. When a process
+takes over the flushing it replays the log: records that are neither done nor
+pointed to (their pointer was lost in a crash) are published again.
+
+Writes that bypass the log (copies, e.g. completing an upload session) wait for
+a running flush of the same name and retire its pending version.
+"""
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from storage import DIGEST_KEY, ContentAddressedBackend, MultipartWriter, ObjectInfo, ObjectNotFound, \
+    ObjectStream, StorageBackend, StorageError
+
+logger = logging.getLogger("pcf_registry.write_behind")
+
+#record header: magic, CRC-32 of the JSON header and of the payload, length of the JSON header and of the payload
+_RECORD = struct.Struct(">4sIIIQ")
+_MAGIC = b"PCFW"
+#entries of a .done file: payload offset of a record that needs no flush anymore
+_DONE = struct.Struct(">Q")
+#pointers are replaced and names flushed under one of this many file locks
+_LOCK_STRIPES = 256
+#spool files of streamed uploads that never got a log record (the upload failed or the process died) are removed after this
+SPOOL_MAX_AGE_SECONDS = 24 * 3600
+_READ_CHUNK_SIZE = 1024 * 1024
+
+
+class PendingWrite(NamedTuple):
+    """A write that is in the log but not (yet) in the storage, as its pointer file describes it."""
+    name: str
+    seq: int
+    #"put" or "delete"
+    op: str
+    #the segment (file name) holding the record and the position of its payload there, which identifies the record
+    segment: str
+    offset: int
+    #spool file of a streamed upload (the payload is empty then) and the part size it was written with
+    spool: str = ""
+    part_size: int = 0
+    #stored size, ETag, content type and metadata of the object
+    size: int = 0
+    etag: str = ""
+    content_type: str = "application/json"
+    metadata: dict = {}
+    #SHA-256 of the document, handed to a content addressed storage when a spooled upload is flushed
+    digest: str = ""
+    created_at: float = 0.0
+
+    def info(self) -> ObjectInfo:
+        return ObjectInfo(
+            self.name, self.size, self.etag, self.content_type, dict(self.metadata),
+            datetime.fromtimestamp(self.created_at, tz=timezone.utc)
+        )
+
+
+class FlushResult(NamedTuple):
+    flushed: int
+    failed: int
+    #writes still waiting and the age of the oldest one, in seconds
+    pending: int
+    oldest_seconds: float
+
+
+def multipart_etag(part_etags: List[str]) -> str:
+    """The ETag S3 gives an object assembled from parts with these (hex MD5) ETags."""
+    return f"{hashlib.md5(b''.join(bytes.fromhex(etag) for etag in part_etags)).hexdigest()}-{len(part_etags)}"
+
+
+def _fsync_directory(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _pwrite_all(fd: int, data, offset: int):
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+
+
+class _Segment:
+    """The segment a process appends to; its shared flock tells the flusher that it is in use."""
+
+    def __init__(self, directory: str):
+        self.name = f"{time.time_ns():020d}-{os.getpid()}.log"
+        self.path = os.path.join(directory, self.name)
+        self.fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        fcntl.flock(self.fd, fcntl.LOCK_SH)
+        self.size = 0
+        _fsync_directory(directory)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class WriteBehindBackend(StorageBackend):
+    """
+    Wraps a backend so that put, delete and streamed uploads go through the log.
+
+    Arguments:
+        inner: the storage the log is flushed to
+        directory: the log (local disk, it must survive restarts of the server)
+        segment_bytes: a process starts a new segment once its current one is this large
+        passthrough: names that are always written to the storage directly (e.g. upload session state
+                     that other replicas read)
+    """
+
+    def __init__(self, inner: StorageBackend, directory: str, segment_bytes: int = 64 * 1024 * 1024,
+                 passthrough: Callable[[str], bool] = lambda name: False):
+        self.inner = inner
+        self.name = f"{inner.name} (write-behind)"
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.passthrough = passthrough
+        self._segments = os.path.join(directory, "segments")
+        self._pending = os.path.join(directory, "pending")
+        self._spool = os.path.join(directory, "spool")
+        self._locks = os.path.join(directory, "locks")
+        for path in (self._segments, self._pending, self._spool, self._locks):
+            os.makedirs(path, exist_ok=True)
+
+        self._segment: Optional[_Segment] = None
+        self._append_lock = threading.Lock()
+        #group commit: records appended and records known to be on disk, counted over all segments of the process
+        self._sync_lock = threading.Lock()
+        self._appended = 0
+        self._synced = 0
+        self._seq_lock = threading.Lock()
+        self._last_seq = 0
+        self._flusher_fd = None
+        self._flush_pool = None
+        #payload offsets of the records of segments that are no longer appended to, read once
+        self._segment_records: Dict[str, List[int]] = {}
+
+    # ---------------- the log ----------------
+
+    def _next_seq(self) -> int:
+        #wall clock nanoseconds, so the writes of different processes are ordered as well
+        with self._seq_lock:
+            self._last_seq = max(self._last_seq + 1, time.time_ns())
+            return self._last_seq
+
+    def _append(self, header: dict, payload=b"") -> Tuple[str, int]:
+        """Appends a record, returns the segment and the offset of the payload once the record is on disk."""
+        header_bytes = json.dumps(header, separators=(",", ":")).encode()
+        record = _RECORD.pack(_MAGIC, zlib.crc32(header_bytes), zlib.crc32(payload), len(header_bytes), len(payload))
+        try:
+            with self._append_lock:
+                if self._segment is None or self._segment.size >= self.segment_bytes:
+                    self._roll()
+                segment = self._segment
+                offset = segment.size + _RECORD.size + len(header_bytes)
+                try:
+                    written = os.writev(segment.fd, [record, header_bytes, payload])
+                except OSError:
+                    written = -1
+                if written != offset - segment.size + len(payload):
+                    #a record cut short hides the records after it from a replay, so the next one starts a new segment
+                    segment.size = self.segment_bytes
+                    raise OSError("the record was not written completely (disk full?)")
+                segment.size = offset + len(payload)
+                self._appended += 1
+                ticket = self._appended
+            self._sync(ticket)
+        except OSError as e:
+            raise StorageError(f"Could not write to the write-behind log: {e}") from e
+        return segment.name, offset
+
+    def _roll(self):
+        """Starts a new segment (called with the append lock held)."""
+        with self._sync_lock:
+            if self._segment is not None:
+                os.fdatasync(self._segment.fd)
+                self._synced = self._appended
+                self._segment.close()
+            self._segment = _Segment(self._segments)
+
+    def _sync(self, ticket: int):
+        """Waits until record ticket is on disk; one fdatasync covers every record appended before it started."""
+        with self._sync_lock:
+            if self._synced >= ticket:
+                return
+            appended = self._appended
+            os.fdatasync(self._segment.fd)
+            self._synced = appended
+
+    def _mark_done(self, write: PendingWrite, sync: bool = False):
+        """Records that write needs no flush anymore (flushed, replaced or retired)."""
+        fd = os.open(os.path.join(self._segments, write.segment[:-len(".log")] + ".done"),
+                     os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, _DONE.pack(write.offset))
+            if sync:
+                os.fdatasync(fd)
+        finally:
+            os.close(fd)
+
+    def _done_offsets(self, segment: str) -> set:
+        try:
+            with open(os.path.join(self._segments, segment[:-len(".log")] + ".done"), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return set()
+        return {offset for (offset,) in _DONE.iter_unpack(data[:len(data) - len(data) % _DONE.size])}
+
+    def _read_records(self, segment: str) -> Iterator[Tuple[dict, int, int, int]]:
+        """(header, payload offset, payload length, payload CRC) of the complete records of a segment."""
+        with open(os.path.join(self._segments, segment), "rb") as f:
+            position = 0
+            while True:
+                fixed = f.read(_RECORD.size)
+                if len(fixed) < _RECORD.size:
+                    return
+                magic, header_crc, payload_crc, header_length, payload_length = _RECORD.unpack(fixed)
+                header_bytes = f.read(header_length)
+                if magic != _MAGIC or len(header_bytes) < header_length or zlib.crc32(header_bytes) != header_crc:
+                    #the end of a segment that was cut off in a crash
+                    return
+                offset = position + _RECORD.size + header_length
+                yield json.loads(header_bytes), offset, payload_length, payload_crc
+                position = offset + payload_length
+                f.seek(position)
+
+    @staticmethod
+    def _write_from(header: dict, segment: str, offset: int) -> PendingWrite:
+        fields = {key: value for key, value in header.items() if key in PendingWrite._fields}
+        return PendingWrite(segment=segment, offset=offset, **fields)
+
+    # ---------------- pointers ----------------
+
+    def _pointer_path(self, name: str) -> str:
+        return os.path.join(self._pending, hashlib.sha256(name.encode()).hexdigest())
+
+    @staticmethod
+    def _load_pointer(path: str) -> Optional[PendingWrite]:
+        try:
+            with open(path, "rb") as f:
+                return PendingWrite(**json.loads(f.read()))
+        except FileNotFoundError:
+            return None
+
+    def pending(self, name: str) -> Optional[PendingWrite]:
+        """The write of name that waits for the flush, None if the storage is up to date."""
+        write = self._load_pointer(self._pointer_path(name))
+        return write if write is not None and write.name == name else None
+
+    def pending_writes(self) -> Iterator[PendingWrite]:
+        for entry in os.scandir(self._pending):
+            if not entry.name.endswith(".tmp"):
+                write = self._load_pointer(entry.path)
+                if write is not None:
+                    yield write
+
+    @contextmanager
+    def _name_lock(self, name: str, kind: str):
+        """An exclusive file lock (between processes and threads) for one of _LOCK_STRIPES groups of names."""
+        stripe = int(hashlib.sha256(name.encode()).hexdigest()[:8], 16) % _LOCK_STRIPES
+        fd = os.open(os.path.join(self._locks, f"{kind}-{stripe}"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def _publish(self, write: PendingWrite) -> bool:
+        """Makes write the pending version of its name, unless a newer write was published in the meantime."""
+        path = self._pointer_path(write.name)
+        with self._name_lock(write.name, "publish"):
+            current = self._load_pointer(path)
+            if current is not None and current.seq >= write.seq:
+                #a newer write won, or write is published already (a replay may get to it before its writer does)
+                if current.seq > write.seq:
+                    self._retire(write)
+                return current.seq == write.seq
+            temporary = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+            with open(temporary, "wb") as f:
+                f.write(json.dumps(write._asdict()).encode())
+            os.replace(temporary, path)
+            if current is not None:
+                self._retire(current)
+        return True
+
+    def _retire(self, write: PendingWrite, sync: bool = False):
+        self._mark_done(write, sync)
+        if write.spool:
+            self._remove(os.path.join(self._spool, write.spool))
+
+    def _unpublish(self, write: PendingWrite, sync: bool = False) -> bool:
+        """Retires write and removes its pointer, unless a newer write replaced it."""
+        path = self._pointer_path(write.name)
+        with self._name_lock(write.name, "publish"):
+            current = self._load_pointer(path)
+            if current is None or current.seq != write.seq:
+                return False
+            #done first: a crash before the pointer is gone only means the write is flushed again
+            self._mark_done(write, sync)
+            os.remove(path)
+        if write.spool:
+            self._remove(os.path.join(self._spool, write.spool))
+        return True
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    # ---------------- writes ----------------
+
+    def put(self, name, data, content_type="application/json", metadata=None):
+        if self.passthrough(name):
+            return self.inner.put(name, data, content_type, metadata)
+        header = {
+            "name": name, "seq": self._next_seq(), "op": "put", "size": len(data),
+            #the ETag MinIO gives a single PUT, so readers see the same one before and after the flush
+            "etag": hashlib.md5(data).hexdigest(), "content_type": content_type,
+            "metadata": dict(metadata or {}), "created_at": time.time(),
+        }
+        segment, offset = self._append(header, data)
+        write = self._write_from(header, segment, offset)
+        self._publish(write)
+        return write.info()
+
+    def delete(self, name):
+        if self.passthrough(name):
+            self.inner.delete(name)
+            return
+        header = {"name": name, "seq": self._next_seq(), "op": "delete", "created_at": time.time()}
+        segment, offset = self._append(header)
+        self._publish(self._write_from(header, segment, offset))
+
+    def copy(self, source, target, metadata=None):
+        if self.passthrough(target):
+            return self.inner.copy(source, target, metadata)
+        write = None if self.passthrough(source) else self.pending(source)
+        if write is not None:
+            if write.op == "delete":
+                raise ObjectNotFound(f"Object '{source}' does not exist")
+            _, data = self.read_all(source)
+            return self.put(target, data, write.content_type, write.metadata if metadata is None else metadata)
+        #the copy goes straight to the storage: no flush of an older version of target may run at the same time
+        with self._name_lock(target, "flush"):
+            info = self.inner.copy(source, target, metadata)
+            replaced = self.pending(target)
+            if replaced is not None:
+                self._unpublish(replaced, sync=True)
+        return info
+
+    def writer(self, name, part_size, content_type="application/json", metadata=None, encoding="", level=-1):
+        if self.passthrough(name):
+            return self.inner.writer(name, part_size, content_type, metadata, encoding, level)
+        return WriteBehindWriter(self, name, part_size, content_type, metadata, encoding, level)
+
+    def _spool_path(self, spool: str) -> str:
+        return os.path.join(self._spool, spool)
+
+    def _commit_spool(self, name: str, spool: str, part_size: int, size: int, etag: str, content_type: str,
+                      metadata: dict, digest: str) -> ObjectInfo:
+        header = {
+            "name": name, "seq": self._next_seq(), "op": "put", "spool": spool, "part_size": part_size,
+            "size": size, "etag": etag, "content_type": content_type, "metadata": metadata, "digest": digest,
+            "created_at": time.time(),
+        }
+        _fsync_directory(self._spool)
+        segment, offset = self._append(header)
+        write = self._write_from(header, segment, offset)
+        self._publish(write)
+        return write.info()
+
+    # ---------------- reads ----------------
+
+    def open(self, name, offset=0, length=None):
+        if not self.passthrough(name):
+            for _ in range(3):
+                write = self.pending(name)
+                if write is None:
+                    break
+                if write.op == "delete":
+                    raise ObjectNotFound(f"Object '{name}' does not exist")
+                try:
+                    return self._open_pending(write, offset, length)
+                except FileNotFoundError:
+                    #flushed in the meantime, its segment or spool file is gone
+                    continue
+        return self.inner.open(name, offset, length)
+
+    def _open_pending(self, write: PendingWrite, offset: int, length: Optional[int]) -> ObjectStream:
+        if write.spool:
+            fd = os.open(self._spool_path(write.spool), os.O_RDONLY)
+            base = 0
+        else:
+            fd = os.open(os.path.join(self._segments, write.segment), os.O_RDONLY)
+            base = write.offset
+        end = write.size if length is None else min(write.size, offset + length)
+        position = [min(offset, end)]
+
+        def read(size):
+            start = position[0]
+            stop = min(end, start + size)
+            position[0] = stop
+            return os.pread(fd, stop - start, base + start) if stop > start else b""
+
+        return ObjectStream(write.info(), end - position[0], read, lambda: os.close(fd))
+
+    def stat(self, name):
+        write = None if self.passthrough(name) else self.pending(name)
+        if write is None:
+            return self.inner.stat(name)
+        if write.op == "delete":
+            raise ObjectNotFound(f"Object '{name}' does not exist")
+        return write.info()
+
+    def list(self, prefix=""):
+        """The storage listing with the pending writes applied (pending new objects come last)."""
+        pending = {write.name: write for write in self.pending_writes() if write.name.startswith(prefix)}
+        for info in self.inner.list(prefix):
+            write = pending.pop(info.name, None)
+            if write is None:
+                yield info
+            elif write.op == "put":
+                yield write.info()
+        for name in sorted(pending):
+            if pending[name].op == "put":
+                yield pending[name].info()
+
+    def ensure_ready(self):
+        self.inner.ensure_ready()
+
+    # multipart uploads (upload sessions) go to the storage directly
+
+    def create_multipart(self, name, content_type="application/json", metadata=None):
+        return self.inner.create_multipart(name, content_type, metadata)
+
+    def upload_part(self, name, upload_id, part_number, data):
+        return self.inner.upload_part(name, upload_id, part_number, data)
+
+    def complete_multipart(self, name, upload_id, parts):
+        return self.inner.complete_multipart(name, upload_id, parts)
+
+    def abort_multipart(self, name, upload_id):
+        self.inner.abort_multipart(name, upload_id)
+
+    def list_parts(self, name, upload_id):
+        return self.inner.list_parts(name, upload_id)
+
+    # ---------------- flushing ----------------
+
+    def claim_flusher(self) -> bool:
+        """
+        Whether this process flushes the log. The process that gets the flush lock
+        keeps it until it exits, and replays the log when it gets it.
+        """
+        if self._flusher_fd is not None:
+            return True
+        fd = os.open(os.path.join(self.directory, "flush.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._flusher_fd = fd
+        self.replay()
+        return True
+
+    def replay(self) -> int:
+        """
+        Publishes the records of the log that are neither done nor pointed to (after
+        a crash) and returns their number. The newest record of a name wins.
+        """
+        latest = {}
+        stale = []
+        for segment in sorted(os.listdir(self._segments)):
+            if not segment.endswith(".log"):
+                continue
+            done = self._done_offsets(segment)
+            for header, offset, length, crc in self._read_records(segment):
+                if offset in done:
+                    continue
+                write = self._write_from(header, segment, offset)
+                previous = latest.get(write.name)
+                if previous is not None and previous[0].seq > write.seq:
+                    stale.append(write)
+                    continue
+                if previous is not None:
+                    stale.append(previous[0])
+                latest[write.name] = (write, length, crc)
+
+        for write in stale:
+            current = self.pending(write.name)
+            #still pointed to while the newer write waits to be published by its (live) writer
+            if current is None or current.seq != write.seq:
+                self._retire(write)
+        replayed = 0
+        for write, length, crc in latest.values():
+            current = self.pending(write.name)
+            if current is not None and current.seq >= write.seq:
+                continue
+            if not self._intact(write, length, crc):
+                logger.error("Dropping a damaged write-behind record", extra={"object": write.name, "segment": write.segment})
+                self._retire(write)
+                continue
+            if self._publish(write):
+                replayed += 1
+        if replayed:
+            logger.info("Write-behind log replayed", extra={"writes": replayed})
+        return replayed
+
+    def _intact(self, write: PendingWrite, length: int, crc: int) -> bool:
+        if write.spool:
+            return os.path.exists(self._spool_path(write.spool))
+        with open(os.path.join(self._segments, write.segment), "rb") as f:
+            f.seek(write.offset)
+            data = f.read(length)
+        return len(data) == length and zlib.crc32(data) == crc
+
+    def flush(self, limit: int, workers: int) -> FlushResult:
+        """
+        Writes up to limit pending writes (the oldest first) to the storage, workers
+        at a time, and deletes the segments that are no longer needed. Writes that
+        fail stay pending for the next call.
+        """
+        writes = sorted(self.pending_writes(), key=lambda write: write.seq)
+        if self._flush_pool is None:
+            self._flush_pool = ThreadPoolExecutor(workers, thread_name_prefix="write-behind-flush")
+        results = list(self._flush_pool.map(self._flush_one, writes[:limit]))
+        remaining = list(self.pending_writes())
+        self._collect_garbage(remaining)
+        oldest = (time.time_ns() - min(write.seq for write in remaining)) / 1e9 if remaining else 0.0
+        return FlushResult(results.count(True), results.count(False), len(remaining), oldest)
+
+    def _flush_one(self, write: PendingWrite) -> bool:
+        with self._name_lock(write.name, "flush"):
+            #the newest version, a copy or another flush may have changed it since it was listed
+            write = self.pending(write.name)
+            if write is None:
+                return True
+            try:
+                self._apply(write)
+            except (StorageError, OSError) as e:
+                logger.warning("Could not flush a write", extra={"object": write.name, "error": str(e)})
+                return False
+            self._unpublish(write)
+        return True
+
+    def _apply(self, write: PendingWrite):
+        if write.op == "delete":
+            self.inner.delete(write.name)
+            return
+        if not write.spool:
+            with self._open_pending(write, 0, None) as stream:
+                data = stream.read(write.size)
+            self.inner.put(write.name, data, write.content_type, write.metadata)
+            return
+
+        #a spooled upload goes to the storage in the parts it was received in, its metadata is complete from the start
+        metadata = {DIGEST_KEY: write.digest, **write.metadata} if write.digest else write.metadata
+        fd = os.open(self._spool_path(write.spool), os.O_RDONLY)
+        upload_id = None
+        try:
+            upload_id = self.inner.create_multipart(write.name, write.content_type, metadata)
+            etags = []
+            for number, offset in enumerate(range(0, write.size, write.part_size), start=1):
+                data = os.pread(fd, min(write.part_size, write.size - offset), offset)
+                etags.append((number, self.inner.upload_part(write.name, upload_id, number, data)))
+            if isinstance(self.inner, ContentAddressedBackend):
+                self.inner.complete_multipart(write.name, upload_id, etags, metadata=metadata if write.digest else None)
+            else:
+                self.inner.complete_multipart(write.name, upload_id, etags)
+        except BaseException:
+            if upload_id is not None:
+                try:
+                    self.inner.abort_multipart(write.name, upload_id)
+                except StorageError:
+                    pass
+            raise
+        finally:
+            os.close(fd)
+
+    def _collect_garbage(self, pending: List[PendingWrite]):
+        """Deletes the segments of other (or former) appenders whose records are all done, and stale spool files."""
+        active = self._segment.name if self._segment is not None else None
+        for segment in os.listdir(self._segments):
+            if not segment.endswith(".log") or segment == active:
+                continue
+            if self._in_use(segment):
+                continue
+            records = self._segment_records.get(segment)
+            if records is None:
+                records = [offset for _, offset, _, _ in self._read_records(segment)]
+                self._segment_records[segment] = records
+            if set(records) <= self._done_offsets(segment):
+                self._remove(os.path.join(self._segments, segment[:-len(".log")] + ".done"))
+                self._remove(os.path.join(self._segments, segment))
+                self._segment_records.pop(segment, None)
+
+        referenced = {write.spool for write in pending if write.spool}
+        for entry in os.scandir(self._spool):
+            if entry.name not in referenced and time.time() - entry.stat().st_mtime > SPOOL_MAX_AGE_SECONDS:
+                self._remove(entry.path)
+
+    def _in_use(self, segment: str) -> bool:
+        """Whether a process still appends to segment (it holds a shared flock on it)."""
+        try:
+            fd = os.open(os.path.join(self._segments, segment), os.O_RDONLY)
+        except FileNotFoundError:
+            return False
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        finally:
+            os.close(fd)
+        return False
+
+
+class WriteBehindWriter(MultipartWriter):
+    """
+    MultipartWriter that spools the parts of a large upload to a local file (at
+    their final positions, so they may arrive in parallel) and commits it to the
+    log. Uploads that fit into one part end up in backend.put as usual.
+    """
+
+    def start(self):
+        self.upload_id = uuid.uuid4().hex
+        try:
+            self._fd = os.open(self.backend._spool_path(self.upload_id), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except OSError as e:
+            raise StorageError(f"Could not spool the upload: {e}") from e
+        self._stored = 0
+
+    def upload_part(self, part_number: int, data: bytes):
+        offset = (part_number - 1) * self.part_size
+        try:
+            _pwrite_all(self._fd, data, offset)
+        except OSError as e:
+            raise StorageError(f"Could not spool the upload: {e}") from e
+        self._etags[part_number] = hashlib.md5(data).hexdigest()
+        self._stored = max(self._stored, offset + len(data))
+
+    def _complete(self) -> ObjectInfo:
+        try:
+            os.fsync(self._fd)
+        except OSError as e:
+            raise StorageError(f"Could not spool the upload: {e}") from e
+        finally:
+            os.close(self._fd)
+            self._fd = None
+        etag = multipart_etag([self._etags[number] for number in sorted(self._etags)])
+        return self.backend._commit_spool(
+            self.object_name, self.upload_id, self.part_size, self._stored, etag,
+            self.content_type, self.final_metadata(), self.digest
+        )
+
+    def abort(self):
+        self._buffer = bytearray()
+        if self.upload_id is None:
+            return
+        if getattr(self, "_fd", None) is not None:
+            os.close(self._fd)
+            self._fd = None
+        self.backend._remove(self.backend._spool_path(self.upload_id))